@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class CallboardConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'callboard'
+
+    def ready(self):
+        import callboard.signals  # noqa: F401
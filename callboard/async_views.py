@@ -0,0 +1,208 @@
+"""
+Асинхронные варианты представлений чтения для запуска под ASGI.
+
+Ответы совпадают с синхронными AdListAPIView, AdRetrieveAPIView и
+FeedbackListAPIView, но запросы к базе и кешу выполняются через асинхронные
+API Django без перехода в пул потоков на весь запрос. Курсорная пагинация
+переиспользует синхронный KeysetPagination через sync_to_async.
+"""
+import asyncio
+import time
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.core.paginator import InvalidPage, Paginator
+from django.http import Http404, HttpResponse
+from django.views import View
+from django_filters.rest_framework import DjangoFilterBackend
+from rest_framework import status
+from rest_framework.exceptions import APIException, NotAuthenticated, NotFound
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+from callboard.cache import ad_detail_cache, aget_generation, etag_matches, feedback_cache, list_cache_key, make_etag
+from callboard.filters import AdFilterSet, AdSearchFilter
+from callboard.models import Ad, Feedback
+from callboard.paginators import OptionalCursorPagination
+from callboard.renderers import ORJSONRenderer
+from callboard.serializers import AdSerializer, values_mapper
+from config.routers import pinned_to_primary, primary_reads, replica_reads
+from users.authentication import StatelessJWTAuthentication
+
+
+async def authenticate(request):
+    """
+    Пользователь запроса по классам аутентификации из настроек DRF.
+
+    Классы с методом aauthenticate (StatelessJWTAuthentication) проверяют
+    токен в event loop, остальные выполняются через sync_to_async.
+    """
+    for authentication_class in api_settings.DEFAULT_AUTHENTICATION_CLASSES:
+        authenticator = authentication_class()
+        if hasattr(authenticator, 'aauthenticate'):
+            result = await authenticator.aauthenticate(request)
+        else:
+            result = await sync_to_async(authenticator.authenticate)(request)
+        if result is not None:
+            return result[0], authenticator
+    return None, None
+
+
+class AsyncAPIView(View):
+    """Базовое асинхронное представление с ответами в формате DRF"""
+
+    authentication_required = True
+    renderer = ORJSONRenderer()
+
+    def render(self, data, status_code=status.HTTP_200_OK, headers=None):
+        response = HttpResponse(self.renderer.render(data), status=status_code, content_type='application/json')
+        for name, value in (headers or {}).items():
+            response[name] = value
+        return response
+
+    def error(self, exc, headers=None):
+        data = exc.detail if isinstance(exc.detail, (list, dict)) else {'detail': exc.detail}
+        return self.render(data, exc.status_code, headers)
+
+    async def dispatch(self, request, *args, **kwargs):
+        # Параметры запроса и абсолютные ссылки в том же виде, что у DRF
+        self.drf_request = Request(request)
+        with replica_reads(request):
+            try:
+                if self.authentication_required:
+                    user, authenticator = await authenticate(request)
+                    if user is None:
+                        header = StatelessJWTAuthentication().authenticate_header(request)
+                        return self.error(NotAuthenticated(), {'WWW-Authenticate': header})
+                    request.user = user
+                return await super().dispatch(request, *args, **kwargs)
+            except APIException as exc:
+                headers = {}
+                if exc.status_code == status.HTTP_401_UNAUTHORIZED:
+                    headers['WWW-Authenticate'] = StatelessJWTAuthentication().authenticate_header(request)
+                return self.error(exc, headers)
+            except Http404 as exc:
+                return self.error(NotFound(str(exc) or None))
+
+
+class AsyncPaginationMixin:
+    """Постраничная пагинация CustomPagination с асинхронным COUNT и чтением страницы"""
+
+    pagination_class = OptionalCursorPagination
+
+    async def paginate(self, queryset):
+        """Строки страницы и функция, собирающая ответ из данных страницы"""
+        paginator = self.pagination_class()
+        if paginator.use_cursor(self.drf_request):
+            rows = await sync_to_async(paginator.paginate_queryset)(queryset, self.drf_request, self)
+            return rows, lambda data: paginator.get_paginated_response(data).data
+
+        page_size = paginator.get_page_size(self.drf_request)
+        page_number = self.drf_request.query_params.get(paginator.page_query_param) or 1
+        # Paginator считает страницы по count, поэтому вместо запроса передается число строк
+        count = await queryset.acount()
+        django_paginator = Paginator(range(count), page_size)
+        if page_number in paginator.last_page_strings:
+            page_number = django_paginator.num_pages
+        try:
+            page = django_paginator.page(page_number)
+        except InvalidPage as exc:
+            raise NotFound(paginator.invalid_page_message.format(page_number=page_number, message=str(exc)))
+
+        start = (page.number - 1) * page_size
+        rows = [row async for row in queryset[start:start + page_size]]
+        url = self.drf_request.build_absolute_uri()
+
+        next_link = None
+        if page.has_next():
+            next_link = replace_query_param(url, paginator.page_query_param, page.next_page_number())
+        previous_link = None
+        if page.has_previous():
+            previous_number = page.previous_page_number()
+            if previous_number == 1:
+                previous_link = remove_query_param(url, paginator.page_query_param)
+            else:
+                previous_link = replace_query_param(url, paginator.page_query_param, previous_number)
+
+        return rows, lambda data: {'count': count, 'next': next_link, 'previous': previous_link, 'results': data}
+
+
+class AsyncAdListView(AsyncPaginationMixin, AsyncAPIView):
+    """Асинхронный список объявлений с поиском и кешем ответов, как у AdListAPIView"""
+
+    authentication_required = False
+    cache_namespace = 'ads'
+    cache_lock_timeout = 10
+    cache_wait_interval = 0.05
+    serializer_class = AdSerializer
+    filterset_class = AdFilterSet
+    search_fields = ('title', 'description')
+
+    async def get(self, request):
+        timeout = settings.RESPONSE_CACHE_TIMEOUT
+        if not timeout or pinned_to_primary():
+            etag, data = await self.build()
+        else:
+            key = list_cache_key(self.cache_namespace, await aget_generation(self.cache_namespace), request)
+            entry = await cache.aget(key)
+            if entry is None:
+                entry = await self.fill_cache(key, timeout)
+            etag, data = entry
+        if etag_matches(etag, request.headers.get('If-None-Match')):
+            response = HttpResponse(status=status.HTTP_304_NOT_MODIFIED)
+            response['ETag'] = etag
+            return response
+        return self.render(data, headers={'ETag': etag})
+
+    async def fill_cache(self, key, timeout):
+        """Пересчет ответа одним запросом из всех, получивших промах"""
+        lock_key = f'{key}:lock'
+        locked = await cache.aadd(lock_key, 1, self.cache_lock_timeout)
+        deadline = time.monotonic() + self.cache_lock_timeout
+        while not locked and time.monotonic() < deadline:
+            await asyncio.sleep(self.cache_wait_interval)
+            entry = await cache.aget(key)
+            if entry is not None:
+                return entry
+            locked = await cache.aadd(lock_key, 1, self.cache_lock_timeout)
+        try:
+            with primary_reads():
+                entry = await self.build()
+            await cache.aset(key, entry, timeout)
+            return entry
+        finally:
+            if locked:
+                await cache.adelete(lock_key)
+
+    async def build(self):
+        mapper = values_mapper(self.serializer_class)
+        queryset = Ad.objects.all()
+        for backend in (AdSearchFilter, DjangoFilterBackend):
+            queryset = backend().filter_queryset(self.drf_request, queryset, self)
+        rows, paginated = await self.paginate(queryset.values(*mapper.columns, 'created_at'))
+        data = paginated(mapper.map(rows))
+        return make_etag(data), data
+
+
+class AsyncAdRetrieveView(AsyncAPIView):
+    """Асинхронный просмотр объявления с отзывами через кеш ad_detail"""
+
+    async def get(self, request, pk):
+        data = await ad_detail_cache.aget(pk)
+        if data is None:
+            raise Http404
+        return self.render(data)
+
+
+class AsyncFeedbackListView(AsyncPaginationMixin, AsyncAPIView):
+    """Асинхронный список отзывов объявления через кеш отзывов"""
+
+    async def get(self, request, pk):
+        if not await Ad.objects.filter(pk=pk).aexists():
+            raise Http404("Указанного объявления не существует.")
+        queryset = Feedback.objects.filter(ad_id=pk).only('pk', 'created_at')
+        objects, paginated = await self.paginate(queryset)
+        data_by_pk = await feedback_cache.aget_many([obj.pk for obj in objects])
+        return self.render(paginated([data_by_pk[obj.pk] for obj in objects if obj.pk in data_by_pk]))
@@ -0,0 +1,277 @@
+"""
+Нагрузочный прогон всех адресов callboard и users через тестовый клиент.
+
+Для каждого адреса измеряются число SQL-запросов, задержка p50/p95 и пик
+выделенной памяти. Отчет сохраняется в JSON и сравнивается с эталонным.
+"""
+import json
+import os
+import re
+import statistics
+import tempfile
+import time
+import tracemalloc
+from contextlib import contextmanager
+from io import BytesIO
+
+from PIL import Image
+
+from django.core import mail
+from django.core.cache import cache
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import connection, transaction
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+from rest_framework.test import APIClient
+
+from callboard import urls as callboard_urls
+from callboard.models import Ad, Feedback
+from users import urls as users_urls
+from users.authentication import UserRefreshToken
+from users.models import User
+
+PASSWORD = 'benchmark-Password-1'
+RESET_LINK_RE = re.compile(r'reset_password_confirm/([^/]+)/([^/]+)/')
+
+
+class Endpoint:
+    """
+    Сценарий одного адреса.
+
+    prepare(context, iteration) выполняется вне замера и возвращает
+    аргументы адреса и тело запроса.
+    """
+
+    def __init__(self, name, method, prepare=None, user='user', format='json'):
+        self.name = name
+        self.method = method
+        self.prepare = prepare or (lambda context, iteration: ((), None))
+        self.user = user
+        self.format = format
+
+
+def _ad(context, iteration):
+    return Ad.objects.create(title=f'Объявление {iteration}', price=iteration, author=context['user'])
+
+
+def _feedback(context, iteration):
+    return Feedback.objects.create(text=f'Отзыв {iteration}', ad=context['ad'], author=context['user'])
+
+
+def _image(context, iteration):
+    buffer = BytesIO()
+    Image.new('RGB', (64, 64), (iteration % 256, 0, 0)).save(buffer, 'PNG')
+    return (context['ad'].pk,), {'image': SimpleUploadedFile('image.png', buffer.getvalue(), 'image/png')}
+
+
+def _reset_link(context, iteration):
+    mail.outbox = []
+    # Письмо ставится в очередь после коммита, а прогон идет внутри транзакции
+    with TestCase.captureOnCommitCallbacks(execute=True):
+        APIClient().post(reverse('users:password_reset'), {'email': context['user'].email}, format='json')
+    return RESET_LINK_RE.search(mail.outbox[-1].body).groups(), {'new_password': PASSWORD}
+
+
+ENDPOINTS = (
+    Endpoint('callboard:ad_list', 'get', user=None),
+    Endpoint('callboard:ad_facets', 'get', lambda c, i: ((), {'price_min': i}), user=None),
+    Endpoint('callboard:ad_create', 'post', lambda c, i: ((), {'title': f'Новое {i}', 'price': i})),
+    Endpoint('callboard:ad_bulk', 'post', lambda c, i: ((), [{'title': f'Пачка {i} {n}'} for n in range(10)])),
+    Endpoint('callboard:ad_export', 'get', lambda c, i: ((), {'author': c['user'].pk})),
+    Endpoint('callboard:ad_mylist', 'get'),
+    Endpoint('callboard:ad_retrieve', 'get', lambda c, i: ((c['ad'].pk,), None)),
+    Endpoint('callboard:ad_update', 'patch', lambda c, i: ((c['ad'].pk,), {'price': i})),
+    Endpoint('callboard:ad_delete', 'delete', lambda c, i: ((_ad(c, i).pk,), None)),
+    Endpoint('callboard:ad_image_create', 'post', _image, format='multipart'),
+    Endpoint('callboard:feedback_list', 'get', lambda c, i: ((c['ad'].pk,), None)),
+    Endpoint('callboard:feedback_create', 'post', lambda c, i: ((c['ad'].pk,), {'text': f'Отзыв {i}'})),
+    Endpoint('callboard:feedback_export', 'get', lambda c, i: ((c['ad'].pk,), None)),
+    Endpoint('callboard:feedback_mylist', 'get'),
+    Endpoint('callboard:feedback_retrieve', 'get', lambda c, i: ((c['feedback'].pk,), None)),
+    Endpoint('callboard:feedback_update', 'patch', lambda c, i: ((c['feedback'].pk,), {'text': f'Изменен {i}'})),
+    Endpoint('callboard:feedback_delete', 'delete', lambda c, i: ((_feedback(c, i).pk,), None)),
+    Endpoint('callboard:object_cache_stats', 'get', user='admin'),
+    Endpoint('callboard:metrics', 'get', user='admin'),
+    Endpoint('callboard:author_stats', 'get', lambda c, i: ((c['user'].pk,), None)),
+    Endpoint('callboard:async_ad_list', 'get', user=None),
+    Endpoint('callboard:async_ad_retrieve', 'get', lambda c, i: ((c['ad'].pk,), None)),
+    Endpoint('callboard:async_feedback_list', 'get', lambda c, i: ((c['ad'].pk,), None)),
+    Endpoint('users:register', 'post', lambda c, i: ((), {'email': f'new{i}@example.ru', 'password': PASSWORD}),
+             user=None),
+    Endpoint('users:login', 'post', lambda c, i: ((), {'email': c['user'].email, 'password': PASSWORD}), user=None),
+    Endpoint('users:token_refresh', 'post', lambda c, i: ((), {'refresh': str(UserRefreshToken.for_user(c['user']))}),
+             user=None),
+    Endpoint('users:token_verify', 'post',
+             lambda c, i: ((), {'token': str(UserRefreshToken.for_user(c['user']).access_token)}), user=None),
+    Endpoint('users:password_reset', 'post', lambda c, i: ((), {'email': c['user'].email}), user=None),
+    Endpoint('users:reset_password_confirm', 'post', _reset_link, user=None),
+)
+
+# Адреса, которые не нужно измерять: корень роутера DRF перекрыт списком объявлений
+SKIPPED_URL_NAMES = ('api-root',)
+
+
+def url_names():
+    """Имена всех адресов callboard и users"""
+    names = set()
+    for module in (callboard_urls, users_urls):
+        names.update(
+            f'{module.app_name}:{pattern.name}'
+            for pattern in module.urlpatterns
+            if pattern.name not in SKIPPED_URL_NAMES
+        )
+    return names
+
+
+def environment():
+    """
+    Изолированное окружение прогона.
+
+    Кеш в памяти процесса, чтобы очистка перед каждым запросом не затронула
+    общий кеш, задачи Celery выполняются без брокера, письма не отправляются,
+    загруженные файлы пишутся во временный каталог, тестовый клиент допущен
+    в ALLOWED_HOSTS.
+    """
+    return override_settings(
+        CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'benchmark'}},
+        MEDIA_ROOT=os.path.join(tempfile.gettempdir(), 'callboard-benchmark-media'),
+        CELERY_TASK_ALWAYS_EAGER=True,
+        EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend',
+        ALLOWED_HOSTS=['testserver'],
+    )
+
+
+@contextmanager
+def rolled_back():
+    """Транзакция, которая откатывается при выходе: тестовые данные не остаются в базе"""
+    with transaction.atomic():
+        yield
+        transaction.set_rollback(True)
+
+
+def seed(users=10, ads=100, feedback_per_ad=2):
+    """Тестовые пользователи, объявления и отзывы; возвращает контекст сценариев"""
+    user = User(email='benchmark@example.ru')
+    user.set_password(PASSWORD)
+    user.save()
+    admin = User.objects.create(email='benchmark-admin@example.ru', role='admin')
+    authors = [user] + User.objects.bulk_create(
+        User(email=f'benchmark{i}@example.ru') for i in range(max(users - 1, 0))
+    )
+    ad_objects = Ad.objects.bulk_create(
+        (Ad(title=f'Объявление {i}', description=f'Описание {i}', price=i, author=authors[i % len(authors)])
+         for i in range(ads)),
+        batch_size=1000,
+    )
+    Feedback.objects.bulk_create(
+        (Feedback(text='Отзыв', ad=ad, author=authors[(ad.pk + i) % len(authors)])
+         for ad in ad_objects for i in range(feedback_per_ad)),
+        batch_size=1000,
+    )
+    ad = Ad.objects.create(title='Объявление для просмотра', author=user)
+    return {
+        'user': user,
+        'admin': admin,
+        'ad': ad,
+        'feedback': Feedback.objects.create(text='Отзыв для просмотра', ad=ad, author=user),
+    }
+
+
+def percentile(values, fraction):
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(fraction * (len(ordered) - 1))))]
+
+
+def call(client, endpoint, args, data):
+    response = getattr(client, endpoint.method)(reverse(endpoint.name, args=args), data, format=endpoint.format)
+    if response.streaming:
+        b''.join(response.streaming_content)
+    return response
+
+
+def count_queries(captured):
+    """
+    Число запросов без SAVEPOINT: прогон идет внутри транзакции, и atomic()
+    в коде выполняется точками сохранения, которых нет при обычной работе.
+    """
+    return sum(1 for query in captured if 'SAVEPOINT' not in query['sql'])
+
+
+def measure(endpoint, context, iterations):
+    """Замер одного адреса: iterations запросов на задержку и один под tracemalloc на память"""
+    client = APIClient()
+    if endpoint.user:
+        client.force_authenticate(user=context[endpoint.user])
+        # Асинхронные представления не проходят через DRF и аутентифицируются по заголовку
+        token = UserRefreshToken.for_user(context[endpoint.user]).access_token
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {token}')
+
+    timings, queries, statuses = [], [], set()
+    for iteration in range(iterations + 1):
+        cache.clear()
+        args, data = endpoint.prepare(context, iteration)
+        if iteration == iterations:
+            tracemalloc.start()
+            call(client, endpoint, args, data)
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            break
+        with CaptureQueriesContext(connection) as captured:
+            started = time.perf_counter()
+            response = call(client, endpoint, args, data)
+            timings.append((time.perf_counter() - started) * 1000)
+        queries.append(count_queries(captured))
+        statuses.add(response.status_code)
+
+    return {
+        'method': endpoint.method.upper(),
+        'status': sorted(statuses),
+        'queries': max(queries),
+        'p50_ms': round(statistics.median(timings), 3),
+        'p95_ms': round(percentile(timings, 0.95), 3),
+        'memory_kb': round(peak / 1024, 1),
+    }
+
+
+def run(iterations=20, users=10, ads=100, feedback_per_ad=2, endpoints=ENDPOINTS):
+    """Прогон всех сценариев; вызывающий код отвечает за откат данных"""
+    context = seed(users, ads, feedback_per_ad)
+    return {
+        'meta': {'iterations': iterations, 'users': users, 'ads': ads, 'feedback_per_ad': feedback_per_ad,
+                 'database': connection.vendor},
+        'endpoints': {endpoint.name: measure(endpoint, context, iterations) for endpoint in endpoints},
+    }
+
+
+def compare(report, baseline, latency_tolerance=0.25, memory_tolerance=0.25):
+    """
+    Список регрессий отчета относительно эталона.
+
+    Число запросов должно не превышать эталонное, задержка p95 и память -
+    не более чем на заданную долю. None отключает сравнение метрики.
+    """
+    regressions = []
+    for name, expected in baseline['endpoints'].items():
+        actual = report['endpoints'].get(name)
+        if actual is None:
+            regressions.append(f'{name}: адрес отсутствует в отчете')
+            continue
+        if actual['queries'] > expected['queries']:
+            regressions.append(f"{name}: запросов {actual['queries']} вместо {expected['queries']}")
+        checks = (('p95_ms', latency_tolerance), ('memory_kb', memory_tolerance))
+        for metric, tolerance in checks:
+            if tolerance is not None and actual[metric] > expected[metric] * (1 + tolerance):
+                regressions.append(f'{name}: {metric} {actual[metric]} при эталоне {expected[metric]}')
+    return regressions
+
+
+def load(path):
+    with open(path, encoding='utf-8') as file:
+        return json.load(file)
+
+
+def dump(report, path):
+    with open(path, 'w', encoding='utf-8') as file:
+        json.dump(report, file, ensure_ascii=False, indent=2, sort_keys=True)
+        file.write('\n')
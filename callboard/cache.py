@@ -0,0 +1,320 @@
+import hashlib
+import json
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.http import urlencode
+from django.http import Http404
+from rest_framework import status
+from rest_framework.response import Response
+
+from callboard.serializers import AdDetailSerializer, AdSerializer, FeedbackSerializer, values_mapper
+from config.routers import pinned_to_primary, primary_reads
+
+GENERATION_KEY = 'callboard:generation:{}'
+
+
+def get_generation(namespace):
+    """Текущее поколение данных пространства имен"""
+    key = GENERATION_KEY.format(namespace)
+    generation = cache.get(key)
+    if generation is None:
+        # Начальное значение от времени: после вытеснения ключа из кеша
+        # поколение не повторит одно из прежних
+        cache.add(key, time.time_ns() // 1000, timeout=None)
+        generation = cache.get(key)
+    return generation
+
+
+async def aget_generation(namespace):
+    """Асинхронный вариант get_generation"""
+    key = GENERATION_KEY.format(namespace)
+    generation = await cache.aget(key)
+    if generation is None:
+        await cache.aadd(key, time.time_ns() // 1000, timeout=None)
+        generation = await cache.aget(key)
+    return generation
+
+
+def bump_generation(namespace):
+    """Смена поколения: все закешированные ответы пространства имен устаревают за O(1)"""
+    try:
+        cache.incr(GENERATION_KEY.format(namespace))
+    except ValueError:
+        get_generation(namespace)
+
+
+def invalidate(namespace):
+    """
+    Инвалидация сразу и повторно после коммита транзакции.
+
+    Второй сдвиг нужен, чтобы ответ, пересчитанный другим запросом до коммита
+    по еще старым данным, не остался в кеше под новым поколением.
+    """
+    bump_generation(namespace)
+    transaction.on_commit(lambda: bump_generation(namespace))
+
+
+def make_etag(data):
+    """ETag от содержимого ответа"""
+    payload = json.dumps(data, sort_keys=True, default=str, ensure_ascii=False)
+    return '"{}"'.format(hashlib.md5(payload.encode()).hexdigest())
+
+
+def etag_matches(etag, if_none_match):
+    if not if_none_match:
+        return False
+    candidates = {value.strip().removeprefix('W/') for value in if_none_match.split(',')}
+    return '*' in candidates or etag in candidates
+
+
+def list_cache_key(namespace, generation, request):
+    """Ключ ответа списка: поколение, хост, путь и отсортированные параметры запроса"""
+    params = urlencode(sorted(request.GET.lists()), doseq=True)
+    raw_key = f'{request.get_host()}{request.path}?{params}'
+    digest = hashlib.md5(raw_key.encode()).hexdigest()
+    return f'callboard:list:{namespace}:{generation}:{digest}'
+
+
+class CachedListMixin:
+    """
+    Кеширование ответов списка с инвалидацией по поколению данных.
+
+    Ключ ответа включает поколение cache_namespace, путь и параметры запроса
+    (page, page_size, search и др.), поэтому изменение данных не требует
+    поиска и удаления ключей. При промахе ответ пересчитывает только один
+    запрос, остальные ждут его результата. Поддерживается If-None-Match.
+    Подходит только для ответов, не зависящих от пользователя.
+    Ответ для кеша строится по основной базе, закрепленные за ней запросы
+    кеш не используют.
+    """
+
+    cache_namespace = None
+    cache_lock_timeout = 10
+    cache_wait_interval = 0.05
+
+    def get_cache_timeout(self):
+        return settings.RESPONSE_CACHE_TIMEOUT
+
+    def get_list_cache_key(self, request):
+        return list_cache_key(self.cache_namespace, get_generation(self.cache_namespace), request)
+
+    def list(self, request, *args, **kwargs):
+        timeout = self.get_cache_timeout()
+        if not timeout or pinned_to_primary():
+            return super().list(request, *args, **kwargs)
+
+        key = self.get_list_cache_key(request)
+        entry = cache.get(key)
+        if entry is None:
+            entry = self.fill_list_cache(key, timeout, request, *args, **kwargs)
+
+        etag, data = entry
+        headers = {'ETag': etag}
+        if etag_matches(etag, request.headers.get('If-None-Match')):
+            return Response(status=status.HTTP_304_NOT_MODIFIED, headers=headers)
+        return Response(data, headers=headers)
+
+    def fill_list_cache(self, key, timeout, request, *args, **kwargs):
+        """Пересчет ответа одним запросом из всех, получивших промах"""
+        lock_key = f'{key}:lock'
+        locked = cache.add(lock_key, 1, self.cache_lock_timeout)
+        deadline = time.monotonic() + self.cache_lock_timeout
+        while not locked and time.monotonic() < deadline:
+            time.sleep(self.cache_wait_interval)
+            entry = cache.get(key)
+            if entry is not None:
+                return entry
+            locked = cache.add(lock_key, 1, self.cache_lock_timeout)
+        try:
+            with primary_reads():
+                data = super().list(request, *args, **kwargs).data
+            entry = (make_etag(data), data)
+            cache.set(key, entry, timeout)
+            return entry
+        finally:
+            if locked:
+                cache.delete(lock_key)
+
+
+class ObjectCache:
+    """
+    Read-through кеш сериализованных объектов по модели и pk.
+
+    Хранит результат serializer_class(obj).data, поэтому попадание не требует
+    ни запроса к базе, ни сериализации. С values=True промахи загружаются
+    через ValuesMapper без создания объектов модели. Счетчики попаданий
+    и промахов хранятся в общем кеше и доступны для мониторинга через stats().
+    Промахи загружаются из основной базы, а закрепленные за ней запросы
+    читают объекты из базы мимо кеша.
+    """
+
+    def __init__(self, name, serializer_class, queryset=None, values=False):
+        self.name = name
+        self.serializer_class = serializer_class
+        self._queryset = queryset
+        self.mapper = values_mapper(serializer_class) if values else None
+
+    @property
+    def queryset(self):
+        if self._queryset is not None:
+            return self._queryset.all()
+        return self.serializer_class.Meta.model._default_manager.all()
+
+    @property
+    def timeout(self):
+        return settings.OBJECT_CACHE_TIMEOUT
+
+    @property
+    def namespace(self):
+        return f'object:{self.name}'
+
+    def key(self, pk, generation=None):
+        if generation is None:
+            generation = get_generation(self.namespace)
+        return f'callboard:object:{self.name}:{generation}:{pk}'
+
+    def stats_key(self, counter):
+        return f'callboard:object:{self.name}:stats:{counter}'
+
+    def count(self, hits=0, misses=0):
+        for counter, value in (('hits', hits), ('misses', misses)):
+            if value:
+                key = self.stats_key(counter)
+                cache.add(key, 0, timeout=None)
+                try:
+                    cache.incr(key, value)
+                except ValueError:
+                    pass
+
+    def stats(self):
+        counters = cache.get_many([self.stats_key('hits'), self.stats_key('misses')])
+        return {
+            'hits': counters.get(self.stats_key('hits'), 0),
+            'misses': counters.get(self.stats_key('misses'), 0),
+        }
+
+    def get(self, pk):
+        """Сериализованный объект или None, если его нет в базе"""
+        return self.get_many([pk]).get(pk)
+
+    def get_many(self, pks):
+        """Словарь pk -> данные; недостающие объекты загружаются одним запросом"""
+        if not self.timeout or pinned_to_primary():
+            return self.load(pks)
+        generation = get_generation(self.namespace)
+        keys = {self.key(pk, generation): pk for pk in pks}
+        found = cache.get_many(keys)
+        result = {keys[key]: data for key, data in found.items()}
+        missing = [pk for pk in pks if pk not in result]
+        self.count(hits=len(result), misses=len(missing))
+        if missing:
+            with primary_reads():
+                loaded = self.load(missing)
+            cache.set_many({self.key(pk, generation): data for pk, data in loaded.items()}, self.timeout)
+            result.update(loaded)
+        return result
+
+    def load(self, pks):
+        queryset = self.queryset.filter(pk__in=pks)
+        if self.mapper is not None:
+            rows = queryset.values('pk', *self.mapper.columns)
+            return {row['pk']: self.mapper.to_representation(row) for row in rows}
+        return {obj.pk: self.serializer_class(obj).data for obj in queryset}
+
+    async def acount(self, hits=0, misses=0):
+        for counter, value in (('hits', hits), ('misses', misses)):
+            if value:
+                key = self.stats_key(counter)
+                await cache.aadd(key, 0, timeout=None)
+                try:
+                    await cache.aincr(key, value)
+                except ValueError:
+                    pass
+
+    async def aget(self, pk):
+        """Асинхронный вариант get"""
+        return (await self.aget_many([pk])).get(pk)
+
+    async def aget_many(self, pks):
+        """Асинхронный вариант get_many"""
+        if not self.timeout or pinned_to_primary():
+            return await self.aload(pks)
+        generation = await aget_generation(self.namespace)
+        keys = {self.key(pk, generation): pk for pk in pks}
+        found = await cache.aget_many(keys)
+        result = {keys[key]: data for key, data in found.items()}
+        missing = [pk for pk in pks if pk not in result]
+        await self.acount(hits=len(result), misses=len(missing))
+        if missing:
+            with primary_reads():
+                loaded = await self.aload(missing)
+            await cache.aset_many({self.key(pk, generation): data for pk, data in loaded.items()}, self.timeout)
+            result.update(loaded)
+        return result
+
+    async def aload(self, pks):
+        queryset = self.queryset.filter(pk__in=pks)
+        if self.mapper is not None:
+            rows = queryset.values('pk', *self.mapper.columns)
+            return {row['pk']: self.mapper.to_representation(row) async for row in rows}
+        return {obj.pk: self.serializer_class(obj).data async for obj in queryset}
+
+    def invalidate(self, *pks):
+        """Удаление объектов из кеша сразу и повторно после коммита транзакции"""
+        if pks:
+            generation = get_generation(self.namespace)
+            keys = [self.key(pk, generation) for pk in pks]
+            cache.delete_many(keys)
+            transaction.on_commit(lambda: cache.delete_many(keys))
+
+    def invalidate_all(self):
+        """Сброс всех объектов сменой поколения, без поиска затронутых ключей"""
+        invalidate(self.namespace)
+
+
+class CachedRetrieveMixin:
+    """
+    Получение объекта через ObjectCache.
+
+    Проверки has_object_permission при попадании в кеш не выполняются,
+    поэтому подходит только для представлений без объектных разрешений.
+    """
+
+    object_cache = None
+
+    def retrieve(self, request, *args, **kwargs):
+        pk = self.kwargs[self.lookup_url_kwarg or self.lookup_field]
+        data = self.object_cache.get(pk)
+        if data is None:
+            raise Http404
+        return Response(data)
+
+
+class CachedObjectListMixin:
+    """
+    Список, тела элементов которого берутся из ObjectCache.
+
+    Из базы выбираются только pk и поля сортировки страницы,
+    а недостающие в кеше объекты догружаются одним запросом.
+    """
+
+    object_cache = None
+    list_only_fields = ('pk', 'created_at')
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset()).only(*self.list_only_fields)
+        page = self.paginate_queryset(queryset)
+        objects = page if page is not None else list(queryset)
+        data_by_pk = self.object_cache.get_many([obj.pk for obj in objects])
+        data = [data_by_pk[obj.pk] for obj in objects if obj.pk in data_by_pk]
+        if page is not None:
+            return self.get_paginated_response(data)
+        return Response(data)
+
+
+ad_cache = ObjectCache('ad', AdSerializer, values=True)
+ad_detail_cache = ObjectCache('ad_detail', AdDetailSerializer, AdDetailSerializer.get_queryset())
+feedback_cache = ObjectCache('feedback', FeedbackSerializer, values=True)
@@ -0,0 +1,47 @@
+import csv
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import StreamingHttpResponse
+
+CHUNK_SIZE = 2000
+
+
+class Echo:
+    """Объект с интерфейсом файла, возвращающий записанную строку"""
+
+    def write(self, value):
+        return value
+
+
+def ndjson_rows(fields, rows):
+    encoder = DjangoJSONEncoder(ensure_ascii=False)
+    for row in rows:
+        yield encoder.encode(dict(zip(fields, row))) + '\n'
+
+
+def csv_rows(fields, rows):
+    writer = csv.writer(Echo())
+    yield writer.writerow(fields)
+    for row in rows:
+        yield writer.writerow(row)
+
+
+FORMATS = {
+    'ndjson': ('application/x-ndjson', ndjson_rows),
+    'csv': ('text/csv', csv_rows),
+}
+
+
+def export_response(queryset, fields, output, filename):
+    """
+    Потоковая выгрузка queryset в NDJSON или CSV.
+
+    Строки читаются через values_list(...).iterator(), в PostgreSQL -
+    серверным курсором порциями по CHUNK_SIZE, поэтому расход памяти
+    не зависит от размера таблицы.
+    """
+    content_type, writer = FORMATS[output]
+    rows = queryset.values_list(*fields).iterator(chunk_size=CHUNK_SIZE)
+    response = StreamingHttpResponse(writer(fields, rows), content_type=content_type)
+    response['Content-Disposition'] = f'attachment; filename="{filename}.{output}"'
+    return response
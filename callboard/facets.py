@@ -0,0 +1,74 @@
+"""
+Счетчики фасетов ленты объявлений.
+
+Все счетчики считаются одним агрегирующим запросом с COUNT(...) FILTER
+по уже отфильтрованному queryset. Ценовые диапазоны включают
+отрицательные цены и объявления без цены (диапазон без обеих границ),
+поэтому сумма счетчиков по цене, как и по датам, совпадает с выдачей
+списка с теми же параметрами.
+"""
+from datetime import timedelta
+
+from django.db.models import Count, Q
+from django.utils import timezone
+
+# Границы ценовых диапазонов: (без ограничения, 0), [0, 1000), ..., [100000, без ограничения)
+PRICE_BUCKETS = (0, 1000, 5000, 10000, 50000, 100000)
+
+# Периоды по дате создания, последний период - все более старые объявления
+DATE_BUCKETS = (
+    ('day', timedelta(days=1)),
+    ('week', timedelta(days=7)),
+    ('month', timedelta(days=30)),
+)
+OLDER_BUCKET = 'older'
+
+
+def price_ranges():
+    bounds = (None,) + PRICE_BUCKETS + (None,)
+    return list(zip(bounds, bounds[1:]))
+
+
+def date_ranges(now):
+    """Периоды (название, начало, конец) от новых к старым, None - без ограничения"""
+    ranges, end = [], None
+    for name, age in DATE_BUCKETS:
+        start = now - age
+        ranges.append((name, start, end))
+        end = start
+    ranges.append((OLDER_BUCKET, None, end))
+    return ranges
+
+
+def range_condition(field, start, end):
+    condition = Q()
+    if start is not None:
+        condition &= Q(**{f'{field}__gte': start})
+    if end is not None:
+        condition &= Q(**{f'{field}__lt': end})
+    return condition
+
+
+def get_facets(queryset, now=None):
+    """
+    Общее количество, количество по ценовым диапазонам и по периодам создания.
+
+    Последний ценовой диапазон без границ - объявления без цены.
+    """
+    prices = price_ranges()
+    dates = date_ranges(now or timezone.now())
+    aggregates = {'count': Count('pk'), 'price_null': Count('pk', filter=Q(price__isnull=True))}
+    for i, (low, high) in enumerate(prices):
+        aggregates[f'price_{i}'] = Count('pk', filter=range_condition('price', low, high))
+    for name, start, end in dates:
+        aggregates[f'created_{name}'] = Count('pk', filter=range_condition('created_at', start, end))
+
+    counts = queryset.order_by().aggregate(**aggregates)
+    return {
+        'count': counts['count'],
+        'price': [
+            {'min': low, 'max': high, 'count': counts[f'price_{i}']}
+            for i, (low, high) in enumerate(prices)
+        ] + [{'min': None, 'max': None, 'count': counts['price_null']}],
+        'created_at': [{'period': name, 'count': counts[f'created_{name}']} for name, _, _ in dates],
+    }
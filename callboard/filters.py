@@ -0,0 +1,87 @@
+import django_filters
+from django.db.models import BooleanField, ExpressionWrapper, Value
+from django_filters.constants import EMPTY_VALUES
+from rest_framework.filters import BaseFilterBackend, SearchFilter
+
+from callboard.models import Ad
+from callboard.search import get_search_backend
+from users.permissions import permissions_condition
+
+
+class AdSearchFilter(SearchFilter):
+    """
+    Поиск объявлений по параметру ?search=.
+
+    Термы разбираются как в SearchFilter, а сам поиск выполняет движок,
+    выбранный в settings.SEARCH_BACKEND.
+    """
+
+    def filter_queryset(self, request, queryset, view):
+        search_terms = self.get_search_terms(request)
+        if not search_terms:
+            return queryset
+        return get_search_backend().search(queryset, search_terms)
+
+
+class ObjectPermissionFilter(BaseFilterBackend):
+    """
+    Ограничение queryset объектными разрешениями view.object_permission_classes.
+
+    Разрешения переводятся в условие WHERE, поэтому владение проверяется
+    в SQL, а не для каждого объекта в Python.
+    """
+
+    @staticmethod
+    def get_condition(request, view):
+        permissions = [permission() for permission in view.object_permission_classes]
+        return permissions_condition(permissions, request, view)
+
+    def filter_queryset(self, request, queryset, view):
+        condition = self.get_condition(request, view)
+        if condition is True:
+            return queryset
+        if condition is False:
+            return queryset.none()
+        return queryset.filter(condition)
+
+    @classmethod
+    def annotate(cls, request, queryset, view, name='permitted'):
+        """Объекты с признаком доступа name, вычисленным в том же запросе"""
+        condition = cls.get_condition(request, view)
+        if isinstance(condition, bool):
+            expression = Value(condition)
+        else:
+            expression = ExpressionWrapper(condition, output_field=BooleanField())
+        return queryset.annotate(**{name: expression})
+
+
+class AdOrderingFilter(django_filters.OrderingFilter):
+    """
+    Сортировка по цене или дате с id в том же направлении.
+
+    id делает порядок однозначным для постраничной выдачи, а совпадающее
+    направление позволяет читать индексы (price, id) и (created_at, id)
+    в прямом или обратном порядке без сортировки в памяти.
+    """
+
+    def filter(self, qs, value):
+        if value in EMPTY_VALUES:
+            return qs
+        ordering = [self.get_ordering_value(param) for param in value]
+        tie_breaker = '-id' if ordering[-1].startswith('-') else 'id'
+        return qs.order_by(*ordering, tie_breaker)
+
+
+class AdFilterSet(django_filters.FilterSet):
+    """Фильтры ленты объявлений: цена, автор, период создания и сортировка"""
+
+    price_min = django_filters.NumberFilter(field_name='price', lookup_expr='gte')
+    price_max = django_filters.NumberFilter(field_name='price', lookup_expr='lte')
+    author = django_filters.NumberFilter(field_name='author_id')
+    created_after = django_filters.DateTimeFilter(field_name='created_at', lookup_expr='gte')
+    created_before = django_filters.DateTimeFilter(field_name='created_at', lookup_expr='lt')
+    ordering = AdOrderingFilter(fields=('price', 'created_at'))
+
+    class Meta:
+        model = Ad
+        fields = ('price_min', 'price_max', 'author', 'created_after', 'created_before')
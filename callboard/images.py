@@ -0,0 +1,144 @@
+"""
+Изображения объявлений.
+
+Загрузка пишется во временный файл на диске по частям, SHA-256 считается
+по ходу чтения. Файлы хранятся по адресу содержимого: одинаковые
+изображения занимают одно место в хранилище, а варианты (миниатюра и WebP)
+получают имя от хеша оригинала и размера, поэтому готовый вариант
+повторно не строится. Варианты строит задача Celery, а не запрос.
+"""
+import hashlib
+import logging
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadhandler import SkipFile, TemporaryFileUploadHandler
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+logger = logging.getLogger(__name__)
+
+# Форматы оригиналов и расширения файлов в хранилище
+FORMATS = {'JPEG': '.jpg', 'PNG': '.png', 'WEBP': '.webp', 'GIF': '.gif'}
+
+IMAGE_ERRORS = (UnidentifiedImageError, OSError, Image.DecompressionBombError)
+
+
+class HashingUploadHandler(TemporaryFileUploadHandler):
+    """
+    Запись загружаемого файла во временный файл с подсчетом SHA-256.
+
+    Файл больше AD_IMAGE_MAX_UPLOAD_SIZE пропускается, а too_large
+    сообщает об этом представлению.
+    """
+
+    too_large = False
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.sha256 = hashlib.sha256()
+
+    def receive_data_chunk(self, raw_data, start):
+        if start + len(raw_data) > settings.AD_IMAGE_MAX_UPLOAD_SIZE:
+            self.too_large = True
+            self.file.close()
+            raise SkipFile()
+        self.sha256.update(raw_data)
+        return super().receive_data_chunk(raw_data, start)
+
+    def file_complete(self, file_size):
+        file = super().file_complete(file_size)
+        file.sha256 = self.sha256.hexdigest()
+        return file
+
+
+def file_hash(file):
+    """SHA-256 файла: посчитанный при загрузке или по частям файла"""
+    digest = getattr(file, 'sha256', None)
+    if digest is None:
+        sha256 = hashlib.sha256()
+        for chunk in file.chunks():
+            sha256.update(chunk)
+        digest = sha256.hexdigest()
+        file.seek(0)
+    return digest
+
+
+def image_format(file):
+    """Формат изображения по заголовку файла без декодирования; None для неподдерживаемых"""
+    try:
+        with Image.open(file) as image:
+            image_format = image.format
+    except IMAGE_ERRORS:
+        image_format = None
+    file.seek(0)
+    return image_format if image_format in FORMATS else None
+
+
+def content_name(digest, suffix):
+    return f'ads/{digest[:2]}/{digest[2:4]}/{digest}{suffix}'
+
+
+def store_original(file, digest, image_format):
+    """
+    Сохранение оригинала под именем от хеша содержимого; возвращает имя в хранилище.
+
+    Вызывается под ImageFile.lock(digest), иначе уже сохраненный файл может
+    быть удален до создания ссылающегося на него AdImage.
+    """
+    name = content_name(digest, FORMATS[image_format])
+    if not default_storage.exists(name):
+        # Временный файл загрузки перемещается в хранилище без чтения в память
+        name = default_storage.save(name, file)
+    return name
+
+
+def variant_sizes():
+    """Наибольшая сторона каждого варианта: поле AdImage и размер в пикселях"""
+    return {'thumbnail': settings.AD_IMAGE_THUMBNAIL_SIZE, 'webp': settings.AD_IMAGE_WEBP_SIZE}
+
+
+def variant_name(digest, variant, size):
+    return content_name(digest, f'_{variant}{size}.webp')
+
+
+def render_variant(name, size):
+    """WebP с наибольшей стороной не больше size"""
+    with default_storage.open(name) as file, Image.open(file) as image:
+        # JPEG сразу декодируется в уменьшенном масштабе
+        image.draft('RGB', (size, size))
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail((size, size))
+        image = image.convert('RGBA' if image.mode in ('RGBA', 'LA', 'P') else 'RGB')
+        buffer = BytesIO()
+        image.save(buffer, 'WEBP', quality=settings.AD_IMAGE_WEBP_QUALITY)
+    return ContentFile(buffer.getvalue())
+
+
+def make_variants(image):
+    """
+    Имена вариантов изображения AdImage в хранилище.
+
+    Отсутствующие варианты строятся из оригинала; если такой же оригинал
+    уже обрабатывался, варианты берутся готовые. Для поврежденного
+    оригинала возвращается None.
+    """
+    variants = {}
+    for variant, size in variant_sizes().items():
+        name = variant_name(image.sha256, variant, size)
+        if not default_storage.exists(name):
+            try:
+                content = render_variant(image.original.name, size)
+            except IMAGE_ERRORS:
+                logger.warning('Не удалось обработать изображение %s', image.original.name, exc_info=True)
+                return None
+            name = default_storage.save(name, content)
+        variants[variant] = name
+    return variants
+
+
+def delete_files(names):
+    for name in names:
+        if name:
+            default_storage.delete(name)
@@ -0,0 +1,43 @@
+import statistics
+import time
+
+from django.core.management import BaseCommand
+from django.urls import reverse
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient
+
+from callboard import benchmark
+from callboard.models import Ad
+from callboard.paginators import CustomPagination
+from callboard.renderers import ORJSONRenderer
+
+
+class Command(BaseCommand):
+    help = 'Сравнение JSONRenderer и ORJSONRenderer на странице списка объявлений максимального размера'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--repeat', type=int, default=1000)
+
+    def handle(self, *args, **options):
+        with benchmark.rolled_back():
+            Ad.objects.bulk_create(
+                Ad(title=f'Объявление {i}', description=f'Описание товара {i}', price=i)
+                for i in range(CustomPagination.max_page_size)
+            )
+            data = self.page_data()
+
+        self.stdout.write(f"{'renderer':<16} {'p50, us':>9} {'size, B':>8}")
+        for renderer in (JSONRenderer(), ORJSONRenderer()):
+            timings = []
+            for _ in range(options['repeat']):
+                started = time.perf_counter()
+                content = renderer.render(data, 'application/json', {})
+                timings.append((time.perf_counter() - started) * 1_000_000)
+            self.stdout.write(f'{type(renderer).__name__:<16} {statistics.median(timings):>9.1f} {len(content):>8}')
+
+    @staticmethod
+    def page_data():
+        """Данные ответа AdListAPIView при page_size=max_page_size"""
+        with benchmark.environment():
+            response = APIClient().get(reverse('callboard:ad_list'), {'page_size': CustomPagination.max_page_size})
+        return response.data
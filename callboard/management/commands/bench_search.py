@@ -0,0 +1,106 @@
+import os
+import random
+import statistics
+import tempfile
+import time
+
+from django.core.management import BaseCommand
+
+from callboard.benchmark import rolled_back
+from callboard.models import Ad
+from callboard.search.database import DatabaseSearchBackend
+from callboard.search.inverted_index import InvertedIndexSearchBackend
+
+SYLLABLES = (
+    'ка', 'ро', 'ми', 'ло', 'на', 'те', 'ле', 'фон', 'сту', 'ди', 'ван', 'кре', 'сло', 'шка', 'фу',
+    'ве', 'ло', 'си', 'пед', 'са', 'мо', 'кат', 'ку', 'рт', 'бо', 'тин', 'ки', 'ча', 'сы', 'ну',
+)
+
+
+def make_vocabulary(size, rnd):
+    """Синтетический словарь: слова из 2-4 слогов"""
+    words = set()
+    while len(words) < size:
+        words.add(''.join(rnd.choices(SYLLABLES, k=rnd.randint(2, 4))))
+    return sorted(words)
+
+
+class Command(BaseCommand):
+    help = 'Сравнение поиска через LIKE и через инвертированный индекс на тестовых объявлениях'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--sizes', nargs='+', type=int, default=[10_000, 100_000, 1_000_000])
+        parser.add_argument('--queries', type=int, default=20)
+        parser.add_argument('--page-size', type=int, default=25)
+        parser.add_argument('--vocabulary', type=int, default=20_000)
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        self.random = random.Random(options['seed'])
+        self.words = make_vocabulary(options['vocabulary'], self.random)
+        # Частоты слов в объявлениях подчиняются закону Ципфа
+        self.weights = [1 / rank for rank in range(1, len(self.words) + 1)]
+        self.stdout.write(
+            f"{'ads':>10} {'LIKE p50, ms':>14} {'index p50, ms':>14} "
+            f"{'build, ms':>10} {'load, ms':>9} {'size, KB':>9}"
+        )
+        for size in options['sizes']:
+            with rolled_back():
+                self.bench(size, options['queries'], options['page_size'])
+
+    def words_sample(self, k):
+        return ' '.join(self.random.choices(self.words, weights=self.weights, k=k))
+
+    def seed(self, size, batch_size=5000):
+        for start in range(0, size, batch_size):
+            Ad.objects.bulk_create(
+                Ad(
+                    title=self.words_sample(2),
+                    description=self.words_sample(4),
+                    price=self.random.randint(100, 100_000),
+                )
+                for _ in range(min(batch_size, size - start))
+            )
+
+    @staticmethod
+    def measure(func, queries):
+        timings = []
+        for terms in queries:
+            started = time.perf_counter()
+            func(terms)
+            timings.append((time.perf_counter() - started) * 1000)
+        return statistics.median(timings)
+
+    def bench(self, size, queries_count, page_size):
+        self.seed(size)
+        queryset = Ad.objects.all()
+        queries = [[self.random.choice(self.words)] for _ in range(queries_count)]
+
+        def run(backend_search):
+            def page(terms):
+                found = backend_search(queryset, terms)
+                found.count()
+                list(found[:page_size])
+            return page
+
+        like_ms = self.measure(run(DatabaseSearchBackend().like_search), queries)
+
+        with tempfile.TemporaryDirectory() as directory:
+            path = os.path.join(directory, 'index.bin')
+            backend = InvertedIndexSearchBackend(path=path)
+            started = time.perf_counter()
+            backend.rebuild(queryset)
+            build_ms = (time.perf_counter() - started) * 1000
+
+            backend = InvertedIndexSearchBackend(path=path)
+            started = time.perf_counter()
+            backend.inverted_index
+            load_ms = (time.perf_counter() - started) * 1000
+
+            index_ms = self.measure(run(backend.search), queries)
+            index_kb = os.path.getsize(path) / 1024
+
+        self.stdout.write(
+            f'{size:>10} {like_ms:>14.2f} {index_ms:>14.2f} '
+            f'{build_ms:>10.0f} {load_ms:>9.2f} {index_kb:>9.0f}'
+        )
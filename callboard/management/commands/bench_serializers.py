@@ -0,0 +1,54 @@
+import statistics
+import time
+
+from django.core.management import BaseCommand
+
+from callboard.benchmark import rolled_back
+from callboard.models import Ad, Feedback
+from callboard.serializers import AdSerializer, FeedbackSerializer, values_mapper
+
+
+class Command(BaseCommand):
+    help = 'Сравнение ModelSerializer и ValuesMapper на страницах объявлений и отзывов'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', nargs='+', type=int, default=[25, 100, 1000])
+        parser.add_argument('--repeat', type=int, default=20)
+
+    def handle(self, *args, **options):
+        self.stdout.write(
+            f"{'serializer':<20} {'rows':>6} {'ModelSerializer, ms':>20} {'ValuesMapper, ms':>17} {'speedup':>8}"
+        )
+        with rolled_back():
+            self.seed(max(options['rows']))
+            for serializer_class in (AdSerializer, FeedbackSerializer):
+                for rows in options['rows']:
+                    self.bench(serializer_class, rows, options['repeat'])
+
+    @staticmethod
+    def seed(size):
+        ads = Ad.objects.bulk_create(
+            Ad(title=f'Объявление {i}', description=f'Описание {i}', price=i) for i in range(size)
+        )
+        Feedback.objects.bulk_create(Feedback(text=f'Отзыв {ad.pk}', ad=ad) for ad in ads)
+
+    @staticmethod
+    def measure(func, repeat):
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            func()
+            timings.append((time.perf_counter() - started) * 1000)
+        return statistics.median(timings)
+
+    def bench(self, serializer_class, rows, repeat):
+        queryset = serializer_class.Meta.model.objects.all()[:rows]
+        mapper = values_mapper(serializer_class)
+
+        serializer_ms = self.measure(lambda: serializer_class(queryset.all(), many=True).data, repeat)
+        mapper_ms = self.measure(lambda: mapper.map(queryset.values(*mapper.columns)), repeat)
+
+        self.stdout.write(
+            f'{serializer_class.__name__:<20} {rows:>6} {serializer_ms:>20.2f} {mapper_ms:>17.2f} '
+            f'{serializer_ms / mapper_ms:>7.1f}x'
+        )
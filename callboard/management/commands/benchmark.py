@@ -0,0 +1,49 @@
+from django.core.management import BaseCommand, CommandError
+
+from callboard import benchmark
+
+
+class Command(BaseCommand):
+    help = 'Замер числа запросов, задержки и памяти для всех адресов API со сравнением с эталоном'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--users', type=int, default=10)
+        parser.add_argument('--ads', type=int, default=1000)
+        parser.add_argument('--feedback', type=int, default=2, help='Отзывов на объявление')
+        parser.add_argument('--iterations', type=int, default=20)
+        parser.add_argument('--output', help='Файл для JSON-отчета')
+        parser.add_argument('--baseline', help='Эталонный JSON-отчет для сравнения')
+        parser.add_argument('--latency-tolerance', type=float, default=0.25)
+        parser.add_argument('--memory-tolerance', type=float, default=0.25)
+
+    def handle(self, *args, **options):
+        with benchmark.environment(), benchmark.rolled_back():
+            report = benchmark.run(
+                iterations=options['iterations'],
+                users=options['users'],
+                ads=options['ads'],
+                feedback_per_ad=options['feedback'],
+            )
+
+        self.stdout.write(
+            f"{'endpoint':<36} {'method':>6} {'status':>8} {'queries':>7} "
+            f"{'p50, ms':>9} {'p95, ms':>9} {'memory, KB':>10}"
+        )
+        for name, row in report['endpoints'].items():
+            self.stdout.write(
+                f"{name:<36} {row['method']:>6} {','.join(map(str, row['status'])):>8} {row['queries']:>7} "
+                f"{row['p50_ms']:>9} {row['p95_ms']:>9} {row['memory_kb']:>10}"
+            )
+
+        if options['output']:
+            benchmark.dump(report, options['output'])
+        if options['baseline']:
+            regressions = benchmark.compare(
+                report,
+                benchmark.load(options['baseline']),
+                latency_tolerance=options['latency_tolerance'],
+                memory_tolerance=options['memory_tolerance'],
+            )
+            if regressions:
+                raise CommandError('Регрессии относительно эталона:\n' + '\n'.join(regressions))
+            self.stdout.write(self.style.SUCCESS('Регрессий относительно эталона нет'))
@@ -0,0 +1,15 @@
+from django.core.management import BaseCommand
+
+from callboard.search import get_search_backend
+
+
+class Command(BaseCommand):
+    help = 'Полная перестройка поискового индекса объявлений'
+
+    def handle(self, *args, **options):
+        backend = get_search_backend()
+        if not backend.requires_indexing:
+            self.stdout.write('Выбранный поисковый движок не использует собственный индекс')
+            return
+        backend.rebuild()
+        self.stdout.write(self.style.SUCCESS('Поисковый индекс перестроен'))
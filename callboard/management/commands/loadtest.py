@@ -0,0 +1,115 @@
+import asyncio
+import statistics
+import time
+from urllib.parse import urlsplit
+
+from django.core.management import BaseCommand, CommandError
+from django.urls import reverse
+
+from callboard.benchmark import percentile
+from callboard.models import Ad
+from users.authentication import UserRefreshToken
+from users.models import User
+
+# Синхронные адреса и их асинхронные варианты
+PAIRS = (
+    ('callboard:ad_list', 'callboard:async_ad_list', False),
+    ('callboard:ad_retrieve', 'callboard:async_ad_retrieve', True),
+    ('callboard:feedback_list', 'callboard:async_feedback_list', True),
+)
+
+
+async def read_response(reader):
+    """Статус и тело ответа HTTP/1.1 с Content-Length или chunked"""
+    head = await reader.readuntil(b'\r\n\r\n')
+    lines = head.decode('latin-1').split('\r\n')
+    status = int(lines[0].split()[1])
+    headers = {}
+    for line in lines[1:]:
+        if line:
+            name, _, value = line.partition(':')
+            headers[name.strip().lower()] = value.strip()
+    if headers.get('transfer-encoding') == 'chunked':
+        body = b''
+        while True:
+            size = int((await reader.readline()).split(b';')[0], 16)
+            chunk = await reader.readexactly(size + 2)
+            if not size:
+                break
+            body += chunk[:-2]
+        return status, body
+    return status, await reader.readexactly(int(headers.get('content-length', 0)))
+
+
+async def worker(host, port, request, count, timings, statuses):
+    """Последовательные запросы по одному keep-alive соединению"""
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        for _ in range(count):
+            started = time.perf_counter()
+            writer.write(request)
+            await writer.drain()
+            status, _ = await read_response(reader)
+            timings.append((time.perf_counter() - started) * 1000)
+            statuses.add(status)
+    finally:
+        writer.close()
+
+
+async def load(url, path, token, concurrency, requests):
+    parts = urlsplit(url)
+    host, port = parts.hostname, parts.port or 80
+    lines = [f'GET {path} HTTP/1.1', f'Host: {parts.netloc}', 'Accept: application/json']
+    if token:
+        lines.append(f'Authorization: Bearer {token}')
+    request = ('\r\n'.join(lines) + '\r\n\r\n').encode()
+
+    timings, statuses = [], set()
+    per_worker, rest = divmod(requests, concurrency)
+    started = time.perf_counter()
+    await asyncio.gather(*(
+        worker(host, port, request, per_worker + (i < rest), timings, statuses)
+        for i in range(concurrency)
+    ))
+    elapsed = time.perf_counter() - started
+    return {
+        'status': ','.join(str(status) for status in sorted(statuses)),
+        'rps': len(timings) / elapsed,
+        'p50_ms': statistics.median(timings),
+        'p95_ms': percentile(timings, 0.95),
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        'Нагрузочное сравнение синхронных и асинхронных представлений чтения '
+        'на запущенном ASGI-сервере (uvicorn config.asgi:application)'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--url', default='http://127.0.0.1:8000', help='Адрес запущенного сервера')
+        parser.add_argument('--concurrency', type=int, default=50)
+        parser.add_argument('--requests', type=int, default=2000, help='Запросов на каждый адрес')
+        parser.add_argument('--email', help='Пользователь для адресов с аутентификацией')
+
+    def handle(self, *args, **options):
+        ad = Ad.objects.order_by('-feedback_count', 'pk').first()
+        users = User.objects.filter(is_active=True)
+        user = users.filter(email=options['email']).first() if options['email'] else users.first()
+        if ad is None or user is None:
+            raise CommandError('Для нагрузочного теста нужны хотя бы одно объявление и активный пользователь')
+        token = str(UserRefreshToken.for_user(user).access_token)
+
+        self.stdout.write(f"{'endpoint':<36} {'status':>8} {'rps':>9} {'p50, ms':>9} {'p95, ms':>9}")
+        for names in PAIRS:
+            *names, authenticated = names
+            for name in names:
+                path = reverse(name, args=(ad.pk,) if authenticated else ())
+                result = asyncio.run(load(
+                    options['url'], path, token if authenticated else None,
+                    options['concurrency'], options['requests'],
+                ))
+                self.stdout.write(
+                    f"{name:<36} {result['status']:>8} {result['rps']:>9.1f} "
+                    f"{result['p50_ms']:>9.2f} {result['p95_ms']:>9.2f}"
+                )
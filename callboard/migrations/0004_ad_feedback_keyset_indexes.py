@@ -0,0 +1,34 @@
+# Generated by Django 4.2.2 on 2026-10-18 13:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('callboard', '0003_alter_ad_created_at'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='feedback',
+            name='created_at',
+            field=models.DateTimeField(auto_now_add=True, null=True, verbose_name='Дата создания объявления'),
+        ),
+        migrations.AddIndex(
+            model_name='ad',
+            index=models.Index(fields=['-created_at', '-id'], name='ad_created_at_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='ad',
+            index=models.Index(fields=['author', '-created_at', '-id'], name='ad_author_created_at_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='feedback',
+            index=models.Index(fields=['ad', '-created_at', '-id'], name='feedback_ad_created_at_id_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='feedback',
+            index=models.Index(fields=['author', '-created_at', '-id'], name='feedback_author_created_id_idx'),
+        ),
+    ]
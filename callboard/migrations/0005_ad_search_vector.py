@@ -0,0 +1,67 @@
+# Generated by Django 4.2.2 on 2026-10-18 13:17
+
+import django.contrib.postgres.search
+from django.contrib.postgres.operations import TrigramExtension
+from django.db import migrations
+
+SEARCH_CONFIG = 'pg_catalog.russian'
+
+FORWARD_SQL = f"""
+CREATE INDEX IF NOT EXISTS ad_search_vector_gin ON callboard_ad USING gin (search_vector);
+CREATE INDEX IF NOT EXISTS ad_title_trgm_gin ON callboard_ad USING gin (title gin_trgm_ops);
+CREATE INDEX IF NOT EXISTS ad_description_trgm_gin ON callboard_ad USING gin (description gin_trgm_ops);
+
+CREATE OR REPLACE FUNCTION callboard_ad_search_vector_update() RETURNS trigger AS $$
+BEGIN
+    NEW.search_vector :=
+        setweight(to_tsvector('{SEARCH_CONFIG}', coalesce(NEW.title, '')), 'A') ||
+        setweight(to_tsvector('{SEARCH_CONFIG}', coalesce(NEW.description, '')), 'B');
+    RETURN NEW;
+END
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS callboard_ad_search_vector_trigger ON callboard_ad;
+CREATE TRIGGER callboard_ad_search_vector_trigger
+    BEFORE INSERT OR UPDATE OF title, description, search_vector ON callboard_ad
+    FOR EACH ROW EXECUTE FUNCTION callboard_ad_search_vector_update();
+
+UPDATE callboard_ad SET title = title;
+"""
+
+BACKWARD_SQL = """
+DROP TRIGGER IF EXISTS callboard_ad_search_vector_trigger ON callboard_ad;
+DROP FUNCTION IF EXISTS callboard_ad_search_vector_update();
+DROP INDEX IF EXISTS ad_description_trgm_gin;
+DROP INDEX IF EXISTS ad_title_trgm_gin;
+DROP INDEX IF EXISTS ad_search_vector_gin;
+"""
+
+
+def run_on_postgresql(sql):
+    """Поисковые индексы и триггер существуют только в PostgreSQL"""
+
+    def operation(apps, schema_editor):
+        if schema_editor.connection.vendor == 'postgresql':
+            schema_editor.execute(sql)
+
+    return operation
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('callboard', '0004_ad_feedback_keyset_indexes'),
+    ]
+
+    operations = [
+        TrigramExtension(),
+        migrations.AddField(
+            model_name='ad',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True, verbose_name='Поисковый вектор'),
+        ),
+        migrations.RunPython(
+            run_on_postgresql(FORWARD_SQL),
+            run_on_postgresql(BACKWARD_SQL),
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 4.2.2 on 2026-10-18 13:30
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('callboard', '0005_ad_search_vector'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='ad',
+            options={'ordering': ('-created_at', '-id'), 'verbose_name': 'Товар', 'verbose_name_plural': 'Товары'},
+        ),
+        migrations.AlterModelOptions(
+            name='feedback',
+            options={'ordering': ('-created_at', '-id'), 'verbose_name': 'Отзыв', 'verbose_name_plural': 'Отзывы'},
+        ),
+        migrations.AlterField(
+            model_name='ad',
+            name='author',
+            field=models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL, verbose_name='Автор'),
+        ),
+        migrations.AlterField(
+            model_name='feedback',
+            name='ad',
+            field=models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='feedback_ad', to='callboard.ad', verbose_name='Объявление'),
+        ),
+        migrations.AlterField(
+            model_name='feedback',
+            name='author',
+            field=models.ForeignKey(blank=True, db_index=False, null=True, on_delete=django.db.models.deletion.SET_NULL, to=settings.AUTH_USER_MODEL, verbose_name='Автор'),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 4.2.2 on 2026-10-18 13:44
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def fill_feedback_count(apps, schema_editor):
+    Ad = apps.get_model('callboard', 'Ad')
+    Feedback = apps.get_model('callboard', 'Feedback')
+    counts = (
+        Feedback.objects.filter(ad=OuterRef('pk'))
+        .order_by()
+        .values('ad')
+        .annotate(count=Count('pk'))
+        .values('count')
+    )
+    Ad.objects.update(feedback_count=Coalesce(Subquery(counts), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('callboard', '0006_query_path_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ad',
+            name='feedback_count',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='Количество отзывов'),
+        ),
+        migrations.RunPython(fill_feedback_count, migrations.RunPython.noop),
+    ]
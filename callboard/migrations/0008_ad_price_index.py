@@ -0,0 +1,17 @@
+# Generated by Django 4.2.2 on 2026-10-18 14:01
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('callboard', '0007_ad_feedback_count'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='ad',
+            index=models.Index(fields=['price', 'id'], name='ad_price_id_idx'),
+        ),
+    ]
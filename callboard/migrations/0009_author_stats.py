@@ -0,0 +1,60 @@
+# Generated by Django 4.2.2 on 2026-10-18 14:04
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+import django.db.models.deletion
+
+
+def count(queryset, field):
+    return Coalesce(
+        Subquery(
+            queryset.filter(**{field: OuterRef('pk')}).order_by().values(field).annotate(count=Count('pk')).values('count')
+        ),
+        0,
+    )
+
+
+def fill_author_stats(apps, schema_editor):
+    User = apps.get_model('users', 'User')
+    Ad = apps.get_model('callboard', 'Ad')
+    Feedback = apps.get_model('callboard', 'Feedback')
+    AuthorStats = apps.get_model('callboard', 'AuthorStats')
+    last_ad = Ad.objects.filter(author=OuterRef('pk')).order_by('-created_at', '-id').values('created_at')[:1]
+    rows = User.objects.order_by('pk').annotate(
+        ads_count=count(Ad.objects.all(), 'author'),
+        feedback_received=count(Feedback.objects.all(), 'ad__author'),
+        feedback_written=count(Feedback.objects.all(), 'author'),
+        last_ad_at=Subquery(last_ad),
+    ).values('pk', 'ads_count', 'feedback_received', 'feedback_written', 'last_ad_at')
+    AuthorStats.objects.bulk_create(
+        (AuthorStats(user_id=row.pop('pk'), **row) for row in rows.iterator(chunk_size=1000)),
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('users', '0002_password_reset_token'),
+        ('callboard', '0008_ad_price_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='AuthorStats',
+            fields=[
+                ('user', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='author_stats', serialize=False, to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+                ('ads_count', models.PositiveIntegerField(default=0, verbose_name='Количество объявлений')),
+                ('feedback_received', models.PositiveIntegerField(default=0, verbose_name='Получено отзывов')),
+                ('feedback_written', models.PositiveIntegerField(default=0, verbose_name='Написано отзывов')),
+                ('last_ad_at', models.DateTimeField(blank=True, null=True, verbose_name='Дата последнего объявления')),
+            ],
+            options={
+                'verbose_name': 'Статистика автора',
+                'verbose_name_plural': 'Статистика авторов',
+            },
+        ),
+        migrations.RunPython(fill_author_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 4.2.2 on 2026-10-18 14:13
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('callboard', '0009_author_stats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ad',
+            name='thumbnail',
+            field=models.ImageField(blank=True, editable=False, max_length=255, upload_to='', verbose_name='Обложка'),
+        ),
+        migrations.CreateModel(
+            name='AdImage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('sha256', models.CharField(db_index=True, max_length=64, verbose_name='SHA-256 оригинала')),
+                ('original', models.ImageField(max_length=255, upload_to='', verbose_name='Оригинал')),
+                ('thumbnail', models.ImageField(blank=True, editable=False, max_length=255, upload_to='', verbose_name='Миниатюра')),
+                ('webp', models.ImageField(blank=True, editable=False, max_length=255, upload_to='', verbose_name='WebP')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Дата загрузки')),
+                ('ad', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='images', to='callboard.ad', verbose_name='Объявление')),
+            ],
+            options={
+                'verbose_name': 'Изображение объявления',
+                'verbose_name_plural': 'Изображения объявлений',
+                'ordering': ('id',),
+            },
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 4.2.2 on 2026-10-18 14:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('callboard', '0010_ad_images'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ImageFile',
+            fields=[
+                ('sha256', models.CharField(max_length=64, primary_key=True, serialize=False, verbose_name='SHA-256 оригинала')),
+            ],
+            options={
+                'verbose_name': 'Файл изображения',
+                'verbose_name_plural': 'Файлы изображений',
+            },
+        ),
+    ]
@@ -1,4 +1,7 @@
+from django.contrib.postgres.search import SearchVectorField
 from django.db import models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
 
 from users.models import User
 
@@ -30,6 +33,7 @@ class Ad(models.Model):
         blank=True,
         null=True,
         on_delete=models.SET_NULL,
+        db_index=False,
     )
     created_at = models.DateTimeField(
         auto_now_add=True,
@@ -37,6 +41,24 @@ class Ad(models.Model):
         blank=True,
         null=True,
     )
+    search_vector = SearchVectorField(
+        verbose_name='Поисковый вектор',
+        null=True,
+        editable=False,
+    )
+    # Обновляется сигналами отзывов атомарным UPDATE с F()
+    feedback_count = models.PositiveIntegerField(
+        verbose_name='Количество отзывов',
+        default=0,
+        editable=False,
+    )
+    # Миниатюра первого обработанного изображения для списков
+    thumbnail = models.ImageField(
+        max_length=255,
+        verbose_name='Обложка',
+        blank=True,
+        editable=False,
+    )
 
     def __str__(self):
         # Строковое отображение объекта
@@ -47,7 +69,15 @@ class Ad(models.Model):
     class Meta:
         verbose_name = "Товар"
         verbose_name_plural = "Товары"
-        ordering = ('-created_at',)
+        ordering = ('-created_at', '-id')
+        # Индексы по автору и объявлению начинаются с внешнего ключа и заменяют его отдельный индекс
+        indexes = (
+            # Курсорная пагинация ленты объявлений и объявлений пользователя
+            models.Index(fields=('-created_at', '-id'), name='ad_created_at_id_idx'),
+            models.Index(fields=('author', '-created_at', '-id'), name='ad_author_created_at_id_idx'),
+            # Фильтр по диапазону цены и сортировка по цене
+            models.Index(fields=('price', 'id'), name='ad_price_id_idx'),
+        )
 
 
 class Feedback(models.Model):
@@ -65,6 +95,7 @@ class Feedback(models.Model):
         blank=True,
         null=True,
         on_delete=models.SET_NULL,
+        db_index=False,
     )
     ad = models.ForeignKey(
         Ad,
@@ -73,6 +104,7 @@ class Feedback(models.Model):
         blank=True,
         null=True,
         on_delete=models.SET_NULL,
+        db_index=False,
     )
     created_at = models.DateTimeField(
         auto_now_add=True,
@@ -90,3 +122,191 @@ class Feedback(models.Model):
     class Meta:
         verbose_name = "Отзыв"
         verbose_name_plural = "Отзывы"
+        ordering = ('-created_at', '-id')
+        indexes = (
+            # Курсорная пагинация отзывов объявления и отзывов пользователя
+            models.Index(fields=('ad', '-created_at', '-id'), name='feedback_ad_created_at_id_idx'),
+            models.Index(fields=('author', '-created_at', '-id'), name='feedback_author_created_id_idx'),
+        )
+
+
+class AdImage(models.Model):
+    """
+    Изображение объявления.
+
+    Файлы хранятся по адресу содержимого (sha256), варианты thumbnail
+    и webp заполняет задача Celery после загрузки.
+    """
+
+    ad = models.ForeignKey(
+        Ad,
+        related_name='images',
+        verbose_name='Объявление',
+        on_delete=models.CASCADE,
+    )
+    sha256 = models.CharField(
+        max_length=64,
+        verbose_name='SHA-256 оригинала',
+        db_index=True,
+    )
+    original = models.ImageField(
+        max_length=255,
+        verbose_name='Оригинал',
+    )
+    thumbnail = models.ImageField(
+        max_length=255,
+        verbose_name='Миниатюра',
+        blank=True,
+        editable=False,
+    )
+    webp = models.ImageField(
+        max_length=255,
+        verbose_name='WebP',
+        blank=True,
+        editable=False,
+    )
+    created_at = models.DateTimeField(
+        auto_now_add=True,
+        verbose_name='Дата загрузки',
+    )
+
+    def __str__(self):
+        return f'Изображение {self.sha256} к {self.ad_id}'
+
+    class Meta:
+        verbose_name = "Изображение объявления"
+        verbose_name_plural = "Изображения объявлений"
+        ordering = ('id',)
+
+
+class ImageFile(models.Model):
+    """
+    Блокировка файлов изображения с одним хешом содержимого.
+
+    Сохранение оригинала с созданием AdImage и удаление файлов без ссылок
+    выполняются под блокировкой строки хеша (lock), поэтому загрузка того же
+    изображения не может сослаться на файлы, которые в это время удаляются.
+    """
+
+    sha256 = models.CharField(
+        max_length=64,
+        verbose_name='SHA-256 оригинала',
+        primary_key=True,
+    )
+
+    def __str__(self):
+        return f'Файл {self.sha256}'
+
+    @classmethod
+    def lock(cls, digest):
+        """Блокировка строки хеша до конца текущей транзакции; строка создается при отсутствии"""
+        # Строку могут удалить между созданием и блокировкой, тогда она создается снова
+        while True:
+            cls.objects.bulk_create([cls(sha256=digest)], ignore_conflicts=True)
+            if cls.objects.select_for_update().filter(sha256=digest).exists():
+                return
+
+    class Meta:
+        verbose_name = "Файл изображения"
+        verbose_name_plural = "Файлы изображений"
+
+
+def _count_subquery(queryset, field):
+    """Количество строк queryset для каждого значения field, равного внешнему pk"""
+    return Coalesce(
+        Subquery(
+            queryset.filter(**{field: OuterRef('pk')}).order_by().values(field).annotate(count=Count('pk')).values('count')
+        ),
+        0,
+    )
+
+
+class AuthorStats(models.Model):
+    """
+    Статистика пользователя как продавца и автора отзывов.
+
+    Счетчики меняются сигналами объявлений и отзывов атомарными UPDATE с F(),
+    а reconcile() пересчитывает их из исходных таблиц и исправляет расхождения.
+    Дата последнего объявления сигналами только увеличивается: после удаления
+    или передачи последнего объявления ее исправляет reconcile().
+    """
+
+    counter_fields = ('ads_count', 'feedback_received', 'feedback_written', 'last_ad_at')
+
+    user = models.OneToOneField(
+        User,
+        primary_key=True,
+        related_name='author_stats',
+        verbose_name='Пользователь',
+        on_delete=models.CASCADE,
+    )
+    ads_count = models.PositiveIntegerField(
+        verbose_name='Количество объявлений',
+        default=0,
+    )
+    feedback_received = models.PositiveIntegerField(
+        verbose_name='Получено отзывов',
+        default=0,
+    )
+    feedback_written = models.PositiveIntegerField(
+        verbose_name='Написано отзывов',
+        default=0,
+    )
+    last_ad_at = models.DateTimeField(
+        verbose_name='Дата последнего объявления',
+        blank=True,
+        null=True,
+    )
+
+    def __str__(self):
+        return f"Статистика {self.user_id}: объявлений {self.ads_count}"
+
+    class Meta:
+        verbose_name = "Статистика автора"
+        verbose_name_plural = "Статистика авторов"
+
+    @classmethod
+    def compute(cls, users):
+        """Статистика пользователей queryset users, посчитанная по объявлениям и отзывам"""
+        last_ad = Ad.objects.filter(author=OuterRef('pk')).order_by('-created_at', '-id').values('created_at')[:1]
+        rows = users.order_by('pk').annotate(
+            ads_count=_count_subquery(Ad.objects.all(), 'author'),
+            feedback_received=_count_subquery(Feedback.objects.all(), 'ad__author'),
+            feedback_written=_count_subquery(Feedback.objects.all(), 'author'),
+            last_ad_at=Subquery(last_ad),
+        ).values('pk', *cls.counter_fields)
+        return [cls(user_id=row.pop('pk'), **row) for row in rows]
+
+    @classmethod
+    def reconcile(cls, users=None, batch_size=1000):
+        """
+        Пересчет статистики пачками по batch_size пользователей.
+
+        Записываются только отсутствующие и разошедшиеся строки одним
+        INSERT ... ON CONFLICT DO UPDATE на пачку. Возвращает число исправленных строк.
+        """
+        users = User.objects.all() if users is None else users
+        pks = list(users.order_by('pk').values_list('pk', flat=True))
+        repaired = 0
+        for start in range(0, len(pks), batch_size):
+            batch = pks[start:start + batch_size]
+            stored = {
+                row['user_id']: row
+                for row in cls.objects.filter(user_id__in=batch).values('user_id', *cls.counter_fields)
+            }
+            changed = [
+                stats for stats in cls.compute(User.objects.filter(pk__in=batch))
+                if stored.get(stats.user_id) != {'user_id': stats.user_id, **stats.counters()}
+            ]
+            if changed:
+                cls.objects.bulk_create(
+                    changed,
+                    update_conflicts=True,
+                    unique_fields=('user',),
+                    update_fields=cls.counter_fields,
+                )
+            repaired += len(changed)
+        return repaired
+
+    def counters(self):
+        return {field: getattr(self, field) for field in self.counter_fields}
@@ -1,7 +1,163 @@
-from rest_framework.pagination import PageNumberPagination
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import CursorPagination, PageNumberPagination, _reverse_ordering
 
 
 class CustomPagination(PageNumberPagination):
     page_size = 4
     page_size_query_param = 'page_size'
     max_page_size = 25
+
+
+class KeysetPagination(CursorPagination):
+    """
+    Курсорная (keyset) пагинация по паре (created_at, id).
+
+    В отличие от CursorPagination из DRF позиция курсора содержит оба поля,
+    поэтому она уникальна, смещение всегда равно нулю, а запрос страницы -
+    это WHERE (created_at, id) < (...) ORDER BY ... LIMIT без COUNT(*) и OFFSET.
+    """
+
+    page_size = CustomPagination.page_size
+    page_size_query_param = CustomPagination.page_size_query_param
+    max_page_size = CustomPagination.max_page_size
+    ordering = ('-created_at', '-id')
+    position_separator = '|'
+
+    def get_ordering(self, request, queryset, view):
+        """Сортировка фиксирована: позиция курсора рассчитана на пару (created_at, id)"""
+        return self.ordering
+
+    def _get_position_from_instance(self, instance, ordering):
+        """Позиция объекта - строка вида '<created_at>|<id>'"""
+        values = []
+        for field in ordering:
+            field_name = field.lstrip('-')
+            if isinstance(instance, dict):
+                value = instance[field_name]
+            else:
+                value = getattr(instance, field_name)
+            values.append(value.isoformat() if hasattr(value, 'isoformat') else str(value))
+        return self.position_separator.join(values)
+
+    def _parse_position(self, position):
+        """Разбор позиции курсора на значения полей сортировки"""
+        try:
+            created_at, pk = position.split(self.position_separator)
+            created_at = parse_datetime(created_at)
+            pk = int(pk)
+        except (TypeError, ValueError):
+            raise NotFound(self.invalid_cursor_message)
+        if created_at is None:
+            raise NotFound(self.invalid_cursor_message)
+        return created_at, pk
+
+    def _position_filter(self, position, lookup):
+        """
+        Условие (created_at, id) < / > позиции, которое покрывается составным индексом.
+
+        Внешнее нестрогое сравнение по created_at задает диапазон индекса,
+        без него СУБД не может начать чтение индекса с позиции курсора.
+        """
+        created_at, pk = self._parse_position(position)
+        time_field, pk_field = (field.lstrip('-') for field in self.ordering)
+        return Q(**{f'{time_field}__{lookup}e': created_at}) & (
+            Q(**{f'{time_field}__{lookup}': created_at}) | Q(**{f'{pk_field}__{lookup}': pk})
+        )
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        self.page_size = self.get_page_size(request)
+        if not self.page_size:
+            return None
+
+        self.base_url = request.build_absolute_uri()
+        self.ordering = self.get_ordering(request, queryset, view)
+
+        self.cursor = self.decode_cursor(request)
+        if self.cursor is None:
+            reverse, current_position = False, None
+        else:
+            reverse, current_position = self.cursor.reverse, self.cursor.position
+
+        if reverse:
+            queryset = queryset.order_by(*_reverse_ordering(self.ordering))
+        else:
+            queryset = queryset.order_by(*self.ordering)
+
+        if current_position is not None:
+            is_reversed = self.ordering[0].startswith('-')
+            lookup = 'lt' if reverse != is_reversed else 'gt'
+            queryset = queryset.filter(self._position_filter(current_position, lookup))
+
+        # Лишний объект нужен только для определения наличия следующей страницы
+        results = list(queryset[:self.page_size + 1])
+        self.page = results[:self.page_size]
+
+        if len(results) > len(self.page):
+            following_position = self._get_position_from_instance(results[-1], self.ordering)
+        else:
+            following_position = None
+
+        if reverse:
+            self.page = list(reversed(self.page))
+            self.has_next = current_position is not None
+            self.has_previous = following_position is not None
+            self.next_position = current_position
+            self.previous_position = following_position
+        else:
+            self.has_next = following_position is not None
+            self.has_previous = current_position is not None
+            self.next_position = following_position
+            self.previous_position = current_position
+
+        if (self.has_previous or self.has_next) and self.template is not None:
+            self.display_page_controls = True
+
+        return self.page
+
+
+class OptionalCursorPagination(CustomPagination):
+    """
+    Постраничная пагинация с включаемым курсорным режимом.
+
+    По умолчанию ответ совпадает с CustomPagination. Параметр ?pagination=cursor
+    (или переданный cursor) переключает выдачу на KeysetPagination: ответ
+    содержит только next/previous и results, без общего количества.
+    """
+
+    mode_query_param = 'pagination'
+    cursor_mode = 'cursor'
+    cursor_pagination_class = KeysetPagination
+
+    def use_cursor(self, request):
+        cursor_query_param = self.cursor_pagination_class.cursor_query_param
+        return (
+            request.query_params.get(self.mode_query_param) == self.cursor_mode
+            or cursor_query_param in request.query_params
+        )
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.cursor_paginator = None
+        if self.use_cursor(request):
+            self.cursor_paginator = self.cursor_pagination_class()
+            page = self.cursor_paginator.paginate_queryset(queryset, request, view)
+            self.display_page_controls = self.cursor_paginator.display_page_controls
+            return page
+        return super().paginate_queryset(queryset, request, view)
+
+    def get_paginated_response(self, data):
+        if self.cursor_paginator is not None:
+            return self.cursor_paginator.get_paginated_response(data)
+        return super().get_paginated_response(data)
+
+    def get_html_context(self):
+        if self.cursor_paginator is not None:
+            return self.cursor_paginator.get_html_context()
+        return super().get_html_context()
+
+    def to_html(self):
+        if self.cursor_paginator is not None:
+            return self.cursor_paginator.to_html()
+        return super().to_html()
@@ -0,0 +1,23 @@
+from functools import lru_cache
+
+from django.conf import settings
+from django.core.signals import setting_changed
+from django.dispatch import receiver
+from django.utils.module_loading import import_string
+
+from callboard.search.base import BaseSearchBackend
+
+__all__ = ('BaseSearchBackend', 'get_search_backend')
+
+
+@lru_cache(maxsize=None)
+def get_search_backend():
+    """Поисковый движок объявлений, выбранный в settings.SEARCH_BACKEND"""
+    return import_string(settings.SEARCH_BACKEND)()
+
+
+@receiver(setting_changed)
+def reset_search_backend(setting, **kwargs):
+    """Сброс движка при изменении настроек поиска (override_settings в тестах)"""
+    if setting in ('SEARCH_BACKEND', 'SEARCH_INDEX_PATH'):
+        get_search_backend.cache_clear()
@@ -0,0 +1,26 @@
+class BaseSearchBackend:
+    """Базовый класс поискового движка объявлений"""
+
+    # Нужно ли движку получать изменения объявлений через сигналы
+    requires_indexing = False
+
+    def search(self, queryset, terms):
+        """
+        Фильтрация queryset объявлений по списку поисковых термов.
+
+        Правило совпадения зависит от движка: подстрока (icontains)
+        в DatabaseSearchBackend на SQLite, полнотекстовый и триграммный
+        поиск на PostgreSQL, начало слова в InvertedIndexSearchBackend.
+        Общее для всех: в результат попадают объявления, подходящие
+        под каждый терм.
+        """
+        raise NotImplementedError
+
+    def index(self, ads):
+        """Добавление или обновление объявлений в индексе"""
+
+    def remove(self, pks):
+        """Удаление объявлений из индекса"""
+
+    def rebuild(self, queryset=None):
+        """Полная перестройка индекса"""
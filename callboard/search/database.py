@@ -0,0 +1,53 @@
+import operator
+from functools import reduce
+
+from django.contrib.postgres.search import SearchQuery, SearchRank, TrigramWordSimilarity
+from django.db import connections
+from django.db.models import F, Q
+from django.db.models.functions import Greatest
+
+from callboard.search.base import BaseSearchBackend
+
+
+class DatabaseSearchBackend(BaseSearchBackend):
+    """
+    Поиск средствами базы данных.
+
+    В PostgreSQL запрос идет по поддерживаемому триггером search_vector
+    (GIN-индекс, русская морфология) с триграммным поиском по title/description
+    для неполных слов, результаты ранжируются. На остальных СУБД каждый терм
+    ищется через icontains по search_fields, как в SearchFilter.
+    """
+
+    search_fields = ('title', 'description')
+    search_config = 'russian'
+    search_type = 'websearch'
+
+    def search(self, queryset, terms):
+        if connections[queryset.db].vendor == 'postgresql':
+            return self.full_text_search(queryset, terms)
+        return self.like_search(queryset, terms)
+
+    def like_search(self, queryset, terms):
+        """Поиск подстроки: каждый терм должен найтись хотя бы в одном поле"""
+        conditions = (
+            reduce(operator.or_, (Q(**{f'{field}__icontains': term}) for field in self.search_fields))
+            for term in terms
+        )
+        return queryset.filter(reduce(operator.and_, conditions))
+
+    def full_text_search(self, queryset, terms):
+        """Ранжированный полнотекстовый и триграммный поиск PostgreSQL"""
+        text = ' '.join(terms)
+        query = SearchQuery(text, config=self.search_config, search_type=self.search_type)
+        return queryset.annotate(
+            rank=SearchRank(F('search_vector'), query),
+            similarity=Greatest(
+                TrigramWordSimilarity(text, 'title'),
+                TrigramWordSimilarity(text, 'description'),
+            ),
+        ).filter(
+            Q(search_vector=query)
+            | Q(title__trigram_word_similar=text)
+            | Q(description__trigram_word_similar=text)
+        ).order_by('-rank', '-similarity', '-created_at', '-id')
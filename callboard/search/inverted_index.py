@@ -0,0 +1,356 @@
+import array
+import bisect
+import json
+import mmap
+import os
+import re
+import struct
+import tempfile
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import connections
+from django.db.models.expressions import RawSQL
+
+from callboard.search.base import BaseSearchBackend
+
+TOKEN_RE = re.compile(r'\w+')
+
+# Формат файла индекса (little-endian, все секции выровнены по 8 байт):
+#   заголовок: magic, версия, typecode идентификаторов, число термов, размер блока термов;
+#   смещения термов (uint32 * (n + 1)) и блок термов в UTF-8, отсортированных по возрастанию;
+#   смещения списков (uint64 * (n + 1)) и сами отсортированные списки идентификаторов.
+MAGIC = b'CBIX'
+VERSION = 1
+HEADER = struct.Struct('<4sHcxIQ')
+
+
+def tokenize(text):
+    """Разбиение текста на нормализованные слова"""
+    if not text:
+        return ()
+    return TOKEN_RE.findall(text.lower().replace('ё', 'е'))
+
+
+def _align(offset):
+    return (offset + 7) & ~7
+
+
+class _Terms:
+    """Последовательность термов поверх буфера, пригодная для bisect"""
+
+    def __init__(self, blob, offsets):
+        self.blob = blob
+        self.offsets = offsets
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, i):
+        return str(self.blob[self.offsets[i]:self.offsets[i + 1]], 'utf-8')
+
+
+class IndexSegment:
+    """Неизменяемый сегмент индекса: отсортированный словарь термов и списки идентификаторов"""
+
+    def __init__(self, buffer):
+        self.buffer = buffer
+        view = memoryview(buffer)
+        magic, version, typecode, n_terms, terms_size = HEADER.unpack_from(view)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError('Неподдерживаемый формат поискового индекса')
+        self.typecode = typecode.decode()
+        offset = _align(HEADER.size)
+        term_offsets = view[offset:offset + 4 * (n_terms + 1)].cast('I')
+        offset = _align(offset + term_offsets.nbytes)
+        self.terms = _Terms(view[offset:offset + terms_size], term_offsets)
+        offset = _align(offset + terms_size)
+        self.postings_offsets = view[offset:offset + 8 * (n_terms + 1)].cast('Q')
+        offset = _align(offset + self.postings_offsets.nbytes)
+        self.postings = view[offset:].cast(self.typecode)
+
+    @classmethod
+    def build(cls, postings):
+        """Сборка сегмента из словаря терм -> идентификаторы"""
+        return cls(cls.encode(postings))
+
+    @classmethod
+    def empty(cls):
+        return cls.build({})
+
+    @classmethod
+    def load(cls, path):
+        """Отображение файла индекса в память без чтения его целиком"""
+        with open(path, 'rb') as file:
+            return cls(mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ))
+
+    @staticmethod
+    def encode(postings):
+        terms = sorted(postings)
+        max_id = max((max(ids) for ids in postings.values() if ids), default=0)
+        typecode = 'I' if max_id < 2 ** 32 else 'q'
+
+        term_offsets = array.array('I', [0])
+        blob = bytearray()
+        postings_offsets = array.array('Q', [0])
+        ids = array.array(typecode)
+        for term in terms:
+            blob += term.encode()
+            term_offsets.append(len(blob))
+            ids.extend(sorted(postings[term]))
+            postings_offsets.append(len(ids))
+
+        chunks = [
+            HEADER.pack(MAGIC, VERSION, typecode.encode(), len(terms), len(blob)),
+            term_offsets.tobytes(),
+            bytes(blob),
+            postings_offsets.tobytes(),
+            ids.tobytes(),
+        ]
+        data = bytearray()
+        for chunk in chunks:
+            data += b'\0' * (_align(len(data)) - len(data))
+            data += chunk
+        return bytes(data)
+
+    def __len__(self):
+        return len(self.terms)
+
+    def items(self):
+        """Пары (терм, идентификаторы) в порядке возрастания термов"""
+        for i in range(len(self.terms)):
+            yield self.terms[i], self.postings[self.postings_offsets[i]:self.postings_offsets[i + 1]]
+
+    def match_prefix(self, prefix):
+        """Идентификаторы объявлений со словами, начинающимися на prefix"""
+        result = set()
+        i = bisect.bisect_left(self.terms, prefix)
+        while i < len(self.terms) and self.terms[i].startswith(prefix):
+            result.update(self.postings[self.postings_offsets[i]:self.postings_offsets[i + 1]])
+            i += 1
+        return result
+
+
+class InvertedIndex:
+    """
+    Инвертированный индекс: сегмент с диска и изменения в памяти.
+
+    Новые и измененные объявления попадают в дельту, их прежние записи
+    в сегменте скрываются через tombstones. changed_at хранит время
+    последнего изменения каждого объявления в дельте.
+    """
+
+    def __init__(self, segment=None):
+        self.segment = IndexSegment.empty() if segment is None else segment
+        self.delta = defaultdict(set)
+        self.delta_docs = {}
+        self.tombstones = set()
+        self.changed_at = {}
+        self.lock = threading.RLock()
+
+    def __len__(self):
+        return len(self.delta_docs) + len(self.tombstones)
+
+    def add(self, pk, text):
+        self.add_terms(pk, set(tokenize(text)))
+
+    def add_terms(self, pk, terms, changed_at=None):
+        with self.lock:
+            self.discard(pk, changed_at)
+            for term in terms:
+                self.delta[term].add(pk)
+            self.delta_docs[pk] = terms
+
+    def discard(self, pk, changed_at=None):
+        with self.lock:
+            for term in self.delta_docs.pop(pk, ()):
+                self.delta[term].discard(pk)
+                if not self.delta[term]:
+                    del self.delta[term]
+            self.tombstones.add(pk)
+            self.changed_at[pk] = time.time() if changed_at is None else changed_at
+
+    def with_segment(self, segment, since):
+        """Индекс с новым сегментом и изменениями из памяти, сделанными не раньше since"""
+        with self.lock:
+            index = InvertedIndex(segment)
+            for pk, changed_at in self.changed_at.items():
+                if changed_at < since:
+                    continue
+                if pk in self.delta_docs:
+                    index.add_terms(pk, self.delta_docs[pk], changed_at)
+                else:
+                    index.discard(pk, changed_at)
+            return index
+
+    def match_prefix(self, prefix):
+        with self.lock:
+            result = self.segment.match_prefix(prefix) - self.tombstones
+            for term, ids in self.delta.items():
+                if term.startswith(prefix):
+                    result |= ids
+            return result
+
+    def search(self, terms):
+        """Объявления, в которых нашлись все слова всех термов (по префиксу)"""
+        tokens = [token for term in terms for token in tokenize(term)]
+        if not tokens:
+            return set()
+        # Начинаем с самых длинных слов: у них обычно самые короткие списки
+        tokens.sort(key=len, reverse=True)
+        result = self.match_prefix(tokens[0])
+        for token in tokens[1:]:
+            if not result:
+                break
+            result &= self.match_prefix(token)
+        return result
+
+
+class InvertedIndexSearchBackend(BaseSearchBackend):
+    """
+    Поиск по инвертированному индексу в памяти процесса.
+
+    Для окружений без PostgreSQL (CI, edge-узлы). Индекс хранится в файле
+    settings.SEARCH_INDEX_PATH, общем для всех процессов, и отображается
+    в память. Изменения объявлений применяются через сигналы к дельте
+    в памяти текущего процесса. Файл всегда перестраивается из базы
+    задачей rebuild_search_index (по расписанию и после compact_threshold
+    изменений в дельте) и командой build_search_index, поэтому процессы
+    не затирают изменения друг друга, а запрос, сделавший очередное
+    изменение, не платит за перестройку. Время начала перестройки
+    записывается во время изменения файла; процесс, заметивший новый файл,
+    загружает его и оставляет в дельте только изменения, сделанные после
+    начала перестройки.
+
+    Совпадение ищется по началу слов, а не по подстроке: «фон» не находит
+    «телефон», зато слова запроса могут стоять в разных полях.
+    """
+
+    requires_indexing = True
+    fields = ('title', 'description')
+    compact_threshold = 10000
+    # Не чаще одной постановки задачи перестройки за этот интервал, секунды
+    rebuild_request_interval = 60
+    # Как часто проверять, не перестроил ли индекс другой процесс, секунды
+    reload_interval = 1
+    # Начиная с этого размера идентификаторы передаются в запрос одним параметром
+    bulk_ids_threshold = 100
+
+    def __init__(self, path=None):
+        self.path = path or settings.SEARCH_INDEX_PATH
+        self.lock = threading.RLock()
+        self._index = None
+        self._file = None
+        self._checked_at = 0
+        self._rebuild_requested_at = None
+
+    @property
+    def inverted_index(self):
+        if self._index is None:
+            with self.lock:
+                if self._index is None:
+                    if os.path.exists(self.path):
+                        self._load()
+                    else:
+                        self.rebuild()
+        elif time.monotonic() - self._checked_at >= self.reload_interval:
+            self._reload_if_changed()
+        return self._index
+
+    @staticmethod
+    def document(*values):
+        return ' '.join(value for value in values if value)
+
+    def search(self, queryset, terms):
+        ids = self.inverted_index.search(terms)
+        return queryset.filter(pk__in=self.ids_expression(queryset.db, ids))
+
+    def ids_expression(self, alias, ids):
+        """
+        Список идентификаторов для pk__in.
+
+        Тысячи отдельных параметров дорого связывать и разбирать, поэтому
+        большой список передается одним JSON-параметром в SQLite
+        и одним массивом в PostgreSQL.
+        """
+        if len(ids) < self.bulk_ids_threshold:
+            return list(ids)
+        vendor = connections[alias].vendor
+        if vendor == 'sqlite':
+            return RawSQL('SELECT value FROM json_each(%s)', [json.dumps(list(ids))])
+        if vendor == 'postgresql':
+            return RawSQL('SELECT unnest(%s::bigint[])', [list(ids)])
+        return list(ids)
+
+    def index(self, ads):
+        index = self.inverted_index
+        for ad in ads:
+            index.add(ad.pk, self.document(*(getattr(ad, field) for field in self.fields)))
+        self._maybe_compact()
+
+    def remove(self, pks):
+        index = self.inverted_index
+        for pk in pks:
+            index.discard(pk)
+        self._maybe_compact()
+
+    def rebuild(self, queryset=None):
+        from callboard.models import Ad
+
+        if queryset is None:
+            queryset = Ad.objects.all()
+        started = time.time()
+        postings = defaultdict(list)
+        rows = queryset.order_by('pk').values_list('pk', *self.fields).iterator(chunk_size=2000)
+        for pk, *values in rows:
+            for term in set(tokenize(self.document(*values))):
+                postings[term].append(pk)
+        with self.lock:
+            self._install(IndexSegment.encode(postings), started)
+
+    def save(self):
+        """Перестройка индекса из базы и сохранение на диск"""
+        self.rebuild()
+
+    def _maybe_compact(self):
+        if len(self._index) < self.compact_threshold:
+            return
+        now = time.monotonic()
+        if self._rebuild_requested_at is None or now - self._rebuild_requested_at >= self.rebuild_request_interval:
+            from callboard.tasks import rebuild_search_index
+
+            self._rebuild_requested_at = now
+            rebuild_search_index.delay()
+
+    def _install(self, data, started):
+        directory = os.path.dirname(os.path.abspath(self.path))
+        os.makedirs(directory, exist_ok=True)
+        # Запись во временный файл и атомарная замена: читатели не видят частичный индекс
+        with tempfile.NamedTemporaryFile(dir=directory, delete=False) as file:
+            file.write(data)
+        os.utime(file.name, (started, started))
+        os.replace(file.name, self.path)
+        self._load()
+
+    def _load(self):
+        with open(self.path, 'rb') as file:
+            stat = os.fstat(file.fileno())
+            segment = IndexSegment(mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ))
+        if self._index is None:
+            self._index = InvertedIndex(segment)
+        else:
+            self._index = self._index.with_segment(segment, stat.st_mtime)
+        self._file = (stat.st_ino, stat.st_mtime_ns)
+        self._checked_at = time.monotonic()
+
+    def _reload_if_changed(self):
+        with self.lock:
+            self._checked_at = time.monotonic()
+            try:
+                stat = os.stat(self.path)
+            except FileNotFoundError:
+                return
+            if (stat.st_ino, stat.st_mtime_ns) != self._file:
+                self._load()
@@ -1,23 +1,198 @@
+from functools import lru_cache
+from operator import itemgetter
+
+from django.core.exceptions import FieldDoesNotExist, ImproperlyConfigured
+from django.core.files.storage import default_storage
+from django.db import models, transaction
+from django.db.models import Prefetch
 from rest_framework import serializers
+from rest_framework.relations import PKOnlyObject, PrimaryKeyRelatedField
+
+from callboard.images import file_hash, image_format, store_original
+from callboard.models import Ad, AdImage, AuthorStats, Feedback, ImageFile
+from config import metrics as request_metrics
+
+
+class StorageURLField(serializers.Field):
+    """URL файла в хранилище по имени или FieldFile; пустое имя - None"""
+
+    def __init__(self, **kwargs):
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
 
-from callboard.models import Ad, Feedback
+    def to_representation(self, value):
+        name = str(value)
+        return default_storage.url(name) if name else None
 
 
 class AdSerializer(serializers.ModelSerializer):
+    thumbnail = StorageURLField()
+
     class Meta:
         model = Ad
-        fields = ('id', 'title', 'price', 'description', 'author')
+        fields = ('id', 'title', 'price', 'description', 'author', 'thumbnail')
+        read_only_fields = ('author',)
+
+    def update(self, instance, validated_data):
+        """
+        Запись только переданных полей.
+
+        feedback_count меняют UPDATE с F(), а thumbnail - задача Celery,
+        поэтому save() всех полей затер бы их изменения, сделанные после
+        загрузки объекта.
+        """
+        for field, value in validated_data.items():
+            setattr(instance, field, value)
+        instance.save(update_fields=list(validated_data))
+        return instance
+
+
+class AdImageSerializer(serializers.ModelSerializer):
+    """
+    Загрузка изображения объявления.
+
+    Оригинал проверяется по заголовку файла и сохраняется по хешу
+    содержимого; thumbnail и webp пусты, пока задача Celery их не построит.
+    """
+
+    image = serializers.FileField(write_only=True)
+    original = StorageURLField()
+    thumbnail = StorageURLField()
+    webp = StorageURLField()
+
+    class Meta:
+        model = AdImage
+        fields = ('id', 'image', 'original', 'thumbnail', 'webp')
+
+    def validate_image(self, file):
+        self.image_format = image_format(file)
+        if self.image_format is None:
+            raise serializers.ValidationError('Загрузите изображение JPEG, PNG, WebP или GIF.')
+        return file
+
+    def create(self, validated_data):
+        file = validated_data.pop('image')
+        digest = file_hash(file)
+        with transaction.atomic():
+            ImageFile.lock(digest)
+            name = store_original(file, digest, self.image_format)
+            return AdImage.objects.create(sha256=digest, original=name, **validated_data)
 
 
 class FeedbackSerializer(serializers.ModelSerializer):
     class Meta:
         model = Feedback
         fields = ('id', 'author', 'ad', 'text')
+        read_only_fields = ('author', 'ad')
+
+
+class AuthorStatsSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = AuthorStats
+        fields = ('user', 'ads_count', 'feedback_received', 'feedback_written', 'last_ad_at')
 
 
 class AdDetailSerializer(serializers.ModelSerializer):
-    feedback = FeedbackSerializer(source='ad', read_only=True, many=True)
+    """
+    Объявление с изображениями, количеством отзывов и последними feedback_limit отзывами.
+
+    Объекты нужно выбирать через get_queryset(): отзывы и изображения загружаются
+    дополнительным запросом каждые для всех объявлений, а количество хранится в самом
+    объявлении, поэтому число запросов не зависит от числа отзывов.
+    """
+
+    feedback_limit = 10
+
+    feedback = FeedbackSerializer(source='latest_feedback', read_only=True, many=True)
+    thumbnail = StorageURLField()
+    images = AdImageSerializer(read_only=True, many=True)
 
     class Meta:
-        model = Feedback
-        fields = ('id', 'author', 'ad', 'text')
+        model = Ad
+        fields = ('id', 'title', 'price', 'description', 'author', 'thumbnail', 'images', 'feedback_count', 'feedback')
+        read_only_fields = ('author', 'feedback_count')
+
+    @classmethod
+    def get_queryset(cls):
+        latest = Feedback.objects.order_by('-created_at', '-id')[:cls.feedback_limit]
+        return Ad.objects.prefetch_related(
+            Prefetch('feedback_ad', queryset=latest, to_attr='latest_feedback'),
+            'images',
+        )
+
+
+class ValuesMapper:
+    """
+    Быстрое чтение для ModelSerializer: строки из .values() вместо объектов.
+
+    Поля сериализатора один раз сопоставляются со столбцами модели, после чего
+    строка переводится в словарь без создания экземпляров модели и без вызова
+    get_attribute() для каждого поля. Результат совпадает с serializer.data.
+    Поддерживаются только поля модели и первичные ключи связей без source
+    через точку; для остальных полей выбрасывается ImproperlyConfigured.
+    """
+
+    # Поля, для которых значение из базы уже совпадает с представлением DRF
+    identity_types = (
+        (serializers.IntegerField, (models.IntegerField, models.AutoField)),
+        (serializers.CharField, (models.CharField, models.TextField)),
+        (serializers.BooleanField, (models.BooleanField,)),
+    )
+
+    def __init__(self, serializer_class):
+        self.serializer_class = serializer_class
+        model = serializer_class.Meta.model
+        names, columns, converters = [], [], []
+        for field in serializer_class()._readable_fields:
+            model_field = self.get_model_field(model, field)
+            names.append(field.field_name)
+            columns.append(model_field.attname)
+            converters.append(self.get_converter(field, model_field))
+        self.names = tuple(names)
+        self.columns = tuple(columns)
+        self.getter = itemgetter(*self.columns) if len(self.columns) > 1 else lambda row: (row[self.columns[0]],)
+        # Если преобразовывать нечего, строка собирается одним zip()
+        self.converters = tuple(converters) if any(converters) else None
+
+    def get_model_field(self, model, field):
+        name = f'{self.serializer_class.__name__}.{field.field_name}'
+        if '.' in field.source or field.source == '*':
+            raise ImproperlyConfigured(f'{name}: source не поддерживается')
+        try:
+            model_field = model._meta.get_field(field.source)
+        except FieldDoesNotExist:
+            raise ImproperlyConfigured(f'{name}: не поле модели')
+        if model_field.is_relation and not (model_field.concrete and isinstance(field, PrimaryKeyRelatedField)):
+            raise ImproperlyConfigured(f'{name}: поддерживаются только связи по pk')
+        return model_field
+
+    def get_converter(self, field, model_field):
+        """Функция преобразования значения столбца или None, если значение выводится как есть"""
+        if isinstance(field, PrimaryKeyRelatedField):
+            if field.pk_field is None:
+                return None
+            return lambda value: field.to_representation(PKOnlyObject(value))
+        for field_class, model_field_classes in self.identity_types:
+            if type(field) is field_class and isinstance(model_field, model_field_classes):
+                return None
+        return field.to_representation
+
+    def to_representation(self, row):
+        """Словарь строки .values(*columns) в том же виде, что serializer.data"""
+        values = self.getter(row)
+        if self.converters is None:
+            return dict(zip(self.names, values))
+        return {
+            name: None if value is None else (converter(value) if converter else value)
+            for name, converter, value in zip(self.names, self.converters, values)
+        }
+
+    def map(self, rows):
+        with request_metrics.serialization():
+            return [self.to_representation(row) for row in rows]
+
+
+@lru_cache(maxsize=None)
+def values_mapper(serializer_class):
+    """ValuesMapper сериализатора, собранный один раз на процесс"""
+    return ValuesMapper(serializer_class)
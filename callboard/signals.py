@@ -0,0 +1,240 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.db import transaction
+from django.db.models import DEFERRED, Case, F, OuterRef, Q, Subquery, Value, When
+from django.db.models.functions import Coalesce, Greatest
+from django.db.models.signals import post_delete, post_init, post_save, pre_delete
+from django.dispatch import receiver
+
+from callboard.cache import ad_cache, ad_detail_cache, feedback_cache, invalidate
+from callboard.images import delete_files
+from callboard.models import Ad, AdImage, AuthorStats, Feedback, ImageFile
+from callboard.search import get_search_backend
+from users.models import User
+
+SEARCH_FIELDS = {'title', 'description'}
+
+
+def ads_saved(ads, fields=None):
+    """
+    Обновление поиска и кешей после сохранения объявлений.
+
+    Вызывается из сигналов и напрямую после bulk_create/bulk_update,
+    которые сигналы не отправляют.
+    """
+    ads = list(ads)
+    invalidate('ads')
+    ad_cache.invalidate(*(ad.pk for ad in ads))
+    ad_detail_cache.invalidate(*(ad.pk for ad in ads))
+    backend = get_search_backend()
+    if backend.requires_indexing and (fields is None or SEARCH_FIELDS & set(fields)):
+        transaction.on_commit(lambda: backend.index(ads))
+
+
+def ads_deleted(pks):
+    """Обновление поиска и кешей после удаления объявлений"""
+    pks = list(pks)
+    invalidate('ads')
+    ad_cache.invalidate(*pks)
+    ad_detail_cache.invalidate(*pks)
+    backend = get_search_backend()
+    if backend.requires_indexing:
+        transaction.on_commit(lambda: backend.remove(pks))
+
+
+_pending_stats = ContextVar('pending_author_stats', default=None)
+
+
+@contextmanager
+def batched_author_stats():
+    """
+    Накопление изменений статистики авторов объявлений внутри блока.
+
+    При выходе без исключения изменения записываются одним UPDATE на автора,
+    поэтому массовое удаление не выполняет UPDATE на каждое объявление.
+    """
+    pending = {}
+    token = _pending_stats.set(pending)
+    try:
+        yield
+    finally:
+        _pending_stats.reset(token)
+    for user_id, (last_ad_at, deltas) in pending.items():
+        change_author_stats(user_id, last_ad_at, **deltas)
+
+
+def change_author_stats(user_id, last_ad_at=None, **deltas):
+    """Атомарное изменение счетчиков статистики автора без чтения строки"""
+    if user_id is None:
+        return
+    pending = _pending_stats.get()
+    if pending is not None:
+        pending_last_ad_at, pending_deltas = pending.get(user_id, (None, {}))
+        for field, delta in deltas.items():
+            pending_deltas[field] = pending_deltas.get(field, 0) + delta
+        if pending_last_ad_at is not None:
+            last_ad_at = pending_last_ad_at if last_ad_at is None else max(last_ad_at, pending_last_ad_at)
+        pending[user_id] = (last_ad_at, pending_deltas)
+        return
+    changes = {field: Greatest(F(field) + delta, 0) for field, delta in deltas.items() if delta}
+    if last_ad_at is not None:
+        # Greatest в SQLite возвращает NULL, если один из аргументов NULL
+        changes['last_ad_at'] = Coalesce(Greatest(F('last_ad_at'), Value(last_ad_at)), Value(last_ad_at))
+    if changes:
+        AuthorStats.objects.filter(user_id=user_id).update(**changes)
+
+
+def change_feedback_stats(ad_id, author_id, delta):
+    """
+    Изменение feedback_received автора объявления и feedback_written автора отзыва.
+
+    Обе строки меняются одним UPDATE, автор объявления берется подзапросом.
+    """
+    condition, changes = Q(), {}
+    if author_id is not None:
+        condition |= Q(user_id=author_id)
+        written = Case(When(user_id=author_id, then=Value(delta)), default=Value(0))
+        changes['feedback_written'] = Greatest(F('feedback_written') + written, 0)
+    if ad_id is not None:
+        ad_author_id = Subquery(Ad.objects.filter(pk=ad_id).values('author_id')[:1])
+        condition |= Q(user_id=ad_author_id)
+        received = Case(When(user_id=ad_author_id, then=Value(delta)), default=Value(0))
+        changes['feedback_received'] = Greatest(F('feedback_received') + received, 0)
+    if changes:
+        AuthorStats.objects.filter(condition).update(**changes)
+
+
+def ads_created(ads):
+    """Статистика авторов после создания объявлений, в том числе через bulk_create"""
+    by_author = {}
+    for ad in ads:
+        count, last_ad_at = by_author.get(ad.author_id, (0, ad.created_at))
+        by_author[ad.author_id] = (count + 1, max(last_ad_at, ad.created_at))
+    for author_id, (count, last_ad_at) in by_author.items():
+        change_author_stats(author_id, last_ad_at, ads_count=count)
+
+
+def changed(instance, attname):
+    """Изменилось ли поле с момента загрузки; неподгруженное (отложенное) поле считается неизменным"""
+    initial = instance._initial[attname]
+    return initial is not DEFERRED and getattr(instance, attname) != initial
+
+
+def remember_initial(instance, *attnames):
+    instance._initial = {attname: instance.__dict__.get(attname, DEFERRED) for attname in attnames}
+
+
+@receiver(post_init, sender=Ad)
+def remember_ad_author(sender, instance, **kwargs):
+    remember_initial(instance, 'author_id')
+
+
+@receiver(post_save, sender=Ad)
+def ad_saved(sender, instance, created, update_fields=None, **kwargs):
+    ads_saved([instance], update_fields)
+    if created:
+        ads_created([instance])
+    elif changed(instance, 'author_id'):
+        feedback_count = instance.feedback_count
+        change_author_stats(instance._initial['author_id'], ads_count=-1, feedback_received=-feedback_count)
+        change_author_stats(instance.author_id, instance.created_at, ads_count=1, feedback_received=feedback_count)
+    remember_initial(instance, 'author_id')
+
+
+@receiver(post_delete, sender=Ad)
+def ad_deleted(sender, instance, **kwargs):
+    ads_deleted([instance.pk])
+    # Отзывы удаленного объявления остаются без объявления и больше не считаются полученными
+    change_author_stats(instance.author_id, ads_count=-1, feedback_received=-instance.feedback_count)
+
+
+@receiver(pre_delete, sender=Ad)
+def invalidate_ad_feedback_objects(sender, instance, **kwargs):
+    """Удаление объявления обнуляет ad у его отзывов без сигналов"""
+    feedback_cache.invalidate_all()
+
+
+def ad_images_changed(ad_id):
+    """Обложка объявления - миниатюра первого обработанного изображения; сброс кешей объявления"""
+    cover = AdImage.objects.filter(ad=OuterRef('pk')).exclude(thumbnail='').order_by('pk').values('thumbnail')[:1]
+    Ad.objects.filter(pk=ad_id).update(thumbnail=Coalesce(Subquery(cover), Value('')))
+    invalidate('ads')
+    ad_cache.invalidate(ad_id)
+    ad_detail_cache.invalidate(ad_id)
+
+
+def delete_unused_image_files(digest, names):
+    """Удаление файлов изображения, если на тот же оригинал больше нет ссылок"""
+    with transaction.atomic():
+        ImageFile.lock(digest)
+        if not AdImage.objects.filter(sha256=digest).exists():
+            delete_files(names)
+            ImageFile.objects.filter(sha256=digest).delete()
+
+
+@receiver(post_delete, sender=AdImage)
+def ad_image_deleted(sender, instance, origin=None, **kwargs):
+    # При удалении самого объявления обложку пересчитывать не нужно
+    if getattr(origin, 'model', type(origin)) is not Ad:
+        ad_images_changed(instance.ad_id)
+    names = (instance.original.name, instance.thumbnail.name, instance.webp.name)
+    transaction.on_commit(lambda: delete_unused_image_files(instance.sha256, names))
+
+
+def change_feedback_count(ad_id, delta):
+    """Атомарное изменение счетчика отзывов без чтения объявления"""
+    if ad_id is not None:
+        Ad.objects.filter(pk=ad_id).update(feedback_count=Greatest(F('feedback_count') + delta, 0))
+        ad_detail_cache.invalidate(ad_id)
+
+
+@receiver(post_init, sender=Feedback)
+def remember_feedback_ad(sender, instance, **kwargs):
+    remember_initial(instance, 'ad_id', 'author_id')
+
+
+@receiver(post_save, sender=Feedback)
+def feedback_saved(sender, instance, created, **kwargs):
+    feedback_cache.invalidate(instance.pk)
+    if created:
+        change_feedback_count(instance.ad_id, 1)
+        change_feedback_stats(instance.ad_id, instance.author_id, 1)
+    else:
+        if changed(instance, 'ad_id'):
+            change_feedback_count(instance._initial['ad_id'], -1)
+            change_feedback_count(instance.ad_id, 1)
+            change_feedback_stats(instance._initial['ad_id'], None, -1)
+            change_feedback_stats(instance.ad_id, None, 1)
+        else:
+            ad_detail_cache.invalidate(instance.ad_id)
+        if changed(instance, 'author_id'):
+            change_feedback_stats(None, instance._initial['author_id'], -1)
+            change_feedback_stats(None, instance.author_id, 1)
+    remember_initial(instance, 'ad_id', 'author_id')
+
+
+@receiver(post_delete, sender=Feedback)
+def feedback_deleted(sender, instance, **kwargs):
+    feedback_cache.invalidate(instance.pk)
+    if instance.ad_id is None:
+        # Отзыв без объявления: меняется только автор отзыва, в batched_author_stats() - одним UPDATE
+        change_author_stats(instance.author_id, feedback_written=-1)
+    else:
+        change_feedback_count(instance.ad_id, -1)
+        change_feedback_stats(instance.ad_id, instance.author_id, -1)
+
+
+@receiver(post_save, sender=User)
+def create_author_stats(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        AuthorStats.objects.create(user=instance)
+
+
+@receiver(post_delete, sender=User)
+def invalidate_author_objects(sender, instance, **kwargs):
+    """Удаление пользователя обнуляет author у его объявлений и отзывов без сигналов"""
+    invalidate('ads')
+    ad_cache.invalidate_all()
+    ad_detail_cache.invalidate_all()
+    feedback_cache.invalidate_all()
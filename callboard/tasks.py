@@ -0,0 +1,70 @@
+from datetime import timedelta
+
+from celery import shared_task
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+
+from callboard.images import make_variants
+from callboard.models import Ad, AdImage, AuthorStats, Feedback
+from callboard.search import get_search_backend
+from callboard.signals import ad_images_changed, batched_author_stats
+from config.housekeeping import delete_rows, run_in_batches
+
+
+@shared_task
+def reconcile_author_stats():
+    """Пересчет статистики авторов и исправление расхождений со счетчиками"""
+    return AuthorStats.reconcile()
+
+
+@shared_task
+def rebuild_search_index():
+    """Перестройка собственного индекса поискового движка из базы; процессы сервера подхватывают новый файл"""
+    backend = get_search_backend()
+    if backend.requires_indexing:
+        backend.rebuild()
+
+
+@shared_task(acks_late=True)
+def make_ad_image_variants(image_id):
+    """Миниатюра и WebP изображения объявления; обложка объявления обновляется после обработки"""
+    image = AdImage.objects.filter(pk=image_id).first()
+    if image is None:
+        return None
+    variants = make_variants(image)
+    if variants is None:
+        return None
+    AdImage.objects.filter(pk=image_id).update(**variants)
+    ad_images_changed(image.ad_id)
+    return variants
+
+
+def delete_with_stats(queryset):
+    """Удаление пачки с одним UPDATE статистики на автора"""
+    with batched_author_stats():
+        return delete_rows(queryset)
+
+
+@shared_task
+def delete_orphaned_feedback():
+    """Удаление отзывов удаленных объявлений старше ORPHAN_RETENTION_DAYS"""
+    created_before = timezone.now() - timedelta(days=settings.ORPHAN_RETENTION_DAYS)
+    queryset = Feedback.objects.filter(ad__isnull=True, created_at__lt=created_before)
+    return run_in_batches('delete_orphaned_feedback', queryset, delete_with_stats)
+
+
+@shared_task
+def delete_stale_ads():
+    """
+    Удаление устаревших объявлений.
+
+    Устаревшими считаются объявления удаленных пользователей старше
+    ORPHAN_RETENTION_DAYS и, если задан AD_RETENTION_DAYS, все объявления старше него.
+    Их отзывы остаются без объявления и удаляются delete_orphaned_feedback.
+    """
+    now = timezone.now()
+    condition = Q(author__isnull=True, created_at__lt=now - timedelta(days=settings.ORPHAN_RETENTION_DAYS))
+    if settings.AD_RETENTION_DAYS:
+        condition |= Q(created_at__lt=now - timedelta(days=settings.AD_RETENTION_DAYS))
+    return run_in_batches('delete_stale_ads', Ad.objects.filter(condition), delete_with_stats)
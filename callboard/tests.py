@@ -1,9 +1,67 @@
+import csv
+import json
+import os
+import re
+import shutil
+import tempfile
+import time
+import uuid
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from decimal import Decimal
+from io import BytesIO
+from unittest import mock, skipUnless
+
+import psycopg2
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import ImproperlyConfigured
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.db import DatabaseError, OperationalError, connection, connections
+from django.test import AsyncClient, RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.utils import timezone
+from django.utils.translation import gettext_lazy
+from PIL import Image
+from psycopg2 import pool
 from rest_framework import status
-from rest_framework.test import APIClient, APITestCase
+from rest_framework.renderers import JSONRenderer
+from rest_framework.test import APIClient, APIRequestFactory, APITestCase, force_authenticate
 
-from callboard.models import (Ad, Feedback)
+from callboard import benchmark, serializers, signals
+from callboard.cache import ad_cache
+from callboard.images import content_name, variant_name
+from callboard.models import (Ad, AdImage, AuthorStats, Feedback, ImageFile)
+from callboard.paginators import CustomPagination, KeysetPagination
+from callboard.renderers import ORJSONRenderer
+from callboard.tasks import delete_orphaned_feedback, delete_stale_ads, reconcile_author_stats
+from callboard.serializers import (
+    AdDetailSerializer,
+    AdSerializer,
+    FeedbackSerializer,
+    ValuesMapper,
+    values_mapper,
+)
+from callboard.search import get_search_backend
+from callboard.views import (
+    AdListAPIView,
+    AdUpdateAPIView,
+    FeedbackListAPIView,
+    UsersAdListAPIView,
+    UsersFeedbackListAPIView,
+)
+from callboard.search.inverted_index import IndexSegment, InvertedIndex, InvertedIndexSearchBackend
+from config.housekeeping import pk_range_batches
+from config import metrics as request_metrics
+from config.db import ConnectionMetricsMixin, reset_metrics, start_metrics
+from config.db.pooled.base import DatabaseWrapper as PooledDatabaseWrapper
+from config.routers import PIN_COOKIE, ReplicaHealthMixin, ReplicaRouter, mark_down_on_error, replica_reads, replicas
+from users.authentication import UserRefreshToken, revocations
 from users.models import User
+from users.permissions import IsAdmin, IsAuthor, queryset_condition
 
 
 class AdTestCase(APITestCase):
@@ -52,6 +110,7 @@ class AdTestCase(APITestCase):
                     'price': self.ad.price,
                     'description': self.ad.description,
                     'author': self.ad.author.id,
+                    'thumbnail': None,
                 }
             ],
         }
@@ -83,6 +142,24 @@ class AdTestCase(APITestCase):
             data['description'], 'Тестовое описание объявления №1 обновлено'
         )
 
+    def test_ad_update_keeps_concurrent_changes(self):
+        """Изменение не затирает счетчик отзывов и обложку, измененные после загрузки объявления"""
+        url = reverse('callboard:ad_update', args=(self.ad.pk,))
+        get_object = AdUpdateAPIView.get_object
+
+        def get_object_then_change(view):
+            ad = get_object(view)
+            Feedback.objects.create(text='Отзыв', ad=self.ad, author=self.user)
+            Ad.objects.filter(pk=self.ad.pk).update(thumbnail='ads/cover.webp')
+            return ad
+
+        with mock.patch.object(AdUpdateAPIView, 'get_object', get_object_then_change):
+            response = self.client.patch(url, {'title': 'Новое'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.ad.refresh_from_db()
+        self.assertEqual((self.ad.title, self.ad.feedback_count), ('Новое', 1))
+        self.assertEqual(self.ad.thumbnail.name, 'ads/cover.webp')
+
     def test_ad_delete(self):
         """Проверка удаления объявления"""
         url = reverse('callboard:ad_delete', args=(self.ad.pk,))
@@ -176,3 +253,1317 @@ class FeedbackTestCase(APITestCase):
         response = self.client.delete(url)
         self.assertEqual(response.status_code, status.HTTP_204_NO_CONTENT)
         self.assertEqual(Ad.objects.count(), 1)
+
+
+class KeysetPaginationTestCase(APITestCase):
+    """Проверка курсорной пагинации списка объявлений"""
+
+    def setUp(self):
+        self.user = User.objects.create(email='test@example.ru')
+        self.client = APIClient()
+        self.client.force_authenticate(user=self.user)
+        ads = Ad.objects.bulk_create(
+            Ad(title=f'Объявление {i}', price=i, author=self.user) for i in range(7)
+        )
+        # Одинаковое время создания проверяет уникальность позиции курсора
+        Ad.objects.filter(pk__in=[ad.pk for ad in ads[:4]]).update(created_at=ads[0].created_at)
+        self.expected = list(Ad.objects.order_by('-created_at', '-id').values_list('pk', flat=True))
+
+    def test_cursor_walks_all_ads(self):
+        """Курсорный режим отдает все объявления без дублей и без count"""
+        url = reverse('callboard:ad_list') + '?pagination=cursor&page_size=3'
+        seen = []
+        while url:
+            data = self.client.get(url).json()
+            self.assertNotIn('count', data)
+            seen.extend(item['id'] for item in data['results'])
+            url = data['next']
+        self.assertEqual(seen, self.expected)
+
+    def test_cursor_previous_link(self):
+        """Ссылка previous возвращает предыдущую страницу"""
+        url = reverse('callboard:ad_mylist') + '?pagination=cursor&page_size=3'
+        first = self.client.get(url).json()
+        second = self.client.get(first['next']).json()
+        back = self.client.get(second['previous']).json()
+        self.assertEqual(back['results'], first['results'])
+
+    def test_invalid_cursor(self):
+        """Некорректный курсор приводит к 404"""
+        url = reverse('callboard:ad_list') + '?cursor=invalid'
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+class AdSearchTestCase(APITestCase):
+    """Проверка поиска объявлений"""
+
+    def setUp(self):
+        self.user = User.objects.create(email='test@example.ru')
+        self.phone = Ad.objects.create(title='Телефон', description='Новый смартфон', author=self.user)
+        self.chair = Ad.objects.create(title='Стул', description='Деревянный стул', author=self.user)
+
+    def search(self, text):
+        response = self.client.get(reverse('callboard:ad_list'), {'search': text})
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [item['id'] for item in response.json()['results']]
+
+    def test_search_by_title_and_description(self):
+        """Поиск находит объявления по названию и описанию"""
+        self.assertEqual(self.search('Телефон'), [self.phone.pk])
+        self.assertEqual(self.search('Деревянный'), [self.chair.pk])
+        self.assertEqual(self.search('самокат'), [])
+
+    @skipUnless(connection.vendor == 'postgresql', 'Полнотекстовый поиск доступен только в PostgreSQL')
+    def test_search_morphology_and_partial_words(self):
+        """Поиск учитывает словоформы и неполные слова"""
+        self.assertEqual(self.search('телефоны'), [self.phone.pk])
+        self.assertEqual(self.search('смартф'), [self.phone.pk])
+
+
+class InvertedIndexTestCase(APITestCase):
+    """Проверка поиска по инвертированному индексу"""
+
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, 'index.bin')
+        settings_override = override_settings(
+            SEARCH_BACKEND='callboard.search.inverted_index.InvertedIndexSearchBackend',
+            SEARCH_INDEX_PATH=self.path,
+        )
+        settings_override.enable()
+        self.addCleanup(settings_override.disable)
+        self.user = User.objects.create(email='test@example.ru')
+        self.phone = Ad.objects.create(title='Телефон', description='Новый смартфон', author=self.user)
+
+    def search(self, text):
+        response = self.client.get(reverse('callboard:ad_list'), {'search': text})
+        return [item['id'] for item in response.json()['results']]
+
+    def test_segment_roundtrip(self):
+        """Сегмент читается из файла в том же виде, в котором был записан"""
+        with open(self.path, 'wb') as file:
+            file.write(IndexSegment.encode({'стул': [3, 1], 'стол': [2]}))
+        segment = IndexSegment.load(self.path)
+        self.assertEqual(dict((term, list(ids)) for term, ids in segment.items()), {'стол': [2], 'стул': [1, 3]})
+        index = InvertedIndex(segment)
+        index.add(4, 'Стулья детские')
+        index.discard(1)
+        self.assertEqual(index.search(['сту']), {3, 4})
+
+    def test_index_follows_ad_changes(self):
+        """Индекс обновляется при создании, изменении и удалении объявлений"""
+        self.assertEqual(self.search('телеф'), [self.phone.pk])
+        with self.captureOnCommitCallbacks(execute=True):
+            chair = Ad.objects.create(title='Стул', description='Деревянный', author=self.user)
+        self.assertEqual(self.search('деревянный'), [chair.pk])
+        with self.captureOnCommitCallbacks(execute=True):
+            chair.title = 'Кресло'
+            chair.save()
+        self.assertEqual(self.search('стул'), [])
+        self.assertEqual(self.search('кресло деревянный'), [chair.pk])
+        with self.captureOnCommitCallbacks(execute=True):
+            chair.delete()
+        self.assertEqual(self.search('кресло'), [])
+
+    def test_index_persisted(self):
+        """Сохраненный индекс загружается новым экземпляром движка"""
+        with self.captureOnCommitCallbacks(execute=True):
+            Ad.objects.create(title='Самокат', author=self.user)
+        get_search_backend().save()
+        get_search_backend.cache_clear()
+        self.assertEqual(len(get_search_backend().inverted_index.search(['самокат'])), 1)
+
+    def test_compaction_enqueued(self):
+        """После compact_threshold изменений перестройка ставится в очередь, а не выполняется в запросе"""
+        backend = InvertedIndexSearchBackend(self.path)
+        backend.compact_threshold = 3
+        scooter = Ad.objects.create(title='Самокат', author=self.user)
+        with mock.patch('callboard.tasks.rebuild_search_index.delay') as delay, \
+                mock.patch.object(backend, 'rebuild', wraps=backend.rebuild) as rebuild:
+            backend.inverted_index
+            backend.index([scooter])
+            delay.assert_not_called()
+            backend.index([self.phone])
+            backend.remove([scooter.pk])
+        delay.assert_called_once_with()
+        rebuild.assert_called_once_with()
+
+    def test_processes_share_rebuilt_index(self):
+        """Перестройка в одном процессе видна другим и не теряет их более поздние изменения"""
+        first, second = InvertedIndexSearchBackend(self.path), InvertedIndexSearchBackend(self.path)
+        first.rebuild()
+        second.reload_interval = 0
+        scooter = Ad.objects.create(title='Самокат', author=self.user)
+        first.index([scooter])
+        self.assertEqual(second.inverted_index.search(['самокат']), set())
+
+        first.save()
+        self.assertEqual(second.inverted_index.search(['самокат']), {scooter.pk})
+        # Изменение после начала перестройки остается в дельте второго процесса
+        second.inverted_index.add(self.phone.pk, 'Планшет')
+        with mock.patch('callboard.search.inverted_index.time.time', return_value=0):
+            first.save()
+        self.assertEqual(second.inverted_index.search(['планшет']), {self.phone.pk})
+        self.assertEqual(second.inverted_index.search(['телефон']), set())
+
+
+@override_settings(RESPONSE_CACHE_TIMEOUT=60)
+class AdListCacheTestCase(APITestCase):
+    """Проверка кеширования списка объявлений"""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(email='test@example.ru')
+        self.ad = Ad.objects.create(title='Телефон', price=100, author=self.user)
+        self.url = reverse('callboard:ad_list')
+
+    def test_cached_response_served_without_queries(self):
+        """Повторный запрос отдается из кеша без обращения к базе"""
+        first = self.client.get(self.url, {'page_size': 2})
+        with self.assertNumQueries(0):
+            second = self.client.get(self.url, {'page_size': 2})
+        self.assertEqual(first.json(), second.json())
+        self.assertEqual(first['ETag'], second['ETag'])
+
+    def test_ad_changes_invalidate_cache(self):
+        """Изменение объявления сразу меняет закешированный список"""
+        self.client.get(self.url)
+        self.ad.title = 'Смартфон'
+        self.ad.save()
+        self.assertEqual(self.client.get(self.url).json()['results'][0]['title'], 'Смартфон')
+        Ad.objects.create(title='Стул', author=self.user)
+        self.assertEqual(self.client.get(self.url).json()['count'], 2)
+
+    def test_not_modified(self):
+        """Совпадение If-None-Match дает ответ 304 без тела"""
+        etag = self.client.get(self.url)['ETag']
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response.content, b'')
+        self.assertEqual(response['ETag'], etag)
+
+    def test_waits_for_concurrent_fill(self):
+        """При занятой блокировке запрос ждет ответ, вычисленный другим запросом"""
+        key = 'callboard:list:test'
+        entry = ('"etag"', {'results': []})
+        cache.add(f'{key}:lock', 1)
+        with mock.patch('callboard.cache.time.sleep', lambda interval: cache.set(key, entry)):
+            with self.assertNumQueries(0):
+                self.assertEqual(AdListAPIView().fill_list_cache(key, 60, None), entry)
+
+
+@override_settings(OBJECT_CACHE_TIMEOUT=300)
+class ObjectCacheTestCase(APITestCase):
+    """Проверка кеша объявлений и отзывов"""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(email='test@example.ru')
+        self.client.force_authenticate(user=self.user)
+        self.ads = [Ad.objects.create(title=f'Объявление {i}', author=self.user) for i in range(3)]
+
+    def test_retrieve_read_through(self):
+        """Повторный просмотр объявления не обращается к базе, изменение сбрасывает кеш"""
+        ad = self.ads[0]
+        url = reverse('callboard:ad_retrieve', args=(ad.pk,))
+        self.client.get(url)
+        with self.assertNumQueries(0):
+            self.assertEqual(self.client.get(url).json()['title'], ad.title)
+        self.client.patch(reverse('callboard:ad_update', args=(ad.pk,)), {'title': 'Новое'}, format='json')
+        self.assertEqual(self.client.get(url).json()['title'], 'Новое')
+        missing = reverse('callboard:ad_retrieve', args=(ad.pk + 100,))
+        self.assertEqual(self.client.get(missing).status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_get_many_loads_only_missing(self):
+        """get_many догружает отсутствующие в кеше объекты одним запросом"""
+        pks = [ad.pk for ad in self.ads]
+        ad_cache.get(pks[0])
+        with self.assertNumQueries(1):
+            data = ad_cache.get_many(pks)
+        self.assertEqual([data[pk]['title'] for pk in pks], [ad.title for ad in self.ads])
+        with self.assertNumQueries(0):
+            ad_cache.get_many(pks)
+        self.assertEqual(ad_cache.stats(), {'hits': 4, 'misses': 3})
+
+    def test_user_list_filled_from_cache(self):
+        """Список объявлений пользователя берет тела объектов из кеша"""
+        url = reverse('callboard:ad_mylist')
+        first = self.client.get(url).json()
+        with self.assertNumQueries(2):
+            self.assertEqual(self.client.get(url).json(), first)
+
+    def test_stats_for_admin_only(self):
+        """Статистика кеша доступна только администратору"""
+        url = reverse('callboard:object_cache_stats')
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_403_FORBIDDEN)
+        self.user.role = 'admin'
+        self.user.save()
+        self.assertEqual(set(self.client.get(url).json()), {'ad', 'ad_detail', 'feedback'})
+
+
+class CreateQueryCountTestCase(APITestCase):
+    """Проверка количества запросов при создании объявлений и отзывов"""
+
+    def setUp(self):
+        self.user = User.objects.create(email='test@example.ru')
+        self.client.force_authenticate(user=self.user)
+        self.ad = Ad.objects.create(title='Телефон', author=self.user)
+
+    def test_create_ad_insert_and_stats_update(self):
+        """Создание объявления - один INSERT с автором и UPDATE статистики автора"""
+        # UPDATE счетчиков AuthorStats добавлен вместе со статистикой авторов (user-022)
+        with self.assertNumQueries(2):
+            response = self.client.post(reverse('callboard:ad_create'), {'title': 'Стул'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(response.json()['author'], self.user.pk)
+
+    def test_create_feedback_insert_and_counter_updates(self):
+        """Создание отзыва - проверка существования объявления, один INSERT, UPDATE счетчика и статистики"""
+        # UPDATE Ad.feedback_count добавлен с денормализованным счетчиком (user-015),
+        # UPDATE AuthorStats - со статистикой авторов (user-022)
+        url = reverse('callboard:feedback_create', args=(self.ad.pk,))
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(url, {'text': 'Отличный телефон'}, format='json')
+        statements = [query['sql'].split()[0] for query in queries if 'SAVEPOINT' not in query['sql']]
+        self.assertEqual(statements, ['SELECT', 'INSERT', 'UPDATE', 'UPDATE'])
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        feedback = Feedback.objects.get(pk=response.json()['id'])
+        self.assertEqual((feedback.author_id, feedback.ad_id), (self.user.pk, self.ad.pk))
+        self.ad.refresh_from_db()
+        self.assertEqual(self.ad.feedback_count, 1)
+
+    def test_create_feedback_missing_ad(self):
+        """Отзыв к несуществующему объявлению не создается"""
+        url = reverse('callboard:feedback_create', args=(self.ad.pk + 100,))
+        response = self.client.post(url, {'text': 'Отзыв'}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        self.assertFalse(Feedback.objects.exists())
+
+
+class AdBulkTestCase(APITestCase):
+    """Проверка массовых операций с объявлениями"""
+
+    def setUp(self):
+        self.user = User.objects.create(email='test@example.ru')
+        self.other = User.objects.create(email='other@example.ru')
+        self.client.force_authenticate(user=self.user)
+        self.url = reverse('callboard:ad_bulk')
+
+    def test_bulk_create_json_and_ndjson(self):
+        """Массовое создание из JSON-массива и из NDJSON"""
+        response = self.client.post(self.url, [{'title': 'Стул', 'price': 10}, {'title': 'Стол'}], format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        results = response.json()['results']
+        self.assertEqual([result['data']['title'] for result in results], ['Стул', 'Стол'])
+        body = '{"title": "Диван"}\n\n{"title": "Кресло", "price": 5}\n'
+        response = self.client.post(self.url, body, content_type='application/x-ndjson')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(Ad.objects.filter(author=self.user).count(), 4)
+
+    def test_bulk_create_invalid_item_writes_nothing(self):
+        """Ошибка в одном элементе отменяет всю операцию"""
+        response = self.client.post(self.url, [{'title': 'Стул'}, {'price': 'дорого'}], format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        results = response.json()['results']
+        self.assertEqual([result['status'] for result in results], [201, 400])
+        self.assertIn('price', results[1]['errors'])
+        self.assertFalse(Ad.objects.exists())
+
+    def test_bulk_update_checks_owner(self):
+        """Массовое изменение разрешено только автору или администратору"""
+        own = Ad.objects.create(title='Стул', author=self.user)
+        foreign = Ad.objects.create(title='Стол', author=self.other)
+        data = [{'id': own.pk, 'price': 1}, {'id': foreign.pk, 'price': 2}, {'id': foreign.pk + 100}]
+        response = self.client.patch(self.url, data, format='json')
+        self.assertEqual([result['status'] for result in response.json()['results']], [200, 403, 404])
+        own.refresh_from_db()
+        self.assertIsNone(own.price)
+
+        self.user.role = 'admin'
+        self.user.save()
+        response = self.client.patch(self.url, data[:2], format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(sorted(Ad.objects.values_list('price', flat=True)), [1, 2])
+
+    def test_bulk_delete_query_count_constant(self):
+        """Число запросов массового удаления не зависит от количества объявлений"""
+        def delete(count):
+            ads = Ad.objects.bulk_create(Ad(title='Стул', author=self.user) for _ in range(count))
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.delete(self.url, [ad.pk for ad in ads], format='json')
+            self.assertEqual(response.status_code, status.HTTP_200_OK)
+            return len(queries)
+
+        self.assertEqual(delete(2), delete(20))
+        self.assertFalse(Ad.objects.exists())
+
+
+class ExportTestCase(APITestCase):
+    """Проверка потоковой выгрузки объявлений и отзывов"""
+
+    def setUp(self):
+        self.user = User.objects.create(email='test@example.ru')
+        self.other = User.objects.create(email='other@example.ru')
+        self.client.force_authenticate(user=self.user)
+        self.ad = Ad.objects.create(title='Телефон', price=100, author=self.user)
+        Ad.objects.create(title='Стул, "деревянный"', price=10, author=self.other)
+        Feedback.objects.create(text='Отличный телефон', author=self.other, ad=self.ad)
+
+    def export(self, url, **params):
+        response = self.client.get(url, params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertTrue(response.streaming)
+        return b''.join(response.streaming_content).decode()
+
+    def test_export_ads_ndjson(self):
+        """Выгрузка объявлений в NDJSON с фильтром по автору"""
+        content = self.export(reverse('callboard:ad_export'), author=self.user.pk)
+        rows = [json.loads(line) for line in content.splitlines()]
+        self.assertEqual([(row['id'], row['title'], row['author']) for row in rows],
+                         [(self.ad.pk, 'Телефон', self.user.pk)])
+
+    def test_export_ads_csv(self):
+        """Выгрузка объявлений в CSV с фильтрами по дате и поиску"""
+        content = self.export(reverse('callboard:ad_export'), output='csv', search='Стул', created_after='2000-01-01')
+        rows = list(csv.reader(content.splitlines()))
+        self.assertEqual(rows[0], ['id', 'title', 'price', 'description', 'author', 'created_at'])
+        self.assertEqual([row[1] for row in rows[1:]], ['Стул, "деревянный"'])
+        self.assertEqual(self.export(reverse('callboard:ad_export'), created_before='2000-01-01'), '')
+
+    def test_export_feedback(self):
+        """Выгрузка отзывов объявления"""
+        content = self.export(reverse('callboard:feedback_export', args=(self.ad.pk,)))
+        self.assertEqual(json.loads(content)['text'], 'Отличный телефон')
+
+    def test_export_invalid_params(self):
+        """Неизвестный формат и неверная дата отклоняются"""
+        url = reverse('callboard:ad_export')
+        self.assertEqual(self.client.get(url, {'output': 'xml'}).status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(self.client.get(url, {'created_after': 'вчера'}).status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class QueryPlanTestCase(TestCase):
+    """Проверка, что запросы представлений не используют последовательное сканирование таблиц"""
+
+    users_count = 50
+    ads_per_user = 100
+    feedback_per_ad = 2
+
+    @classmethod
+    def setUpTestData(cls):
+        users = User.objects.bulk_create(
+            User(email=f'user{i}@example.ru') for i in range(cls.users_count)
+        )
+        ads = Ad.objects.bulk_create(
+            Ad(title=f'Объявление {i}', price=i, author=users[i % len(users)])
+            for i in range(cls.users_count * cls.ads_per_user)
+        )
+        Feedback.objects.bulk_create(
+            Feedback(text='Отзыв', ad=ad, author=users[(ad.pk + i) % len(users)])
+            for ad in ads for i in range(cls.feedback_per_ad)
+        )
+        cls.user = users[0]
+        cls.ad = ads[len(ads) // 2]
+        with connection.cursor() as cursor:
+            cursor.execute('ANALYZE')
+
+    def view_queryset(self, view_class, params=None, **kwargs):
+        request = APIRequestFactory().get('/', params)
+        force_authenticate(request, user=self.user)
+        view = view_class()
+        view.setup(request, **kwargs)
+        view.request = view.initialize_request(request, **kwargs)
+        view.format_kwarg = None
+        return view.filter_queryset(view.get_queryset())
+
+    def assertNoSequentialScan(self, queryset):
+        plan = queryset.explain()
+        if connection.vendor == 'postgresql':
+            self.assertNotIn('Seq Scan', plan, plan)
+            return
+        # В SQLite SEARCH - чтение диапазона индекса, SCAN - полный проход таблицы или индекса.
+        # Полный проход индекса допустим только для первой страницы без условий: он останавливается на LIMIT
+        top_n = not queryset.query.where and queryset.query.high_mark is not None
+        for line in plan.splitlines():
+            if 'SCAN' in line:
+                self.assertTrue(top_n and 'USING' in line and 'INDEX' in line, plan)
+            self.assertNotIn('TEMP B-TREE', line, plan)
+
+    def cursor_queryset(self, queryset):
+        """Запрос следующей страницы курсорной пагинации от позиции self.ad"""
+        paginator = KeysetPagination()
+        position = paginator._get_position_from_instance(self.ad, paginator.ordering)
+        return queryset.order_by(*paginator.ordering).filter(paginator._position_filter(position, 'lt'))
+
+    def test_ad_list_plans(self):
+        """Лента объявлений и объявления пользователя, постранично и по курсору"""
+        for view_class in (AdListAPIView, UsersAdListAPIView):
+            queryset = self.view_queryset(view_class)
+            with self.subTest(view=view_class.__name__):
+                self.assertNoSequentialScan(queryset[:25])
+                self.assertNoSequentialScan(self.cursor_queryset(queryset)[:25])
+
+    def test_feedback_list_plans(self):
+        """Отзывы объявления и отзывы пользователя"""
+        for view_class, kwargs in ((FeedbackListAPIView, {'pk': self.ad.pk}), (UsersFeedbackListAPIView, {})):
+            queryset = self.view_queryset(view_class, **kwargs)
+            with self.subTest(view=view_class.__name__):
+                self.assertNoSequentialScan(queryset[:25])
+                self.assertNoSequentialScan(self.cursor_queryset(queryset)[:25])
+
+    def assertIndexScan(self, queryset):
+        """Строки выбираются по индексу; сортировка отобранного диапазона допустима"""
+        plan = queryset.explain()
+        if connection.vendor == 'postgresql':
+            self.assertNotIn('Seq Scan', plan, plan)
+            return
+        for line in plan.splitlines():
+            if 'SCAN' in line:
+                self.assertIn('USING', line, plan)
+
+    def test_ad_filter_plans(self):
+        """Сочетания фильтров и сортировок ленты объявлений"""
+        created = {
+            'created_after': self.ad.created_at.isoformat(),
+            'created_before': (self.ad.created_at + timedelta(milliseconds=10)).isoformat(),
+        }
+        price = {'price_min': 100, 'price_max': 200}
+        author = {'author': self.user.pk}
+        for params in (
+            price, author, created, {**price, **author}, {**price, **created}, {**author, **created},
+            {**price, **author, **created}, {'ordering': 'price'}, {'ordering': '-price'},
+            {'ordering': 'created_at'}, {**price, 'ordering': '-price'}, {**author, 'ordering': 'price'},
+            {**created, 'ordering': 'price'},
+        ):
+            with self.subTest(params=params):
+                self.assertIndexScan(self.view_queryset(AdListAPIView, params)[:25])
+
+    def test_lookup_plans(self):
+        """Просмотр по pk, проверка существования объявления, выгрузка по автору, список пользователей"""
+        self.assertNoSequentialScan(Ad.objects.filter(pk=self.ad.pk))
+        self.assertNoSequentialScan(Feedback.objects.filter(ad_id=self.ad.pk).order_by())
+        self.assertNoSequentialScan(Ad.objects.filter(author_id=self.user.pk).order_by())
+        self.assertNoSequentialScan(User.objects.all()[:25])
+
+
+@override_settings(PASSWORD_HASHERS=['django.contrib.auth.hashers.MD5PasswordHasher'])
+class BenchmarkTestCase(TestCase):
+    """Прогон нагрузочного набора на малых объемах и сравнение числа запросов с эталоном"""
+
+    baseline_path = os.path.join(os.path.dirname(benchmark.__file__), 'benchmark_baseline.json')
+
+    def test_endpoints_cover_urls(self):
+        self.assertEqual({endpoint.name for endpoint in benchmark.ENDPOINTS}, benchmark.url_names())
+
+    def test_query_counts_match_baseline(self):
+        with benchmark.environment():
+            report = benchmark.run(iterations=2, users=3, ads=20, feedback_per_ad=1)
+        for name, row in report['endpoints'].items():
+            self.assertTrue(all(code < 400 for code in row['status']), name)
+        regressions = benchmark.compare(
+            report, benchmark.load(self.baseline_path), latency_tolerance=None, memory_tolerance=None,
+        )
+        self.assertEqual(regressions, [])
+
+
+class ObjectPermissionFilterTestCase(APITestCase):
+    """Объектные разрешения как условие на queryset"""
+
+    def setUp(self):
+        self.user = User.objects.create(email='test@example.ru')
+        self.admin = User.objects.create(email='admin@example.ru', role='admin')
+        self.own = Ad.objects.create(title='Стул', author=self.user)
+        self.foreign = Ad.objects.create(title='Стол', author=self.admin)
+        self.factory = APIRequestFactory()
+
+    def visible(self, user, permission):
+        request = self.factory.get('/')
+        request.user = user
+        condition = queryset_condition(permission(), request, None)
+        if isinstance(condition, bool):
+            return set(Ad.objects.all() if condition else ())
+        return set(Ad.objects.filter(condition))
+
+    def test_condition_matches_object_permission(self):
+        self.assertEqual(self.visible(self.user, IsAuthor), {self.own})
+        self.assertEqual(self.visible(self.user, IsAuthor | IsAdmin), {self.own})
+        self.assertEqual(self.visible(self.admin, IsAuthor | IsAdmin), {self.own, self.foreign})
+        self.assertEqual(self.visible(self.admin, IsAuthor & IsAdmin), {self.foreign})
+        self.assertEqual(self.visible(self.user, ~IsAuthor), {self.foreign})
+
+    def test_my_list_filtered_in_sql(self):
+        self.client.force_authenticate(user=self.user)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse('callboard:ad_mylist'))
+        self.assertEqual([ad['id'] for ad in response.json()['results']], [self.own.pk])
+        self.assertIn('"author_id" = %s' % self.user.pk, queries[0]['sql'])
+
+
+class AdDetailTestCase(APITestCase):
+    """Просмотр объявления с последними отзывами и их количеством"""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(email='test@example.ru')
+        self.client.force_authenticate(user=self.user)
+        self.ad = Ad.objects.create(title='Телефон', author=self.user)
+        self.url = reverse('callboard:ad_retrieve', args=(self.ad.pk,))
+
+    def add_feedback(self, count):
+        for i in range(count):
+            self.client.post(reverse('callboard:feedback_create', args=(self.ad.pk,)), {'text': str(i)}, format='json')
+
+    def test_detail_queries_constant(self):
+        """Объявление, отзывы и изображения загружаются тремя запросами при любом числе отзывов"""
+        for count in (1, AdDetailSerializer.feedback_limit + 5):
+            self.add_feedback(count)
+            cache.clear()
+            with self.assertNumQueries(3):
+                data = self.client.get(self.url).json()
+        self.assertEqual(data['feedback_count'], AdDetailSerializer.feedback_limit + 6)
+        self.assertEqual(len(data['feedback']), AdDetailSerializer.feedback_limit)
+        latest = Feedback.objects.filter(ad=self.ad).values_list('pk', flat=True)[:AdDetailSerializer.feedback_limit]
+        self.assertEqual([feedback['id'] for feedback in data['feedback']], list(latest))
+
+    def test_feedback_changes_update_cached_detail(self):
+        self.add_feedback(2)
+        self.assertEqual(self.client.get(self.url).json()['feedback_count'], 2)
+        feedback = Feedback.objects.filter(ad=self.ad).first()
+        self.client.delete(reverse('callboard:feedback_delete', args=(feedback.pk,)))
+        data = self.client.get(self.url).json()
+        self.assertEqual(data['feedback_count'], 1)
+        self.assertNotIn(feedback.pk, [item['id'] for item in data['feedback']])
+
+        other = Ad.objects.create(title='Стул', author=self.user)
+        moved = Feedback.objects.get(ad=self.ad)
+        moved.ad = other
+        moved.save()
+        self.assertEqual(self.client.get(self.url).json()['feedback_count'], 0)
+        other.refresh_from_db()
+        self.assertEqual(other.feedback_count, 1)
+
+
+class ValuesMapperTestCase(APITestCase):
+    """Быстрое чтение через .values() совпадает с ModelSerializer байт в байт"""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(email='test@example.ru')
+        self.ads = [
+            Ad.objects.create(title='Стул "венский"', description='Ёлка\nи 🎄', price=0, author=self.user),
+            Ad.objects.create(title=None, description='', price=None, author=None),
+            Ad.objects.create(title='Стол', price=-5, author=self.user),
+        ]
+        Feedback.objects.create(text='Отзыв', ad=self.ads[0], author=self.user)
+        Feedback.objects.create(text=None, ad=None, author=None)
+
+    def assertSameBytes(self, serializer_class):
+        queryset = serializer_class.Meta.model.objects.all()
+        mapper = values_mapper(serializer_class)
+        expected = JSONRenderer().render(serializer_class(queryset, many=True).data)
+        self.assertEqual(JSONRenderer().render(mapper.map(queryset.values(*mapper.columns))), expected)
+
+    def test_same_output_as_serializers(self):
+        self.assertSameBytes(AdSerializer)
+        self.assertSameBytes(FeedbackSerializer)
+
+    def test_list_endpoints_match_serializer(self):
+        expected = AdSerializer(Ad.objects.all()[:CustomPagination.page_size], many=True).data
+        response = self.client.get(reverse('callboard:ad_list'))
+        self.assertEqual(response.content, JSONRenderer().render({
+            'count': len(self.ads), 'next': None, 'previous': None, 'results': expected,
+        }))
+
+        self.client.force_authenticate(user=self.user)
+        response = self.client.get(reverse('callboard:feedback_mylist'))
+        expected = FeedbackSerializer(Feedback.objects.filter(author=self.user), many=True).data
+        self.assertEqual(response.json()['results'], expected)
+
+    def test_unsupported_fields(self):
+        with self.assertRaises(ImproperlyConfigured):
+            ValuesMapper(AdDetailSerializer)
+
+
+class ORJSONTestCase(APITestCase):
+    """Рендерер и парсер на orjson совместимы со стандартными классами DRF"""
+
+    def test_renderer_matches_json_renderer(self):
+        data = {
+            'created_at': timezone.make_aware(datetime(2024, 5, 1, 12, 30, 15, 123456), dt_timezone.utc),
+            'day': date(2024, 5, 1),
+            'price': Decimal('10.50'),
+            'verbose_name': gettext_lazy('Товар'),
+            'uuid': uuid.UUID(int=1),
+            'text': 'Ёлка "в"\u2028строке',
+            1: [None, True, 1.5],
+        }
+        self.assertEqual(ORJSONRenderer().render(data), JSONRenderer().render(data))
+
+    def test_parser(self):
+        self.client.force_authenticate(user=User.objects.create(email='test@example.ru'))
+        url = reverse('callboard:ad_bulk')
+        response = self.client.post(url, '[{"title": "Стул"}]', content_type='application/json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        response = self.client.post(url, '[{"title": ', content_type='application/json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class AsyncViewsTestCase(APITestCase):
+    """Асинхронные представления чтения отвечают так же, как синхронные"""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(email='test@example.ru')
+        self.token = str(UserRefreshToken.for_user(self.user).access_token)
+        self.ad = Ad.objects.create(title='Телефон', author=self.user)
+        for i in range(CustomPagination.page_size + 1):
+            Ad.objects.create(title=f'Стул {i}', author=self.user)
+            Feedback.objects.create(text=f'Отзыв {i}', ad=self.ad, author=self.user)
+
+    def assertSameResponse(self, sync_name, async_name, args=(), params=None):
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.token}')
+        expected = self.client.get(reverse(sync_name, args=args), params)
+        response = self.client.get(reverse(async_name, args=args), params)
+        self.assertEqual(response.status_code, expected.status_code)
+        sync_path, async_path = reverse(sync_name, args=args), reverse(async_name, args=args)
+        self.assertEqual(response.json(), json.loads(expected.content.decode().replace(sync_path, async_path)))
+        return response
+
+    def test_responses_match_sync_views(self):
+        for params in ({}, {'page': 2}, {'page': 'last', 'page_size': 2}, {'search': 'Стул'}, {'pagination': 'cursor'}):
+            self.assertSameResponse('callboard:ad_list', 'callboard:async_ad_list', params=params)
+            self.assertSameResponse('callboard:feedback_list', 'callboard:async_feedback_list', (self.ad.pk,), params)
+        self.assertSameResponse('callboard:ad_list', 'callboard:async_ad_list', params={'page': 10})
+        self.assertSameResponse('callboard:ad_retrieve', 'callboard:async_ad_retrieve', (self.ad.pk,))
+        self.assertSameResponse('callboard:ad_retrieve', 'callboard:async_ad_retrieve', (0,))
+        self.assertSameResponse('callboard:feedback_list', 'callboard:async_feedback_list', (0,))
+
+    def test_authentication(self):
+        url = reverse('callboard:async_ad_retrieve', args=(self.ad.pk,))
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertIn('WWW-Authenticate', response)
+        self.client.credentials(HTTP_AUTHORIZATION='Bearer invalid')
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_401_UNAUTHORIZED)
+        self.assertEqual(self.client.get(reverse('callboard:async_ad_list')).status_code, status.HTTP_200_OK)
+
+    @override_settings(RESPONSE_CACHE_TIMEOUT=60)
+    def test_list_cache_and_etag(self):
+        url = reverse('callboard:async_ad_list')
+        response = self.client.get(url)
+        with self.assertNumQueries(0):
+            cached = self.client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(cached.status_code, status.HTTP_304_NOT_MODIFIED)
+        Ad.objects.create(title='Новое', author=self.user)
+        self.assertEqual(self.client.get(url).json()['count'], len(Ad.objects.all()))
+
+    async def test_async_client(self):
+        response = await AsyncClient().get(
+            reverse('callboard:async_ad_retrieve', args=(self.ad.pk,)),
+            headers={'Authorization': f'Bearer {self.token}'},
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()['feedback_count'], CustomPagination.page_size + 1)
+
+    async def test_revocation_checked_in_event_loop(self):
+        """Отметка отзыва читается асинхронным кешем и ORM без блокирующих вызовов в event loop"""
+        url = reverse('callboard:async_ad_retrieve', args=(self.ad.pk,))
+        self.user.role = 'admin'
+        await self.user.asave()
+        fresh = str(UserRefreshToken.for_user(self.user).access_token)
+        for cache_enabled in (False, True):
+            with self.settings(CACHE_ENABLED=cache_enabled):
+                for token, expected in ((self.token, status.HTTP_401_UNAUTHORIZED), (fresh, status.HTTP_200_OK)):
+                    revocations.clear()
+                    await cache.aclear()
+                    response = await AsyncClient().get(url, headers={'Authorization': f'Bearer {token}'})
+                    self.assertEqual(response.status_code, expected)
+
+
+class ConnectionMetricsTestCase(TestCase):
+    """Время получения соединения с базой в заголовке Server-Timing"""
+
+    def test_connect_recorded(self):
+        wrapper_class = type('DatabaseWrapper', (ConnectionMetricsMixin, type(connections['default'])), {})
+        wrapper = wrapper_class(dict(connection.settings_dict), alias='metrics')
+        metrics, token = start_metrics()
+        try:
+            wrapper.connect()
+        finally:
+            reset_metrics(token)
+            wrapper.close()
+        self.assertEqual(metrics.connections, 1)
+        self.assertGreater(metrics.acquire_time, 0)
+
+    def test_server_timing_header(self):
+        response = self.client.get(reverse('callboard:ad_list'))
+        self.assertRegex(response['Server-Timing'], r'(^|, )db-connect;dur=\d+\.\d{3};desc="\d+"(, |$)')
+
+
+class PooledDatabaseTestCase(TestCase):
+    """Выдача и возврат соединений бэкендом с пулом; пул psycopg2 заменен заглушкой"""
+
+    def setUp(self):
+        self.pool = mock.Mock()
+        self.wrapper = PooledDatabaseWrapper(
+            {'OPTIONS': {}, 'CONN_HEALTH_CHECKS': False, 'POOL': {'TIMEOUT': 0.05}}, alias='pooled',
+        )
+        self.wrapper.pool_wait_interval = 0.001
+        patcher = mock.patch.object(self.wrapper, 'get_pool', return_value=self.pool)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        patcher = mock.patch('psycopg2.extras.register_default_jsonb')
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def connection(self, closed=False):
+        return mock.MagicMock(closed=closed, autocommit=True)
+
+    def test_waits_for_free_connection(self):
+        connection = self.connection()
+        self.pool.getconn.side_effect = [pool.PoolError(), pool.PoolError(), connection]
+        self.assertIs(self.wrapper.get_new_connection({}), connection)
+        self.assertEqual(self.pool.getconn.call_count, 3)
+
+    def test_pool_error_after_timeout(self):
+        self.pool.getconn.side_effect = pool.PoolError()
+        started = time.monotonic()
+        with self.assertRaises(pool.PoolError):
+            self.wrapper.get_new_connection({})
+        self.assertGreaterEqual(time.monotonic() - started, 0.05)
+        self.assertGreater(self.pool.getconn.call_count, 1)
+
+    def test_unhealthy_connection_discarded(self):
+        closed, broken, healthy = self.connection(closed=True), self.connection(), self.connection()
+        broken.cursor.return_value.__enter__.return_value.execute.side_effect = psycopg2.OperationalError()
+        self.pool.getconn.side_effect = [closed, broken, healthy]
+        self.wrapper.settings_dict['CONN_HEALTH_CHECKS'] = True
+        self.assertIs(self.wrapper.get_new_connection({}), healthy)
+        self.assertEqual(
+            self.pool.putconn.call_args_list, [mock.call(closed, close=True), mock.call(broken, close=True)],
+        )
+
+    def test_close_returns_connection_to_pool(self):
+        connection = self.connection()
+        self.pool.getconn.return_value = connection
+        self.wrapper.connection = self.wrapper.get_new_connection({})
+        self.wrapper._close()
+        self.pool.putconn.assert_called_once_with(connection)
+
+    def test_recently_returned_connection_not_checked(self):
+        connection = self.connection()
+        self.pool.getconn.return_value = connection
+        self.wrapper.settings_dict['CONN_HEALTH_CHECKS'] = True
+        self.wrapper.connection = self.wrapper.get_new_connection({})
+        self.assertEqual(connection.cursor.call_count, 1)
+
+        self.wrapper._close()
+        self.wrapper.connection = self.wrapper.get_new_connection({})
+        self.assertEqual(connection.cursor.call_count, 1)
+
+        # Соединение пролежало в пуле дольше HEALTH_CHECK_IDLE
+        self.wrapper._close()
+        self.wrapper.settings_dict['POOL']['HEALTH_CHECK_IDLE'] = 0
+        self.wrapper.get_new_connection({})
+        self.assertEqual(connection.cursor.call_count, 2)
+
+
+@contextmanager
+def replica_alias(alias='replica'):
+    """Алиас реплики в DATABASES, запросы к которому идут через соединение основной базы теста"""
+    connections.settings[alias] = connection.settings_dict
+    connections[alias] = connections['default']
+    try:
+        yield
+    finally:
+        del connections[alias]
+        del connections.settings[alias]
+
+
+@override_settings(DATABASE_REPLICAS=['replica'])
+class ReplicaRouterTestCase(APITestCase):
+    """Чтение с реплик и закрепление за основной базой после записи"""
+
+    def setUp(self):
+        replicas.reset()
+        self.addCleanup(replicas.reset)
+        self.router = ReplicaRouter()
+        self.factory = RequestFactory()
+
+    def test_reads_routing(self):
+        with mock.patch.object(replicas, 'is_available', return_value=True):
+            self.assertIsNone(self.router.db_for_read(Ad))
+            with replica_reads(self.factory.get('/')):
+                self.assertEqual(self.router.db_for_read(Ad), 'replica')
+                self.assertEqual(self.router.db_for_write(Ad), 'default')
+                self.assertIsNone(self.router.db_for_read(Ad))
+
+            pinned = self.factory.get('/')
+            pinned.COOKIES[PIN_COOKIE] = '1'
+            for request in (pinned, self.factory.post('/')):
+                with replica_reads(request):
+                    self.assertIsNone(self.router.db_for_read(Ad))
+
+        self.assertFalse(self.router.allow_migrate('replica', 'callboard'))
+        self.assertIsNone(self.router.allow_migrate('default', 'callboard'))
+
+    def test_unavailable_replica_falls_back_to_primary(self):
+        """Алиаса replica нет в DATABASES: чтение идет в основную базу"""
+        with replica_reads(self.factory.get('/')):
+            self.assertIsNone(self.router.db_for_read(Ad))
+        self.assertEqual(self.client.get(reverse('callboard:ad_list')).status_code, status.HTTP_200_OK)
+
+        with replica_alias(), replica_reads(self.factory.get('/')):
+            self.assertEqual(self.router.db_for_read(Ad), 'replica')
+            replicas.mark_down('replica')
+            self.assertIsNone(self.router.db_for_read(Ad))
+
+    def test_replica_marked_down_on_connect_failure(self):
+        wrapper_class = type('DatabaseWrapper', (ReplicaHealthMixin, type(connections['default'])), {})
+        wrapper = wrapper_class({**connection.settings_dict, 'NAME': '/nonexistent/db.sqlite3'}, alias='replica')
+        with self.assertRaises(DatabaseError):
+            wrapper.ensure_connection()
+        self.assertIn('replica', replicas.down_until)
+        self.assertIn(mark_down_on_error, wrapper.execute_wrappers)
+
+    def test_replica_marked_down_on_query_failure(self):
+        def execute(sql, params, many, context):
+            raise OperationalError('server closed the connection unexpectedly')
+
+        with self.assertRaises(OperationalError):
+            mark_down_on_error(execute, 'SELECT 1', (), False, {'connection': mock.Mock(alias='replica')})
+        self.assertIn('replica', replicas.down_until)
+
+    def test_async_search_on_replica(self):
+        """Роутер не открывает соединение: выбор реплики в event loop не вызывает SynchronousOnlyOperation"""
+        user = User.objects.create(email='test@example.ru')
+        Ad.objects.create(title='Стул', author=user)
+        token = str(UserRefreshToken.for_user(user).access_token)
+        # Соединения видны только своему потоку: алиас задается в потоке, где sync_to_async выполняет запросы
+        async def search():
+            return await AsyncClient().get(
+                reverse('callboard:async_ad_list'), {'search': 'Стул'}, headers={'Authorization': f'Bearer {token}'},
+            )
+
+        with replica_alias():
+            response = async_to_sync(search)()
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.json()['count'], 1)
+
+    @override_settings(RESPONSE_CACHE_TIMEOUT=60, OBJECT_CACHE_TIMEOUT=300)
+    def test_cache_filled_from_primary(self):
+        """Промах кеша читает основную базу, закрепленный запрос не берет ответ из кеша"""
+        cache.clear()
+        user = User.objects.create(email='test@example.ru')
+        ad = Ad.objects.create(title='Стул', author=user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {UserRefreshToken.for_user(user).access_token}')
+        routes = []
+        db_for_read = ReplicaRouter.db_for_read
+
+        def recording_db_for_read(router, model, **hints):
+            alias = db_for_read(router, model, **hints)
+            if model is not User:
+                routes.append(alias)
+            return alias
+
+        urls = [
+            reverse('callboard:ad_list'),
+            reverse('callboard:async_ad_list'),
+            reverse('callboard:ad_retrieve', args=(ad.pk,)),
+            reverse('callboard:async_ad_retrieve', args=(ad.pk,)),
+        ]
+        with replica_alias(), mock.patch.object(ReplicaRouter, 'db_for_read', recording_db_for_read):
+            for url in urls:
+                self.assertEqual(self.client.get(url).status_code, status.HTTP_200_OK)
+            self.assertTrue(routes)
+            self.assertNotIn('replica', routes)
+
+            self.client.cookies[PIN_COOKIE] = '1'
+            for url in urls:
+                with CaptureQueriesContext(connection) as queries:
+                    self.client.get(url)
+                self.assertTrue(queries, url)
+
+            with self.settings(RESPONSE_CACHE_TIMEOUT=0):
+                del self.client.cookies[PIN_COOKIE]
+                self.client.get(urls[0])
+            self.assertIn('replica', routes)
+
+    def test_pin_cookie_after_write(self):
+        self.assertNotIn(PIN_COOKIE, self.client.get(reverse('callboard:ad_list')).cookies)
+        self.client.force_authenticate(user=User.objects.create(email='test@example.ru'))
+        response = self.client.post(reverse('callboard:ad_create'), {'title': 'Стул'}, format='json')
+        self.assertEqual(response.cookies[PIN_COOKIE]['max-age'], settings.REPLICA_PIN_SECONDS)
+
+
+class AdFilterTestCase(APITestCase):
+    """Фильтры, сортировка и фасеты ленты объявлений"""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create(email='test@example.ru')
+        self.other = User.objects.create(email='other@example.ru')
+        self.cheap = Ad.objects.create(title='Стул', price=500, author=self.user)
+        self.middle = Ad.objects.create(title='Стол', price=3000, author=self.other)
+        self.expensive = Ad.objects.create(title='Диван', price=60000, author=self.user)
+        self.old = Ad.objects.create(title='Старый стул', price=500, author=self.other)
+        Ad.objects.filter(pk=self.old.pk).update(created_at=timezone.now() - timedelta(days=10))
+
+    def ids(self, params, name='callboard:ad_list'):
+        response = self.client.get(reverse(name), params)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        return [ad['id'] for ad in response.json()['results']]
+
+    def test_filters(self):
+        self.assertEqual(self.ids({'price_min': 1000, 'price_max': 60000}), [self.expensive.pk, self.middle.pk])
+        self.assertEqual(self.ids({'author': self.other.pk}), [self.middle.pk, self.old.pk])
+        week_ago = (timezone.now() - timedelta(days=7)).isoformat()
+        self.assertEqual(self.ids({'created_before': week_ago}), [self.old.pk])
+        self.assertEqual(self.ids({'created_after': week_ago, 'price_max': 500, 'search': 'Стул'}), [self.cheap.pk])
+        response = self.client.get(reverse('callboard:ad_list'), {'price_min': 'дешево'})
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_ordering(self):
+        self.assertEqual(
+            self.ids({'ordering': 'price'}),
+            [self.cheap.pk, self.old.pk, self.middle.pk, self.expensive.pk],
+        )
+        self.assertEqual(
+            self.ids({'ordering': '-price'}, 'callboard:async_ad_list'),
+            [self.expensive.pk, self.middle.pk, self.old.pk, self.cheap.pk],
+        )
+
+    @override_settings(RESPONSE_CACHE_TIMEOUT=60)
+    def test_facets(self):
+        url = reverse('callboard:ad_facets')
+        with self.assertNumQueries(1):
+            data = self.client.get(url).json()
+        self.assertEqual(data['count'], 4)
+        self.assertEqual([bucket['count'] for bucket in data['price']], [0, 2, 1, 0, 0, 1, 0, 0])
+        self.assertEqual([bucket['count'] for bucket in data['created_at']], [3, 0, 1, 0])
+
+        data = self.client.get(url, {'author': self.user.pk}).json()
+        self.assertEqual(data['count'], 2)
+        self.assertEqual([bucket['count'] for bucket in data['price']], [0, 1, 0, 0, 0, 1, 0, 0])
+
+        with self.assertNumQueries(0):
+            self.client.get(url)
+        Ad.objects.create(title='Шкаф', price=7000, author=self.user)
+        self.assertEqual(self.client.get(url).json()['price'][3]['count'], 1)
+
+    def test_facets_negative_and_missing_price(self):
+        """Объявления с отрицательной ценой и без цены попадают в свои диапазоны, сумма совпадает со списком"""
+        Ad.objects.create(title='Отдам с доплатой', price=-100, author=self.user)
+        Ad.objects.create(title='Без цены', author=self.user)
+        data = self.client.get(reverse('callboard:ad_facets')).json()
+        self.assertEqual(data['price'][0], {'min': None, 'max': 0, 'count': 1})
+        self.assertEqual(data['price'][-1], {'min': None, 'max': None, 'count': 1})
+        self.assertEqual(sum(bucket['count'] for bucket in data['price']), data['count'])
+        self.assertEqual(data['count'], self.client.get(reverse('callboard:ad_list')).json()['count'])
+
+
+class AuthorStatsTestCase(APITestCase):
+    """Статистика авторов: инкрементальные счетчики, пересчет и просмотр"""
+
+    def setUp(self):
+        cache.clear()
+        self.seller = User.objects.create(email='seller@example.ru')
+        self.buyer = User.objects.create(email='buyer@example.ru')
+        self.client.force_authenticate(user=self.buyer)
+
+    def assertStatsReconciled(self, fields=('ads_count', 'feedback_received', 'feedback_written')):
+        """Счетчики совпадают с пересчетом по объявлениям и отзывам"""
+        stored = {stats.user_id: [getattr(stats, field) for field in fields] for stats in AuthorStats.objects.all()}
+        computed = AuthorStats.compute(User.objects.all())
+        self.assertEqual(stored, {stats.user_id: [getattr(stats, field) for field in fields] for stats in computed})
+
+    def test_incremental_updates(self):
+        ad = Ad.objects.create(title='Стул', author=self.seller)
+        other = Ad.objects.create(title='Стол', author=self.seller)
+        for i in range(3):
+            self.client.post(reverse('callboard:feedback_create', args=(ad.pk,)), {'text': str(i)}, format='json')
+        stats = AuthorStats.objects.get(user=self.seller)
+        self.assertEqual((stats.ads_count, stats.feedback_received, stats.last_ad_at), (2, 3, other.created_at))
+        self.assertEqual(AuthorStats.objects.get(user=self.buyer).feedback_written, 3)
+        self.assertStatsReconciled(AuthorStats.counter_fields)
+
+        feedback = Feedback.objects.filter(ad=ad).first()
+        feedback.ad = other
+        feedback.author = self.seller
+        feedback.save()
+        self.assertStatsReconciled()
+        Feedback.objects.filter(ad=other).delete()
+        self.assertStatsReconciled()
+        other.author = self.buyer
+        other.save()
+        self.assertStatsReconciled()
+        # Полученные отзывы уменьшаются на feedback_count удаляемого объявления
+        ad.refresh_from_db()
+        ad.delete()
+        self.assertStatsReconciled()
+        self.assertEqual(AuthorStats.reconcile(), 1)
+        self.assertStatsReconciled(AuthorStats.counter_fields)
+
+    def test_bulk_operations(self):
+        self.client.force_authenticate(user=self.seller)
+        response = self.client.post(reverse('callboard:ad_bulk'), [{'title': 'Стул'}] * 3, format='json')
+        self.assertEqual(AuthorStats.objects.get(user=self.seller).ads_count, 3)
+        ids = [result['id'] for result in response.json()['results']]
+        Feedback.objects.create(text='Отзыв', ad_id=ids[0], author=self.buyer)
+        self.client.delete(reverse('callboard:ad_bulk'), ids[:2], format='json')
+        self.assertEqual(AuthorStats.objects.get(user=self.seller).ads_count, 1)
+        self.assertStatsReconciled()
+
+    def test_reconcile_repairs_drift(self):
+        Ad.objects.bulk_create(Ad(title='Стул', author=self.seller) for _ in range(5))
+        AuthorStats.objects.filter(user=self.buyer).delete()
+        AuthorStats.objects.filter(user=self.seller).update(feedback_written=7)
+        self.assertEqual(reconcile_author_stats.apply().get(), 2)
+        self.assertStatsReconciled(AuthorStats.counter_fields)
+        self.assertEqual(AuthorStats.reconcile(), 0)
+
+    def test_retrieve(self):
+        Ad.objects.create(title='Стул', author=self.seller)
+        url = reverse('callboard:author_stats', args=(self.seller.pk,))
+        with self.assertNumQueries(1):
+            data = self.client.get(url).json()
+        self.assertEqual((data['user'], data['ads_count']), (self.seller.pk, 1))
+
+        AuthorStats.objects.filter(user=self.seller).delete()
+        self.assertEqual(self.client.get(url).json()['ads_count'], 1)
+        missing = reverse('callboard:author_stats', args=(self.seller.pk + 100,))
+        self.assertEqual(self.client.get(missing).status_code, status.HTTP_404_NOT_FOUND)
+
+
+@override_settings(ORPHAN_RETENTION_DAYS=30, AD_RETENTION_DAYS=0, HOUSEKEEPING_BATCH_SIZE=2)
+class HousekeepingTestCase(TestCase):
+    """Пакетная очистка отзывов без объявления и устаревших объявлений"""
+
+    def setUp(self):
+        self.user = User.objects.create(email='seller@example.ru')
+        self.old = timezone.now() - timedelta(days=31)
+
+    def test_pk_range_batches(self):
+        Ad.objects.bulk_create(Ad(title=str(i), author=self.user) for i in range(5))
+        batches = [list(batch.values_list('title', flat=True)) for batch in pk_range_batches(Ad.objects.all(), 2)]
+        self.assertEqual(batches, [['0', '1'], ['2', '3'], ['4']])
+
+    def test_delete_orphaned_feedback(self):
+        ad = Ad.objects.create(title='Стул', author=self.user)
+        Feedback.objects.bulk_create(Feedback(text=str(i), author=self.user) for i in range(5))
+        Feedback.objects.create(text='Отзыв', ad=ad, author=self.user)
+        Feedback.objects.create(text='Новый', author=self.user)
+        Feedback.objects.filter(text__in='01234').update(created_at=self.old)
+        AuthorStats.reconcile()
+
+        # На пачку: граница, savepoint, выборка, удаление, одно обновление статистики автора, release
+        with self.assertNumQueries(3 * 6):
+            metrics = delete_orphaned_feedback()
+        self.assertEqual((metrics['rows'], metrics['batches']), (5, 3))
+        self.assertEqual(set(Feedback.objects.values_list('text', flat=True)), {'Отзыв', 'Новый'})
+        self.assertEqual(AuthorStats.reconcile(), 0)
+
+    def test_delete_stale_ads(self):
+        stale = Ad.objects.create(title='Без автора')
+        Ad.objects.filter(pk=stale.pk).update(created_at=self.old)
+        Ad.objects.create(title='Новый без автора')
+        old = Ad.objects.create(title='Старый', author=self.user)
+        Ad.objects.filter(pk=old.pk).update(created_at=self.old)
+        Feedback.objects.create(text='Отзыв', ad=stale, author=self.user)
+
+        self.assertEqual(delete_stale_ads()['rows'], 1)
+        self.assertFalse(Feedback.objects.filter(ad__isnull=False).exists())
+        with override_settings(AD_RETENTION_DAYS=30):
+            self.assertEqual(delete_stale_ads()['rows'], 1)
+        self.assertEqual(list(Ad.objects.values_list('title', flat=True)), ['Новый без автора'])
+        stats = AuthorStats.objects.get(user=self.user)
+        self.assertEqual((stats.ads_count, stats.feedback_received, stats.feedback_written), (0, 0, 1))
+
+
+@override_settings(CELERY_TASK_ALWAYS_EAGER=True, AD_IMAGE_THUMBNAIL_SIZE=32, AD_IMAGE_WEBP_SIZE=64)
+class AdImageTestCase(APITestCase):
+    """Загрузка изображений объявлений, варианты и хранение по хешу содержимого"""
+
+    def setUp(self):
+        cache.clear()
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root)
+        media = override_settings(MEDIA_ROOT=media_root)
+        media.enable()
+        self.addCleanup(media.disable)
+
+        self.user = User.objects.create(email='seller@example.ru')
+        self.ad = Ad.objects.create(title='Стул', author=self.user)
+        self.url = reverse('callboard:ad_image_create', args=(self.ad.pk,))
+        self.client.force_authenticate(user=self.user)
+
+    @staticmethod
+    def image_file(color=(255, 0, 0), size=(200, 100), image_format='PNG'):
+        buffer = BytesIO()
+        Image.new('RGB', size, color).save(buffer, image_format)
+        return SimpleUploadedFile('image.png', buffer.getvalue())
+
+    def upload(self, file=None):
+        with self.captureOnCommitCallbacks(execute=True):
+            return self.client.post(self.url, {'image': file or self.image_file()}, format='multipart')
+
+    def test_upload_makes_variants(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            response = self.client.post(self.url, {'image': self.image_file()}, format='multipart')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertIsNone(response.json()['thumbnail'])
+        image = AdImage.objects.get()
+        self.assertEqual(image.original.name, content_name(image.sha256, '.png'))
+
+        for callback in callbacks:
+            callback()
+        image.refresh_from_db()
+        self.assertEqual(image.thumbnail.name, variant_name(image.sha256, 'thumbnail', 32))
+        with default_storage.open(image.webp.name) as file, Image.open(file) as webp:
+            self.assertEqual((webp.format, webp.size), ('WEBP', (64, 32)))
+
+        results = self.client.get(reverse('callboard:ad_list')).json()['results']
+        self.assertEqual(results[0]['thumbnail'], default_storage.url(image.thumbnail.name))
+        detail = self.client.get(reverse('callboard:ad_retrieve', args=(self.ad.pk,))).json()
+        self.assertEqual(detail['images'][0]['webp'], default_storage.url(image.webp.name))
+
+    def test_same_content_stored_once(self):
+        self.upload()
+        other = Ad.objects.create(title='Стол', author=self.user)
+        self.url = reverse('callboard:ad_image_create', args=(other.pk,))
+        self.upload()
+        first, second = AdImage.objects.all()
+        self.assertEqual((first.original, first.thumbnail), (second.original, second.thumbnail))
+        self.assertEqual(len(default_storage.listdir(os.path.dirname(first.original.name))[1]), 3)
+
+        # Файлы удаляются вместе с последним изображением, которое на них ссылается
+        with self.captureOnCommitCallbacks(execute=True):
+            first.delete()
+        self.assertTrue(default_storage.exists(second.original.name))
+        with self.captureOnCommitCallbacks(execute=True):
+            other.delete()
+        self.assertFalse(default_storage.exists(second.original.name))
+        self.assertFalse(default_storage.exists(second.thumbnail.name))
+
+    def test_files_changed_under_digest_lock(self):
+        """Оригинал сохраняется и файлы удаляются только под блокировкой строки хеша"""
+        events = []
+        lock, store, delete = ImageFile.lock.__func__, serializers.store_original, signals.delete_files
+
+        def record(name, function):
+            def wrapper(*args):
+                events.append(name)
+                return function(*args)
+            return wrapper
+
+        with mock.patch.object(ImageFile, 'lock', classmethod(record('lock', lock))), \
+                mock.patch.object(serializers, 'store_original', record('store', store)), \
+                mock.patch.object(signals, 'delete_files', record('delete', delete)):
+            self.upload()
+            image = AdImage.objects.get()
+            self.assertTrue(ImageFile.objects.filter(sha256=image.sha256).exists())
+            with self.captureOnCommitCallbacks(execute=True):
+                image.delete()
+        self.assertEqual(events, ['lock', 'store', 'lock', 'delete'])
+        self.assertFalse(ImageFile.objects.exists())
+        self.assertFalse(default_storage.exists(image.original.name))
+
+    def test_cover_follows_first_image(self):
+        self.upload()
+        self.upload(self.image_file(color=(0, 0, 255)))
+        first, second = AdImage.objects.all()
+        self.ad.refresh_from_db()
+        self.assertEqual(self.ad.thumbnail, first.thumbnail)
+        first.delete()
+        self.ad.refresh_from_db()
+        self.assertEqual(self.ad.thumbnail, second.thumbnail)
+
+    def test_invalid_uploads(self):
+        file = SimpleUploadedFile('image.png', b'not an image')
+        self.assertEqual(self.upload(file).status_code, status.HTTP_400_BAD_REQUEST)
+        with override_settings(AD_IMAGE_MAX_UPLOAD_SIZE=100):
+            response = self.upload()
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertIn('image', response.json())
+
+        self.client.force_authenticate(user=User.objects.create(email='buyer@example.ru'))
+        self.assertEqual(self.upload().status_code, status.HTTP_403_FORBIDDEN)
+        self.assertFalse(AdImage.objects.exists())
+
+
+class RequestMetricsTestCase(APITestCase):
+    """Метрики запросов: Server-Timing, медленные запросы, N+1 и выдача для Prometheus"""
+
+    def setUp(self):
+        cache.clear()
+        request_metrics.registry.reset()
+        request_metrics.install(connection)
+        self.user = User.objects.create(email='seller@example.ru')
+        Ad.objects.create(title='Стул', author=self.user)
+
+    def server_timing(self, response):
+        return dict(
+            re.match(r'(\S+?);dur=([\d.]+)', entry).groups() for entry in response['Server-Timing'].split(', ')
+        )
+
+    def test_server_timing(self):
+        with CaptureQueriesContext(connection) as captured:
+            response = self.client.get(reverse('callboard:ad_list'))
+        self.assertRegex(response['Server-Timing'], f'db;dur=[\\d.]+;desc="{len(captured)}"')
+        timing = {name: float(value) for name, value in self.server_timing(response).items()}
+        self.assertGreater(timing['serialize'], 0)
+        self.assertGreater(timing['render'], 0)
+        self.assertGreaterEqual(timing['total'], timing['db'] + timing['serialize'] + timing['render'])
+
+    def test_serializer_data_timed(self):
+        """Свойство data сериализатора DRF учитывается один раз, без времени SQL-запросов"""
+        metrics, token = request_metrics.start_metrics()
+        try:
+            with mock.patch('time.perf_counter', side_effect=[10, 11, 15, 17]):
+                AdSerializer(Ad.objects.all(), many=True).data
+        finally:
+            request_metrics.reset_metrics(token)
+        self.assertEqual(metrics.queries, 1)
+        self.assertEqual(metrics.db_time, 4)
+        self.assertEqual(metrics.serialize_time, 3)
+
+    async def test_async_view_queries(self):
+        response = await AsyncClient().get(reverse('callboard:async_ad_list'))
+        self.assertRegex(response['Server-Timing'], r'db;dur=[\d.]+;desc="[1-9]\d*"')
+
+    @override_settings(REQUEST_DUPLICATE_QUERIES=3)
+    def test_duplicate_queries(self):
+        metrics, token = request_metrics.start_metrics()
+        try:
+            for pk in range(4):
+                Ad.objects.filter(pk=pk).first()
+            Ad.objects.filter(pk__in=[1, 2]).exists()
+        finally:
+            request_metrics.reset_metrics(token)
+        self.assertEqual(metrics.queries, 5)
+        [(pattern, stack)] = metrics.duplicates.items()
+        self.assertEqual(metrics.patterns[pattern], 4)
+        self.assertIn('test_duplicate_queries', stack)
+
+    @override_settings(REQUEST_SLOW_MS=0)
+    def test_slow_request_logged(self):
+        with self.assertLogs('config.metrics', 'WARNING') as logs:
+            self.client.get(reverse('callboard:ad_list'))
+        self.assertIn('callboard:ad_list', logs.output[0])
+
+    def test_prometheus_endpoint(self):
+        url = reverse('callboard:metrics')
+        self.client.get(reverse('callboard:ad_list'))
+        self.client.force_authenticate(user=self.user)
+        self.assertEqual(self.client.get(url).status_code, status.HTTP_403_FORBIDDEN)
+
+        self.client.force_authenticate(user=User.objects.create(email='admin@example.ru', role='admin'))
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Content-Type'], request_metrics.CONTENT_TYPE)
+        body = response.content.decode()
+        self.assertIn('http_requests_total{route="callboard:ad_list",method="GET",status="200"} 1', body)
+        self.assertIn('http_request_duration_seconds_count{route="callboard:ad_list",method="GET"} 1', body)
+        self.assertIn('http_request_db_queries_bucket{route="callboard:ad_list",method="GET",le="+Inf"} 1', body)
@@ -2,12 +2,17 @@ from django.urls import path, include
 from rest_framework.routers import DefaultRouter
 
 from callboard.apps import CallboardConfig
+from callboard.async_views import AsyncAdListView, AsyncAdRetrieveView, AsyncFeedbackListView
 from callboard.views import (
     AdCreateAPIView,
     AdListAPIView,
+    AdFacetsAPIView,
     AdRetrieveAPIView,
     AdUpdateAPIView,
     AdDestroyAPIView,
+    AdBulkAPIView,
+    AdImageCreateAPIView,
+    AdExportAPIView,
     UsersAdListAPIView,
 
     FeedbackListAPIView,
@@ -16,6 +21,11 @@ from callboard.views import (
     FeedbackRetrieveAPIView,
     FeedbackUpdateAPIView,
     FeedbackDestroyAPIView,
+    FeedbackExportAPIView,
+
+    ObjectCacheStatsAPIView,
+    MetricsAPIView,
+    AuthorStatsRetrieveAPIView,
 )
 
 app_name = CallboardConfig.name
@@ -24,15 +34,26 @@ router = DefaultRouter()
 
 urlpatterns = [
                   path('', AdListAPIView.as_view(), name='ad_list'),
+                  path('facets/', AdFacetsAPIView.as_view(), name='ad_facets'),
                   path('create/', AdCreateAPIView.as_view(), name='ad_create'),
+                  path('bulk/', AdBulkAPIView.as_view(), name='ad_bulk'),
+                  path('export/', AdExportAPIView.as_view(), name='ad_export'),
                   path('my_ads/', UsersAdListAPIView.as_view(), name='ad_mylist'),
                   path('<int:pk>/', AdRetrieveAPIView.as_view(), name='ad_retrieve'),
                   path('<int:pk>/update/', AdUpdateAPIView.as_view(), name='ad_update'),
                   path('<int:pk>/delete/', AdDestroyAPIView.as_view(), name='ad_delete'),
+                  path('<int:pk>/images/', AdImageCreateAPIView.as_view(), name='ad_image_create'),
                   path('<int:pk>/feedbacks/', FeedbackListAPIView.as_view(), name='feedback_list'),
                   path('<int:pk>/feedbacks/create/', FeedbackCreateAPIView.as_view(), name='feedback_create'),
+                  path('<int:pk>/feedbacks/export/', FeedbackExportAPIView.as_view(), name='feedback_export'),
                   path('my_list_feedbacks/', UsersFeedbackListAPIView.as_view(), name='feedback_mylist'),
                   path('feedbacks/<int:pk>/', FeedbackRetrieveAPIView.as_view(), name='feedback_retrieve'),
                   path('feedbacks/<int:pk>/update/', FeedbackUpdateAPIView.as_view(), name='feedback_update'),
                   path('feedbacks/<int:pk>/delete/', FeedbackDestroyAPIView.as_view(), name='feedback_delete'),
+                  path('authors/<int:pk>/stats/', AuthorStatsRetrieveAPIView.as_view(), name='author_stats'),
+                  path('cache/stats/', ObjectCacheStatsAPIView.as_view(), name='object_cache_stats'),
+                  path('metrics/', MetricsAPIView.as_view(), name='metrics'),
+                  path('async/', AsyncAdListView.as_view(), name='async_ad_list'),
+                  path('async/<int:pk>/', AsyncAdRetrieveView.as_view(), name='async_ad_retrieve'),
+                  path('async/<int:pk>/feedbacks/', AsyncFeedbackListView.as_view(), name='async_feedback_list'),
               ] + router.urls
@@ -1,12 +1,55 @@
-from django.http import Http404
-from django.shortcuts import render
-from rest_framework.filters import SearchFilter
-from rest_framework.generics import CreateAPIView, ListAPIView, RetrieveAPIView, UpdateAPIView, DestroyAPIView
+from datetime import datetime, time
+
+from django.conf import settings
+from django.db import transaction
+from django.http import Http404, HttpResponse
+from django.shortcuts import get_object_or_404, render
+from django.utils import timezone
+from django.utils.dateparse import parse_date, parse_datetime
+from django_filters.rest_framework import DjangoFilterBackend
+from rest_framework import status
+from rest_framework.exceptions import ValidationError
+from rest_framework.generics import (
+    CreateAPIView,
+    DestroyAPIView,
+    GenericAPIView,
+    ListAPIView,
+    RetrieveAPIView,
+    UpdateAPIView,
+)
+from rest_framework.parsers import MultiPartParser
 from rest_framework.permissions import IsAuthenticated, AllowAny
-
-from callboard.models import Ad, Feedback
-from callboard.paginators import CustomPagination
-from callboard.serializers import AdSerializer, FeedbackSerializer, AdDetailSerializer
+from rest_framework.response import Response
+from rest_framework.views import APIView
+
+from callboard.cache import (
+    CachedListMixin,
+    CachedObjectListMixin,
+    CachedRetrieveMixin,
+    ad_cache,
+    ad_detail_cache,
+    feedback_cache,
+)
+from callboard.export import FORMATS, export_response
+from callboard.facets import get_facets
+from callboard.filters import AdFilterSet, AdSearchFilter, ObjectPermissionFilter
+from callboard.images import HashingUploadHandler
+from callboard.models import Ad, AdImage, AuthorStats, Feedback
+from callboard.paginators import OptionalCursorPagination
+from callboard.parsers import NDJSONParser, ORJSONParser
+from callboard.serializers import (
+    AdDetailSerializer,
+    AdImageSerializer,
+    AdSerializer,
+    AuthorStatsSerializer,
+    FeedbackSerializer,
+    values_mapper,
+)
+from callboard.signals import ads_created, ads_saved, batched_author_stats
+from callboard.tasks import make_ad_image_variants
+from config import metrics
+from config.routers import ReplicaReadMixin
+from users.models import User
 from users.permissions import IsAdmin, IsAuthor
 
 
@@ -19,30 +62,81 @@ class AdCreateAPIView(CreateAPIView):
 
     def perform_create(self, serializer):
         """Привязка автора объявления к текущему пользователю"""
-        ad = serializer.save()
-        ad.author = self.request.user
-        ad.save()
+        serializer.save(author_id=self.request.user.pk)
+
+
+class ValuesListMixin:
+    """
+    Список только для чтения через ValuesMapper.
+
+    Строки выбираются .values() и переводятся в словари заранее
+    сопоставленными полями, без объектов модели и ModelSerializer.
+    values_extra_fields - столбцы, нужные пагинации, но не ответу.
+    """
+
+    values_extra_fields = ('created_at',)
 
+    def list(self, request, *args, **kwargs):
+        mapper = values_mapper(self.get_serializer_class())
+        queryset = self.filter_queryset(self.get_queryset()).values(*mapper.columns, *self.values_extra_fields)
+        page = self.paginate_queryset(queryset)
+        data = mapper.map(page if page is not None else queryset)
+        if page is not None:
+            return self.get_paginated_response(data)
+        return Response(data)
 
-class AdListAPIView(ListAPIView):
-    """Контроллер для просмотра списка всех объявлений"""
+
+class AdListAPIView(ReplicaReadMixin, CachedListMixin, ValuesListMixin, ListAPIView):
+    """
+    Контроллер для просмотра списка всех объявлений.
+
+    Фильтры AdFilterSet (price_min, price_max, author, created_after,
+    created_before, ordering) сочетаются с поиском ?search=. Правило
+    совпадения поиска задает движок settings.SEARCH_BACKEND: подстрока,
+    полнотекстовый поиск PostgreSQL или начало слова для
+    InvertedIndexSearchBackend (см. BaseSearchBackend.search).
+    """
 
     queryset = Ad.objects.all()
     serializer_class = AdSerializer
-    filter_backends = (SearchFilter,)
+    filter_backends = (AdSearchFilter, DjangoFilterBackend)
+    filterset_class = AdFilterSet
     search_fields = (
         "title",
         "description",
     )
     permission_classes = [AllowAny]
-    pagination_class = CustomPagination
+    pagination_class = OptionalCursorPagination
+    cache_namespace = 'ads'
 
 
-class AdRetrieveAPIView(RetrieveAPIView):
-    """Контроллер для просмотра объявления"""
+class FacetsMixin:
+    """Ответ со счетчиками фасетов по отфильтрованному queryset"""
+
+    def list(self, request, *args, **kwargs):
+        return Response(get_facets(self.filter_queryset(self.get_queryset())))
+
+    def get(self, request, *args, **kwargs):
+        return self.list(request, *args, **kwargs)
+
+
+class AdFacetsAPIView(ReplicaReadMixin, CachedListMixin, FacetsMixin, GenericAPIView):
+    """Контроллер для счетчиков по цене и дате с теми же фильтрами и поиском, что у списка объявлений"""
+
     queryset = Ad.objects.all()
-    serializer_class = AdSerializer
+    filter_backends = (AdSearchFilter, DjangoFilterBackend)
+    filterset_class = AdFilterSet
+    search_fields = AdListAPIView.search_fields
+    permission_classes = [AllowAny]
+    cache_namespace = 'ads'
+
+
+class AdRetrieveAPIView(ReplicaReadMixin, CachedRetrieveMixin, RetrieveAPIView):
+    """Контроллер для просмотра объявления"""
+    queryset = AdDetailSerializer.get_queryset()
+    serializer_class = AdDetailSerializer
     permission_classes = [IsAuthenticated]
+    object_cache = ad_detail_cache
 
 
 class AdUpdateAPIView(UpdateAPIView):
@@ -65,21 +159,282 @@ class AdDestroyAPIView(DestroyAPIView):
     )
 
 
-class UsersAdListAPIView(ListAPIView):
-    """Контроллер для просмотра списка объявлений пользователя"""
+class AdImageCreateAPIView(CreateAPIView):
+    """
+    Контроллер для загрузки изображения объявления.
 
-    queryset = Ad.objects.all()
-    serializer_class = AdSerializer
+    Файл пишется на диск по частям без буферизации в памяти, миниатюру
+    и WebP строит задача Celery после коммита.
+    """
+
+    queryset = AdImage.objects.all()
+    serializer_class = AdImageSerializer
+    parser_classes = (MultiPartParser,)
     permission_classes = (
         IsAuthenticated,
-        IsAuthor,
+        IsAuthor | IsAdmin,
     )
-    pagination_class = CustomPagination
+
+    def initialize_request(self, request, *args, **kwargs):
+        self.upload_handler = HashingUploadHandler(request)
+        request.upload_handlers = [self.upload_handler]
+        return super().initialize_request(request, *args, **kwargs)
+
+    def create(self, request, *args, **kwargs):
+        # Права на объявление проверяются до чтения тела запроса
+        self.ad = get_object_or_404(Ad.objects.only('pk', 'author_id'), pk=self.kwargs['pk'])
+        self.check_object_permissions(request, self.ad)
+        data = request.data
+        if self.upload_handler.too_large:
+            raise ValidationError({'image': f'Размер файла больше {settings.AD_IMAGE_MAX_UPLOAD_SIZE} байт.'})
+        serializer = self.get_serializer(data=data)
+        serializer.is_valid(raise_exception=True)
+        self.perform_create(serializer)
+        return Response(serializer.data, status=status.HTTP_201_CREATED)
+
+    def perform_create(self, serializer):
+        image = serializer.save(ad=self.ad)
+        transaction.on_commit(lambda: make_ad_image_variants.delay(image.pk))
+
+
+class AdBulkAPIView(GenericAPIView):
+    """
+    Контроллер для массового создания, изменения и удаления объявлений.
+
+    Принимает массив в JSON или NDJSON. Все элементы проверяются за один проход,
+    и если хотя бы один не прошел проверку, ничего не записывается. Запись
+    идет пачками по batch_size в одной транзакции. Ответ содержит результат
+    для каждого элемента.
+    """
+
+    queryset = Ad.objects.all()
+    serializer_class = AdSerializer
+    parser_classes = (ORJSONParser, NDJSONParser)
+    permission_classes = (IsAuthenticated,)
+    object_permission_classes = (IsAuthor | IsAdmin,)
+    batch_size = 500
+    max_items = 10000
+
+    def get_items(self):
+        """Проверка, что тело запроса - непустой массив допустимого размера"""
+        items = self.request.data
+        if not isinstance(items, list) or not items:
+            raise ValidationError('Ожидается непустой массив объявлений.')
+        if len(items) > self.max_items:
+            raise ValidationError(f'За один запрос можно обработать не более {self.max_items} объявлений.')
+        return items
+
+    def get_item_ids(self, items, plain_ids=False):
+        """Идентификаторы изменяемых объектов: объекты с полем id или, если разрешено, сами числа"""
+        ids = []
+        for item in items:
+            if isinstance(item, dict):
+                pk = item.get('id')
+            else:
+                pk = item if plain_ids else None
+            ids.append(pk if isinstance(pk, int) and not isinstance(pk, bool) else None)
+        return ids
+
+    def get_objects(self, ids):
+        """Объявления по идентификаторам с признаком доступа одним запросом"""
+        queryset = ObjectPermissionFilter.annotate(self.request, self.get_queryset(), self)
+        return queryset.in_bulk([pk for pk in ids if pk is not None])
+
+    def check_item(self, index, pk, objects, seen):
+        """Результат с ошибкой для элемента с неверным, повторным, чужим или неизвестным id"""
+        if pk is None:
+            return {'index': index, 'status': status.HTTP_400_BAD_REQUEST, 'errors': {'id': ['Укажите id.']}}
+        if pk in seen:
+            return {'index': index, 'id': pk, 'status': status.HTTP_400_BAD_REQUEST,
+                    'errors': {'id': ['Повторный id.']}}
+        seen.add(pk)
+        if pk not in objects:
+            return {'index': index, 'id': pk, 'status': status.HTTP_404_NOT_FOUND}
+        if not objects[pk].permitted:
+            return {'index': index, 'id': pk, 'status': status.HTTP_403_FORBIDDEN}
+        return None
+
+    @staticmethod
+    def failed(results):
+        return any(result['status'] >= 400 for result in results)
+
+    def error_response(self, results):
+        return Response({'results': results}, status=status.HTTP_400_BAD_REQUEST)
+
+    def post(self, request, *args, **kwargs):
+        """Массовое создание объявлений текущего пользователя"""
+        items = self.get_items()
+        serializers = [self.get_serializer(data=item) for item in items]
+        results = [
+            {'index': index, 'status': status.HTTP_201_CREATED}
+            if serializer.is_valid()
+            else {'index': index, 'status': status.HTTP_400_BAD_REQUEST, 'errors': serializer.errors}
+            for index, serializer in enumerate(serializers)
+        ]
+        if self.failed(results):
+            return self.error_response(results)
+
+        ads = [Ad(**serializer.validated_data, author_id=request.user.pk) for serializer in serializers]
+        with transaction.atomic():
+            Ad.objects.bulk_create(ads, batch_size=self.batch_size)
+            ads_saved(ads)
+            ads_created(ads)
+        for result, data in zip(results, self.get_serializer(ads, many=True).data):
+            result.update(id=data['id'], data=data)
+        return Response({'results': results}, status=status.HTTP_201_CREATED)
+
+    def patch(self, request, *args, **kwargs):
+        """Массовое частичное изменение объявлений, каждый элемент содержит id"""
+        items = self.get_items()
+        ids = self.get_item_ids(items)
+        objects = self.get_objects(ids)
+        results, serializers, seen = [], [], set()
+        for index, (item, pk) in enumerate(zip(items, ids)):
+            result = self.check_item(index, pk, objects, seen)
+            if result is None:
+                data = {key: value for key, value in item.items() if key != 'id'}
+                serializer = self.get_serializer(objects[pk], data=data, partial=True)
+                serializers.append(serializer)
+                if serializer.is_valid():
+                    result = {'index': index, 'id': pk, 'status': status.HTTP_200_OK}
+                else:
+                    result = {'index': index, 'id': pk, 'status': status.HTTP_400_BAD_REQUEST,
+                              'errors': serializer.errors}
+            results.append(result)
+        if self.failed(results):
+            return self.error_response(results)
+
+        fields = set()
+        for serializer in serializers:
+            for attr, value in serializer.validated_data.items():
+                setattr(serializer.instance, attr, value)
+                fields.add(attr)
+        ads = [serializer.instance for serializer in serializers]
+        if fields:
+            with transaction.atomic():
+                Ad.objects.bulk_update(ads, sorted(fields), batch_size=self.batch_size)
+                ads_saved(ads, fields)
+        for result, data in zip(results, self.get_serializer(ads, many=True).data):
+            result['data'] = data
+        return Response({'results': results})
+
+    def delete(self, request, *args, **kwargs):
+        """Массовое удаление объявлений по списку id"""
+        items = self.get_items()
+        ids = self.get_item_ids(items, plain_ids=True)
+        objects = self.get_objects(ids)
+        seen = set()
+        results = [
+            self.check_item(index, pk, objects, seen)
+            or {'index': index, 'id': pk, 'status': status.HTTP_204_NO_CONTENT}
+            for index, pk in enumerate(ids)
+        ]
+        if self.failed(results):
+            return self.error_response(results)
+
+        with transaction.atomic(), batched_author_stats():
+            for start in range(0, len(ids), self.batch_size):
+                Ad.objects.filter(pk__in=ids[start:start + self.batch_size]).delete()
+        return Response({'results': results})
+
+
+class ExportMixin:
+    """Общие параметры выгрузки: формат ?output=ndjson|csv и период создания"""
+
+    export_fields = ()
+    export_filename = None
+    output_query_param = 'output'
+
+    def get_output(self):
+        output = self.request.query_params.get(self.output_query_param, 'ndjson')
+        if output not in FORMATS:
+            raise ValidationError({self.output_query_param: f'Допустимые форматы: {", ".join(FORMATS)}.'})
+        return output
+
+    def parse_moment(self, name):
+        value = self.request.query_params.get(name)
+        if not value:
+            return None
+        try:
+            moment = parse_datetime(value)
+            if moment is None and (day := parse_date(value)) is not None:
+                moment = datetime.combine(day, time.min)
+        except ValueError:
+            moment = None
+        if moment is None:
+            raise ValidationError({name: 'Ожидается дата или дата и время в формате ISO 8601.'})
+        if timezone.is_naive(moment):
+            moment = timezone.make_aware(moment)
+        return moment
+
+    def filter_created_at(self, queryset):
+        created_after = self.parse_moment('created_after')
+        created_before = self.parse_moment('created_before')
+        if created_after:
+            queryset = queryset.filter(created_at__gte=created_after)
+        if created_before:
+            queryset = queryset.filter(created_at__lt=created_before)
+        return queryset
+
+    def get(self, request, *args, **kwargs):
+        output = self.get_output()
+        queryset = self.filter_created_at(self.filter_queryset(self.get_queryset())).order_by('pk')
+        return export_response(queryset, self.export_fields, output, self.export_filename)
+
+
+class AdExportAPIView(ExportMixin, GenericAPIView):
+    """Контроллер для потоковой выгрузки объявлений (фильтры author, created_after, created_before, search)"""
+
+    queryset = Ad.objects.all()
+    filter_backends = (AdSearchFilter,)
+    search_fields = (
+        "title",
+        "description",
+    )
+    permission_classes = (IsAuthenticated,)
+    export_fields = ('id', 'title', 'price', 'description', 'author', 'created_at')
+    export_filename = 'ads'
 
     def get_queryset(self):
-        """Список объявлений автора"""
-        author = self.request.user
-        return Ad.objects.filter(author=author)
+        queryset = super().get_queryset()
+        author = self.request.query_params.get('author')
+        if author:
+            if not author.isdigit():
+                raise ValidationError({'author': 'Ожидается id пользователя.'})
+            queryset = queryset.filter(author_id=author)
+        return queryset
+
+
+class FeedbackExportAPIView(ExportMixin, GenericAPIView):
+    """Контроллер для потоковой выгрузки отзывов объявления"""
+
+    queryset = Feedback.objects.all()
+    filter_backends = ()
+    permission_classes = (IsAuthenticated,)
+    export_fields = ('id', 'author', 'ad', 'text', 'created_at')
+
+    @property
+    def export_filename(self):
+        return f'ad_{self.kwargs["pk"]}_feedbacks'
+
+    def get_queryset(self):
+        pk = self.kwargs["pk"]
+        if not Ad.objects.filter(pk=pk).exists():
+            raise Http404("Указанного объявления не существует.")
+        return super().get_queryset().filter(ad_id=pk)
+
+
+class UsersAdListAPIView(ReplicaReadMixin, CachedObjectListMixin, ListAPIView):
+    """Контроллер для просмотра списка объявлений пользователя"""
+
+    queryset = Ad.objects.all()
+    serializer_class = AdSerializer
+    permission_classes = (IsAuthenticated,)
+    # Только объекты автора: условие разрешения добавляется в WHERE
+    filter_backends = (ObjectPermissionFilter,)
+    object_permission_classes = (IsAuthor,)
+    pagination_class = OptionalCursorPagination
+    object_cache = ad_cache
 
 
 class FeedbackCreateAPIView(CreateAPIView):
@@ -92,20 +447,22 @@ class FeedbackCreateAPIView(CreateAPIView):
 
     def perform_create(self, serializer):
         """Привязываем отзыв к автору и объявлению"""
-        feedback = serializer.save()
-        feedback.author = self.request.user
-        feedback.ad = Ad.objects.get(pk=self.kwargs["pk"])
-        print(feedback.ad)
-        feedback.save()
+        pk = self.kwargs["pk"]
+        if not Ad.objects.filter(pk=pk).exists():
+            raise Http404("Указанного объявления не существует.")
+        # Отзыв и счетчик отзывов объявления сохраняются вместе
+        with transaction.atomic():
+            serializer.save(author_id=self.request.user.pk, ad_id=pk)
 
 
-class FeedbackListAPIView(ListAPIView):
+class FeedbackListAPIView(ReplicaReadMixin, CachedObjectListMixin, ListAPIView):
     """Контроллер для просмотра всех отзывов объявления"""
 
     queryset = Feedback.objects.all()
     serializer_class = FeedbackSerializer
     permission_classes = (IsAuthenticated,)
-    pagination_class = CustomPagination
+    pagination_class = OptionalCursorPagination
+    object_cache = feedback_cache
 
     def get_queryset(self):
         """Метод для получения отзывов объявления"""
@@ -118,12 +475,13 @@ class FeedbackListAPIView(ListAPIView):
         return feedbacks_list
 
 
-class FeedbackRetrieveAPIView(RetrieveAPIView):
+class FeedbackRetrieveAPIView(ReplicaReadMixin, CachedRetrieveMixin, RetrieveAPIView):
     """Контроллер для просмотра одного отзыва"""
 
     queryset = Feedback.objects.all()
     serializer_class = FeedbackSerializer
     permission_classes = (IsAuthenticated,)
+    object_cache = feedback_cache
 
 
 class FeedbackUpdateAPIView(UpdateAPIView):
@@ -147,19 +505,61 @@ class FeedbackDestroyAPIView(DestroyAPIView):
         IsAuthor | IsAdmin,
     )
 
+    def perform_destroy(self, instance):
+        # Удаление отзыва и уменьшение счетчика отзывов объявления выполняются вместе
+        with transaction.atomic():
+            instance.delete()
 
-class UsersFeedbackListAPIView(ListAPIView):
+
+class UsersFeedbackListAPIView(ReplicaReadMixin, CachedObjectListMixin, ListAPIView):
     """Контроллер для просмотра списка отзывов пользователя"""
 
     queryset = Feedback.objects.all()
     serializer_class = FeedbackSerializer
+    permission_classes = (IsAuthenticated,)
+    # Только объекты автора: условие разрешения добавляется в WHERE
+    filter_backends = (ObjectPermissionFilter,)
+    object_permission_classes = (IsAuthor,)
+    pagination_class = OptionalCursorPagination
+    object_cache = feedback_cache
+
+
+class ObjectCacheStatsAPIView(APIView):
+    """Контроллер для просмотра статистики кеша объектов"""
+
     permission_classes = (
         IsAuthenticated,
-        IsAuthor,
+        IsAdmin,
     )
-    pagination_class = CustomPagination
+    object_caches = (ad_cache, ad_detail_cache, feedback_cache)
 
-    def get_queryset(self):
-        """Метод для получения списка отзывов пользователя"""
-        author = self.request.user
-        return Feedback.objects.filter(author=author)
+    def get(self, request):
+        return Response({object_cache.name: object_cache.stats() for object_cache in self.object_caches})
+
+
+class MetricsAPIView(APIView):
+    """Контроллер для метрик запросов по адресам в текстовом формате Prometheus"""
+
+    permission_classes = (
+        IsAuthenticated,
+        IsAdmin,
+    )
+
+    def get(self, request):
+        return HttpResponse(metrics.registry.render(), content_type=metrics.CONTENT_TYPE)
+
+
+class AuthorStatsRetrieveAPIView(RetrieveAPIView):
+    """Контроллер для просмотра статистики пользователя одним чтением по первичному ключу"""
+
+    queryset = AuthorStats.objects.all()
+    serializer_class = AuthorStatsSerializer
+    permission_classes = (IsAuthenticated,)
+
+    def get_object(self):
+        try:
+            return super().get_object()
+        except Http404:
+            # Строки нет у пользователей, созданных без сигналов (например, bulk_create)
+            AuthorStats.reconcile(User.objects.filter(pk=self.kwargs['pk']))
+            return super().get_object()
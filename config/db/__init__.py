@@ -0,0 +1,57 @@
+"""
+Бэкенды PostgreSQL с замером времени получения соединения.
+
+Время открытия соединения и проверки его работоспособности накапливается
+в ConnectionMetrics текущего запроса (см. ConnectionMetricsMiddleware).
+"""
+import time
+from contextvars import ContextVar
+
+_metrics = ContextVar('db_connection_metrics', default=None)
+
+
+class ConnectionMetrics:
+    """Число открытых соединений и суммарное время их получения за запрос"""
+
+    def __init__(self):
+        self.connections = 0
+        self.acquire_time = 0.0
+
+    @property
+    def acquire_ms(self):
+        return self.acquire_time * 1000
+
+
+def start_metrics():
+    """Новый счетчик для текущего контекста и токен для его сброса"""
+    metrics = ConnectionMetrics()
+    return metrics, _metrics.set(metrics)
+
+
+def reset_metrics(token):
+    _metrics.reset(token)
+
+
+def record(seconds, connected=False):
+    metrics = _metrics.get()
+    if metrics is not None:
+        metrics.acquire_time += seconds
+        metrics.connections += connected
+
+
+class ConnectionMetricsMixin:
+    """Замер connect() и проверки CONN_HEALTH_CHECKS в DatabaseWrapper"""
+
+    def connect(self):
+        started = time.perf_counter()
+        try:
+            super().connect()
+        finally:
+            record(time.perf_counter() - started, connected=True)
+
+    def close_if_health_check_failed(self):
+        started = time.perf_counter()
+        try:
+            super().close_if_health_check_failed()
+        finally:
+            record(time.perf_counter() - started)
@@ -0,0 +1,102 @@
+import threading
+import time
+import weakref
+
+import psycopg2.extras
+from django.core.exceptions import ImproperlyConfigured
+from django.db.backends.postgresql.psycopg_any import IsolationLevel
+from psycopg2 import pool
+
+from config.db.postgresql import base
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+    """
+    PostgreSQL с пулом соединений на процесс.
+
+    Под ASGI каждый запрос выполняет запросы ORM в своем потоке, поэтому
+    постоянные соединения (CONN_MAX_AGE) там копятся по числу потоков.
+    Этот бэкенд берет соединение из psycopg2 ThreadedConnectionPool при
+    первом запросе к базе и возвращает его в пул при закрытии в конце
+    запроса (CONN_MAX_AGE = 0). Размер пула и время ожидания свободного
+    соединения задаются в DATABASES[...]['POOL']: MIN_SIZE, MAX_SIZE, TIMEOUT.
+    При CONN_HEALTH_CHECKS перед выдачей из пула проверяется соединение,
+    пролежавшее в пуле дольше HEALTH_CHECK_IDLE секунд.
+    """
+
+    pool_defaults = {'MIN_SIZE': 1, 'MAX_SIZE': 10, 'TIMEOUT': 5, 'HEALTH_CHECK_IDLE': 30}
+    pool_wait_interval = 0.01
+    pools = {}
+    pools_lock = threading.Lock()
+    # Время возврата соединений в пул
+    returned_at = weakref.WeakKeyDictionary()
+
+    @property
+    def pool_options(self):
+        return {**self.pool_defaults, **self.settings_dict.get('POOL', {})}
+
+    def get_pool(self, conn_params):
+        # Параметры входят в ключ: тестовая база получает свой пул
+        key = (self.alias, repr(sorted(conn_params.items())))
+        with self.pools_lock:
+            connection_pool = self.pools.get(key)
+            if connection_pool is None:
+                options = self.pool_options
+                connection_pool = pool.ThreadedConnectionPool(options['MIN_SIZE'], options['MAX_SIZE'], **conn_params)
+                self.pools[key] = connection_pool
+        return connection_pool
+
+    def is_pooled_connection_usable(self, connection):
+        if connection.closed:
+            return False
+        returned_at = self.returned_at.pop(connection, None)
+        if not self.settings_dict['CONN_HEALTH_CHECKS']:
+            return True
+        # Недавно возвращенное соединение не проверяется: иначе каждый запрос начинается с лишнего SELECT 1
+        if returned_at is not None and time.monotonic() - returned_at < self.pool_options['HEALTH_CHECK_IDLE']:
+            return True
+        try:
+            with connection.cursor() as cursor:
+                cursor.execute('SELECT 1')
+            if not connection.autocommit:
+                connection.rollback()
+        except psycopg2.Error:
+            return False
+        return True
+
+    def get_new_connection(self, conn_params):
+        options = self.settings_dict['OPTIONS']
+        try:
+            self.isolation_level = IsolationLevel(options.get('isolation_level', IsolationLevel.READ_COMMITTED))
+        except ValueError:
+            raise ImproperlyConfigured(
+                f"Invalid transaction isolation level {options['isolation_level']} "
+                f"specified. Use one of the psycopg.IsolationLevel values."
+            )
+
+        self.connection_pool = self.get_pool(conn_params)
+        deadline = time.monotonic() + self.pool_options['TIMEOUT']
+        while True:
+            try:
+                connection = self.connection_pool.getconn()
+            except pool.PoolError:
+                # Все соединения заняты: ждем освобождения не дольше TIMEOUT
+                if time.monotonic() >= deadline:
+                    raise
+                time.sleep(self.pool_wait_interval)
+                continue
+            if self.is_pooled_connection_usable(connection):
+                break
+            self.connection_pool.putconn(connection, close=True)
+
+        if 'isolation_level' in options:
+            connection.isolation_level = self.isolation_level
+        psycopg2.extras.register_default_jsonb(conn_or_curs=connection, loads=lambda x: x)
+        return connection
+
+    def _close(self):
+        if self.connection is not None:
+            # Незавершенная транзакция откатывается пулом, разорванное соединение отбрасывается
+            self.returned_at[self.connection] = time.monotonic()
+            with self.wrap_database_errors:
+                self.connection_pool.putconn(self.connection)
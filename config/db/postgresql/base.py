@@ -0,0 +1,8 @@
+from django.db.backends.postgresql import base
+
+from config.db import ConnectionMetricsMixin
+from config.routers import ReplicaHealthMixin
+
+
+class DatabaseWrapper(ReplicaHealthMixin, ConnectionMetricsMixin, base.DatabaseWrapper):
+    """Стандартный бэкенд PostgreSQL с замером времени получения соединения и исключением недоступной реплики"""
@@ -0,0 +1,55 @@
+"""
+Пакетная очистка данных периодическими задачами Celery.
+
+Строки обрабатываются пачками по диапазонам pk: граница пачки находится
+по индексу первичного ключа, а каждая пачка выполняется в своей короткой
+транзакции, поэтому очистка большой таблицы не держит долгих блокировок.
+Число обработанных строк, пачек и время выполнения пишутся в лог
+config.housekeeping и возвращаются как результат задачи.
+"""
+import logging
+import time
+
+from django.conf import settings
+from django.db import transaction
+
+logger = logging.getLogger('config.housekeeping')
+
+
+def pk_range_batches(queryset, batch_size):
+    """Части queryset по диапазонам pk, в каждой не больше batch_size строк"""
+    queryset = queryset.order_by('pk')
+    last = None
+    while True:
+        rest = queryset if last is None else queryset.filter(pk__gt=last)
+        upper = next(iter(rest.values_list('pk', flat=True)[batch_size - 1:batch_size]), None)
+        if upper is None:
+            yield rest
+            return
+        yield rest.filter(pk__lte=upper)
+        last = upper
+
+
+def delete_rows(queryset):
+    """Удаление строк queryset; возвращается число удаленных строк самой модели без каскада"""
+    _, deleted = queryset.delete()
+    return deleted.get(queryset.model._meta.label, 0)
+
+
+def run_in_batches(name, queryset, action=delete_rows, batch_size=None):
+    """
+    Выполнение action над queryset пачками по диапазонам pk.
+
+    action получает часть queryset и возвращает число обработанных строк.
+    Возвращает метрики запуска: rows, batches и duration_ms.
+    """
+    batch_size = batch_size or settings.HOUSEKEEPING_BATCH_SIZE
+    started = time.perf_counter()
+    rows = batches = 0
+    for batch in pk_range_batches(queryset, batch_size):
+        with transaction.atomic():
+            rows += action(batch)
+        batches += 1
+    metrics = {'rows': rows, 'batches': batches, 'duration_ms': round((time.perf_counter() - started) * 1000, 3)}
+    logger.info('%s: обработано строк %s, пачек %s за %.3f мс', name, rows, batches, metrics['duration_ms'])
+    return metrics
@@ -0,0 +1,257 @@
+"""
+Метрики запросов: число SQL-запросов, время в базе, время сериализации,
+время отрисовки ответа и общее время (см. RequestMetricsMiddleware).
+
+Запросы к базе записывает обертка execute_wrapper, которая ставится на
+каждое соединение, в RequestMetrics текущего контекста. Сериализация -
+это свойство data сериализаторов DRF и ValuesMapper.map. Контекст
+копируется в потоки sync_to_async, поэтому учитываются и запросы
+асинхронных представлений. Итоги по адресам копятся в гистограммах
+процесса и отдаются в текстовом формате Prometheus.
+"""
+import re
+import threading
+import time
+import traceback
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+from rest_framework import serializers
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+QUERY_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100)
+
+_metrics = ContextVar('request_metrics', default=None)
+
+# Разные значения в списке IN и числа в тексте запроса не отличают повторяющиеся запросы
+_IN_LIST_RE = re.compile(r'IN \((?:%s, )*%s\)')
+_NUMBER_RE = re.compile(r'\b\d+\b')
+
+
+def normalize(sql):
+    return _NUMBER_RE.sub('N', _IN_LIST_RE.sub('IN (...)', sql))
+
+
+def project_stack():
+    """Стек вызова без кадров библиотек и этого модуля"""
+    frames = [
+        frame for frame in traceback.extract_stack()
+        if frame.filename.startswith(str(settings.BASE_DIR))
+        and 'site-packages' not in frame.filename and frame.filename != __file__
+    ]
+    return ''.join(traceback.format_list(frames))
+
+
+class RequestMetrics:
+    """
+    Метрики одного запроса.
+
+    Запрос, повторенный REQUEST_DUPLICATE_QUERIES раз с разными параметрами,
+    попадает в duplicates вместе со стеком вызова на момент последнего повтора.
+    """
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db_time = 0.0
+        self.serialize_time = 0.0
+        self.serializing = False
+        self.render_time = 0.0
+        self.patterns = Counter()
+        self.duplicates = {}
+
+    def record_query(self, sql, seconds):
+        self.queries += 1
+        self.db_time += seconds
+        pattern = normalize(sql)
+        self.patterns[pattern] += 1
+        if self.patterns[pattern] == settings.REQUEST_DUPLICATE_QUERIES:
+            self.duplicates[pattern] = project_stack()
+
+    def elapsed(self):
+        return time.perf_counter() - self.started
+
+
+def start_metrics():
+    """Новые метрики для текущего контекста и токен для их сброса"""
+    metrics = RequestMetrics()
+    return metrics, _metrics.set(metrics)
+
+
+def reset_metrics(token):
+    _metrics.reset(token)
+
+
+def current_metrics():
+    return _metrics.get()
+
+
+def record_query(execute, sql, params, many, context):
+    metrics = _metrics.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    started = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.record_query(sql, time.perf_counter() - started)
+
+
+def install(connection):
+    if record_query not in connection.execute_wrappers:
+        connection.execute_wrappers.append(record_query)
+
+
+@receiver(connection_created)
+def install_on_connect(sender, connection, **kwargs):
+    install(connection)
+
+
+@contextmanager
+def serialization():
+    """
+    Учет времени блока как времени сериализации текущего запроса.
+
+    Вложенный блок не учитывается повторно. Время SQL-запросов внутри блока
+    (ленивый queryset, prefetch) вычитается: оно уже входит в db.
+    """
+    metrics = _metrics.get()
+    if metrics is None or metrics.serializing:
+        yield
+        return
+    metrics.serializing = True
+    started, db_time = time.perf_counter(), metrics.db_time
+    try:
+        yield
+    finally:
+        metrics.serializing = False
+        metrics.serialize_time += time.perf_counter() - started - (metrics.db_time - db_time)
+
+
+def timed_data(data):
+    """Свойство data сериализатора, время которого учитывается в метриках запроса"""
+    @wraps(data.fget)
+    def fget(serializer):
+        with serialization():
+            return data.fget(serializer)
+
+    return property(fget)
+
+
+# Serializer.data и ListSerializer.data вызывают BaseSerializer.data через super()
+serializers.BaseSerializer.data = timed_data(serializers.BaseSerializer.data)
+
+
+def escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def format_labels(names, values, **extra):
+    pairs = [*zip(names, values), *extra.items()]
+    return '{' + ','.join(f'{name}="{escape(value)}"' for name, value in pairs) + '}'
+
+
+class Histogram:
+    """Гистограмма Prometheus с набором меток; защищается блокировкой реестра"""
+
+    def __init__(self, name, description, buckets, labels=('route', 'method')):
+        self.name = name
+        self.description = description
+        self.buckets = buckets
+        self.labels = labels
+        self.series = {}
+
+    def observe(self, labels, value):
+        series = self.series.get(labels)
+        if series is None:
+            # Счетчики корзин, сумма и количество наблюдений
+            series = self.series[labels] = [0] * len(self.buckets) + [0, 0]
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                series[i] += 1
+        series[-2] += value
+        series[-1] += 1
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.description}', f'# TYPE {self.name} histogram']
+        for labels, series in sorted(self.series.items()):
+            for bound, count in zip(self.buckets, series):
+                lines.append(f'{self.name}_bucket{format_labels(self.labels, labels, le=bound)} {count}')
+            lines.append(f'{self.name}_bucket{format_labels(self.labels, labels, le="+Inf")} {series[-1]}')
+            lines.append(f'{self.name}_sum{format_labels(self.labels, labels)} {series[-2]}')
+            lines.append(f'{self.name}_count{format_labels(self.labels, labels)} {series[-1]}')
+        return lines
+
+
+class CounterMetric:
+    """Счетчик Prometheus с набором меток"""
+
+    def __init__(self, name, description, labels):
+        self.name = name
+        self.description = description
+        self.labels = labels
+        self.series = Counter()
+
+    def inc(self, labels, value=1):
+        self.series[labels] += value
+
+    def render(self):
+        lines = [f'# HELP {self.name} {self.description}', f'# TYPE {self.name} counter']
+        for labels, value in sorted(self.series.items()):
+            lines.append(f'{self.name}{format_labels(self.labels, labels)} {value}')
+        return lines
+
+
+class Registry:
+    """Метрики запросов по адресам (имени представления) и методам за время жизни процесса"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.requests = CounterMetric(
+                'http_requests_total', 'Количество запросов', ('route', 'method', 'status'),
+            )
+            self.duplicates = CounterMetric(
+                'http_request_duplicate_queries_total', 'Запросы с повторяющимися SQL-запросами', ('route', 'method'),
+            )
+            self.duration = Histogram('http_request_duration_seconds', 'Время обработки запроса', DURATION_BUCKETS)
+            self.db_duration = Histogram('http_request_db_duration_seconds', 'Время SQL-запросов', DURATION_BUCKETS)
+            self.serialize_duration = Histogram(
+                'http_request_serialize_duration_seconds', 'Время сериализации', DURATION_BUCKETS,
+            )
+            self.render_duration = Histogram(
+                'http_request_render_duration_seconds', 'Время отрисовки ответа', DURATION_BUCKETS,
+            )
+            self.db_queries = Histogram('http_request_db_queries', 'Количество SQL-запросов', QUERY_BUCKETS)
+
+    def observe(self, route, method, status, metrics, seconds):
+        labels = (route, method)
+        with self.lock:
+            self.requests.inc((route, method, str(status)))
+            if metrics.duplicates:
+                self.duplicates.inc(labels)
+            self.duration.observe(labels, seconds)
+            self.db_duration.observe(labels, metrics.db_time)
+            self.serialize_duration.observe(labels, metrics.serialize_time)
+            self.render_duration.observe(labels, metrics.render_time)
+            self.db_queries.observe(labels, metrics.queries)
+
+    def render(self):
+        with self.lock:
+            metrics = (
+                self.requests, self.duplicates, self.duration, self.db_duration, self.serialize_duration, self.render_duration, self.db_queries,
+            )
+            return '\n'.join(line for metric in metrics for line in metric.render()) + '\n'
+
+
+registry = Registry()
@@ -0,0 +1,178 @@
+import logging
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.db import connections
+from rest_framework.permissions import SAFE_METHODS
+
+from config import metrics as request_metrics
+from config.db import reset_metrics, start_metrics
+from config.routers import PIN_COOKIE
+
+logger = logging.getLogger('config.db')
+metrics_logger = logging.getLogger('config.metrics')
+
+
+def append_server_timing(response, timing):
+    if response.has_header('Server-Timing'):
+        timing = f"{response['Server-Timing']}, {timing}"
+    response['Server-Timing'] = timing
+
+
+class ConnectionMetricsMiddleware:
+    """
+    Время получения соединений с базой за запрос.
+
+    Результат добавляется в заголовок Server-Timing как db-connect
+    и пишется в лог config.db. Работает и в синхронном, и в асинхронном
+    стеке, не переключая запрос между ними.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        metrics, token = start_metrics()
+        try:
+            response = self.get_response(request)
+        finally:
+            reset_metrics(token)
+        return self.process_response(request, response, metrics)
+
+    async def __acall__(self, request):
+        metrics, token = start_metrics()
+        try:
+            response = await self.get_response(request)
+        finally:
+            reset_metrics(token)
+        return self.process_response(request, response, metrics)
+
+    @staticmethod
+    def process_response(request, response, metrics):
+        append_server_timing(response, f'db-connect;dur={metrics.acquire_ms:.3f};desc="{metrics.connections}"')
+        logger.debug(
+            '%s %s: соединений с базой %s, получение %.3f мс',
+            request.method, request.path, metrics.connections, metrics.acquire_ms,
+        )
+        return response
+
+
+class ReplicaPinMiddleware:
+    """
+    Закрепление чтения за основной базой после записи.
+
+    Успешный небезопасный запрос ставит cookie на REPLICA_PIN_SECONDS,
+    и пока она есть, списки и просмотр читают данные из основной базы,
+    а не с реплики, которая может еще не получить изменения.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return self.process_response(request, self.get_response(request))
+
+    async def __acall__(self, request):
+        return self.process_response(request, await self.get_response(request))
+
+    @staticmethod
+    def process_response(request, response):
+        if settings.DATABASE_REPLICAS and request.method not in SAFE_METHODS and response.status_code < 400:
+            response.set_cookie(PIN_COOKIE, '1', max_age=settings.REPLICA_PIN_SECONDS, httponly=True, samesite='Lax')
+        return response
+
+
+class RequestMetricsMiddleware:
+    """
+    Число SQL-запросов, время в базе, время сериализации, время отрисовки
+    ответа и общее время запроса.
+
+    Значения добавляются в заголовок Server-Timing (db, serialize, render, total)
+    и в гистограммы по имени представления, которые отдает /callboard/metrics/.
+    Запросы дольше REQUEST_SLOW_MS и SQL-запросы, повторенные
+    REQUEST_DUPLICATE_QUERIES раз (N+1), пишутся в лог config.metrics
+    со стеком вызова. Стоит первым в MIDDLEWARE, чтобы учитывать время
+    остальных middleware. Для потоковых ответов учитывается время до
+    начала передачи.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        # Соединения, открытые до загрузки middleware, не получили обертку при подключении
+        for connection in connections.all(initialized_only=True):
+            request_metrics.install(connection)
+        metrics, token = request_metrics.start_metrics()
+        try:
+            response = self.get_response(request)
+        finally:
+            request_metrics.reset_metrics(token)
+        return self.process_response(request, response, metrics)
+
+    async def __acall__(self, request):
+        metrics, token = request_metrics.start_metrics()
+        try:
+            response = await self.get_response(request)
+        finally:
+            request_metrics.reset_metrics(token)
+        return self.process_response(request, response, metrics)
+
+    def process_template_response(self, request, response):
+        """Замер отрисовки ответа DRF, которая выполняется сразу после этого метода"""
+        metrics = request_metrics.current_metrics()
+        if metrics is not None:
+            started = time.perf_counter()
+
+            def rendered(response):
+                metrics.render_time += time.perf_counter() - started
+
+            response.add_post_render_callback(rendered)
+        return response
+
+    @staticmethod
+    def process_response(request, response, metrics):
+        seconds = metrics.elapsed()
+        append_server_timing(
+            response,
+            f'db;dur={metrics.db_time * 1000:.3f};desc="{metrics.queries}", '
+            f'serialize;dur={metrics.serialize_time * 1000:.3f}, render;dur={metrics.render_time * 1000:.3f}, '
+            f'total;dur={seconds * 1000:.3f}',
+        )
+        route = request.resolver_match.view_name if request.resolver_match else 'unmatched'
+        request_metrics.registry.observe(route, request.method, response.status_code, metrics, seconds)
+
+        if seconds * 1000 >= settings.REQUEST_SLOW_MS:
+            metrics_logger.warning(
+                'Медленный запрос %s %s (%s): %s, %.3f мс, SQL-запросов %s за %.3f мс',
+                request.method, request.path, route, response.status_code,
+                seconds * 1000, metrics.queries, metrics.db_time * 1000,
+            )
+        for pattern, stack in metrics.duplicates.items():
+            metrics_logger.warning(
+                'Повторяющийся SQL-запрос в %s %s (%s), выполнен %s раз: %s\n%s',
+                request.method, request.path, route, metrics.patterns[pattern], pattern, stack,
+            )
+        return response
@@ -0,0 +1,161 @@
+"""
+Маршрутизация чтения на реплики базы данных.
+
+Чтение уходит на реплику только внутри replica_reads(): его включают
+представления списков и просмотра (ReplicaReadMixin) для безопасных
+методов. После записи чтение закрепляется за основной базой: до конца
+запроса и на REPLICA_PIN_SECONDS по cookie, которую ставит
+ReplicaPinMiddleware. Роутер выбирает реплику без обращения к базе, поэтому
+его можно вызывать и в event loop. Реплика, к которой не удалось
+подключиться или запрос к которой оборвался, исключается на
+REPLICA_RETRY_SECONDS (см. ReplicaHealthMixin), без доступных реплик
+чтение идет в основную базу.
+
+Кеши ответов и объектов заполняются только из основной базы (primary_reads),
+чтобы отстающая реплика не вернула в кеш данные, устаревшие после
+инвалидации, а закрепленные запросы кеш не читают (pinned_to_primary).
+"""
+import random
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, InterfaceError, OperationalError, connections
+from rest_framework.permissions import SAFE_METHODS
+
+PIN_COOKIE = 'pin_primary'
+
+_reads = ContextVar('replica_reads', default=None)
+
+
+class ReplicaReads:
+    """Разрешение читать с реплики в текущем запросе"""
+
+    def __init__(self, enabled):
+        self.enabled = enabled
+
+
+def is_pinned(request):
+    return request.method not in SAFE_METHODS or PIN_COOKIE in request.COOKIES
+
+
+@contextmanager
+def replica_reads(request):
+    """Чтение с реплик на время обработки запроса, если он не закреплен за основной базой"""
+    token = _reads.set(ReplicaReads(not is_pinned(request)))
+    try:
+        yield
+    finally:
+        _reads.reset(token)
+
+
+@contextmanager
+def primary_reads():
+    """Чтение из основной базы внутри блока, например при заполнении кеша"""
+    token = _reads.set(ReplicaReads(False))
+    try:
+        yield
+    finally:
+        _reads.reset(token)
+
+
+def pinned_to_primary():
+    """Чтение запроса закреплено за основной базой: небезопасный метод, cookie закрепления или запись в запросе"""
+    reads = _reads.get()
+    return bool(settings.DATABASE_REPLICAS) and reads is not None and not reads.enabled
+
+
+class ReplicaPool:
+    """Реплики из settings.DATABASE_REPLICAS с исключением недоступных"""
+
+    def __init__(self):
+        self.down_until = {}
+        self.lock = threading.Lock()
+
+    def is_available(self, alias):
+        """Реплика настроена и не исключена; соединение не открывается"""
+        return alias in connections.settings and self.down_until.get(alias, 0) <= time.monotonic()
+
+    def mark_down(self, alias):
+        with self.lock:
+            self.down_until[alias] = time.monotonic() + settings.REPLICA_RETRY_SECONDS
+
+    def choose(self):
+        aliases = list(settings.DATABASE_REPLICAS)
+        random.shuffle(aliases)
+        for alias in aliases:
+            if self.is_available(alias):
+                return alias
+        return None
+
+    def reset(self):
+        with self.lock:
+            self.down_until.clear()
+
+
+replicas = ReplicaPool()
+
+
+def mark_down_on_error(execute, sql, params, many, context):
+    """Обертка запросов к реплике: разрыв соединения исключает реплику из чтения"""
+    try:
+        return execute(sql, params, many, context)
+    except (InterfaceError, OperationalError):
+        replicas.mark_down(context['connection'].alias)
+        raise
+
+
+class ReplicaHealthMixin:
+    """Исключение реплики при ошибке подключения или оборванном запросе в DatabaseWrapper"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        if self.alias in settings.DATABASE_REPLICAS:
+            self.execute_wrappers.append(mark_down_on_error)
+
+    def connect(self):
+        try:
+            super().connect()
+        except self.Database.Error:
+            if self.alias in settings.DATABASE_REPLICAS:
+                replicas.mark_down(self.alias)
+            raise
+
+
+class ReplicaRouter:
+    """Чтение с реплик внутри replica_reads(), запись и миграции - только основная база"""
+
+    def db_for_read(self, model, **hints):
+        reads = _reads.get()
+        if reads is None or not reads.enabled or not settings.DATABASE_REPLICAS:
+            return None
+        return replicas.choose()
+
+    def db_for_write(self, model, **hints):
+        reads = _reads.get()
+        if reads is not None:
+            # Дальнейшее чтение в этом запросе должно видеть запись
+            reads.enabled = False
+        return DEFAULT_DB_ALIAS
+
+    def allow_relation(self, obj1, obj2, **hints):
+        # Реплики содержат те же данные, что и основная база
+        databases = {DEFAULT_DB_ALIAS, *settings.DATABASE_REPLICAS}
+        if obj1._state.db in databases and obj2._state.db in databases:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        if db in settings.DATABASE_REPLICAS:
+            return False
+        return None
+
+
+class ReplicaReadMixin:
+    """Представление, безопасные запросы которого читают данные с реплики"""
+
+    def dispatch(self, request, *args, **kwargs):
+        with replica_reads(request):
+            return super().dispatch(request, *args, **kwargs)
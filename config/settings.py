@@ -42,17 +42,22 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
 
     'rest_framework',
     'rest_framework_simplejwt',
     'drf_yasg',
     'django_celery_beat',
+    'django_filters',
 
     'users',
     'callboard',
 ]
 
 MIDDLEWARE = [
+    'config.middleware.RequestMetricsMiddleware',
+    'config.middleware.ConnectionMetricsMiddleware',
+    'config.middleware.ReplicaPinMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -88,15 +93,53 @@ WSGI_APPLICATION = 'config.wsgi.application'
 
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.postgresql_psycopg2',
+        'ENGINE': 'config.db.postgresql',
         'NAME': os.getenv('POSTGRES_DB'),
         'USER': os.getenv('POSTGRES_USER'),
         'PASSWORD': os.getenv('POSTGRES_PASSWORD'),
         'HOST': os.getenv('POSTGRES_HOST'),
         'PORT': os.getenv('POSTGRES_PORT'),
+        # Постоянные соединения на время (в секундах) и их проверка перед повторным использованием
+        'CONN_MAX_AGE': int(os.getenv('POSTGRES_CONN_MAX_AGE', 60)),
+        'CONN_HEALTH_CHECKS': os.getenv('POSTGRES_CONN_HEALTH_CHECKS', 'True') == 'True',
     }
 }
 
+# Пул соединений на процесс, рекомендуется при запуске под ASGI:
+# соединение возвращается в пул в конце каждого запроса
+if os.getenv('POSTGRES_POOL', False) == 'True':
+    DATABASES['default'].update({
+        'ENGINE': 'config.db.pooled',
+        'CONN_MAX_AGE': 0,
+        'POOL': {
+            'MIN_SIZE': int(os.getenv('POSTGRES_POOL_MIN_SIZE', 1)),
+            'MAX_SIZE': int(os.getenv('POSTGRES_POOL_MAX_SIZE', 10)),
+            'TIMEOUT': float(os.getenv('POSTGRES_POOL_TIMEOUT', 5)),
+            'HEALTH_CHECK_IDLE': float(os.getenv('POSTGRES_POOL_HEALTH_CHECK_IDLE', 30)),
+        },
+    })
+
+# Реплики для чтения: адреса host[:port] через запятую, остальные параметры как у основной базы
+DATABASE_REPLICAS = []
+for number, address in enumerate(filter(None, os.getenv('POSTGRES_REPLICAS', '').split(',')), start=1):
+    host, _, port = address.strip().partition(':')
+    alias = f'replica_{number}'
+    DATABASES[alias] = {
+        **DATABASES['default'],
+        'HOST': host,
+        'PORT': port or DATABASES['default']['PORT'],
+        'TEST': {'MIRROR': 'default'},
+    }
+    DATABASE_REPLICAS.append(alias)
+
+DATABASE_ROUTERS = ['config.routers.ReplicaRouter']
+
+# Время (в секундах), на которое чтение закрепляется за основной базой после записи
+REPLICA_PIN_SECONDS = int(os.getenv('REPLICA_PIN_SECONDS', 5))
+
+# Время (в секундах), на которое недоступная реплика исключается из чтения
+REPLICA_RETRY_SECONDS = int(os.getenv('REPLICA_RETRY_SECONDS', 30))
+
 # Password validation
 # https://docs.djangoproject.com/en/4.2/ref/settings/#auth-password-validators
 
@@ -141,6 +184,13 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 MEDIA_URL = 'media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Изображения объявлений: наибольший размер загрузки в байтах, наибольшая
+# сторона миниатюры и WebP-варианта в пикселях, качество WebP
+AD_IMAGE_MAX_UPLOAD_SIZE = int(os.getenv('AD_IMAGE_MAX_UPLOAD_SIZE', 10 * 1024 * 1024))
+AD_IMAGE_THUMBNAIL_SIZE = int(os.getenv('AD_IMAGE_THUMBNAIL_SIZE', 320))
+AD_IMAGE_WEBP_SIZE = int(os.getenv('AD_IMAGE_WEBP_SIZE', 1600))
+AD_IMAGE_WEBP_QUALITY = int(os.getenv('AD_IMAGE_WEBP_QUALITY', 80))
+
 AUTH_USER_MODEL = 'users.User'
 
 EMAIL_HOST = os.getenv('EMAIL_HOST')
@@ -152,6 +202,9 @@ EMAIL_USE_SSL = os.getenv('EMAIL_USE_SSL', False) == 'True'
 
 SERVER_EMAIL = EMAIL_HOST_USER
 DEFAULT_FROM_EMAIL = EMAIL_HOST_USER
+# Начальная и максимальная задержка повтора отправки писем, секунды
+EMAIL_RETRY_BACKOFF = int(os.getenv('EMAIL_RETRY_BACKOFF', 10))
+EMAIL_RETRY_BACKOFF_MAX = int(os.getenv('EMAIL_RETRY_BACKOFF_MAX', 600))
 
 CACHE_ENABLED = os.getenv('CACHE_ENABLED', False) == 'True'
 
@@ -163,20 +216,52 @@ if CACHE_ENABLED:
         }
     }
 
+# Время жизни закешированных ответов публичных списков, 0 - без кеширования.
+# Инвалидация видна другим процессам только через общий кеш, поэтому
+# без CACHE_ENABLED (кеш в памяти процесса) по умолчанию кеширование выключено
+RESPONSE_CACHE_TIMEOUT = int(os.getenv('RESPONSE_CACHE_TIMEOUT', 60 if CACHE_ENABLED else 0))
+# Время жизни объектов в кеше просмотра объявлений и отзывов, 0 - без кеширования;
+# как и кеш ответов, по умолчанию включен только с общим кешем
+OBJECT_CACHE_TIMEOUT = int(os.getenv('OBJECT_CACHE_TIMEOUT', 300 if CACHE_ENABLED else 0))
+
+# Поисковый движок объявлений: поиск средствами БД (PostgreSQL FTS / LIKE)
+# или callboard.search.inverted_index.InvertedIndexSearchBackend для окружений без PostgreSQL
+SEARCH_BACKEND = os.getenv('SEARCH_BACKEND', 'callboard.search.database.DatabaseSearchBackend')
+SEARCH_INDEX_PATH = os.getenv('SEARCH_INDEX_PATH', os.path.join(BASE_DIR, 'search_index.bin'))
+
+# Аутентификация по данным токена без загрузки пользователя из базы
+JWT_STATELESS = os.getenv('JWT_STATELESS', 'True') == 'True'
+# Сколько секунд процесс не перечитывает отметку отзыва токенов пользователя
+JWT_REVOCATION_CACHE_TTL = int(os.getenv('JWT_REVOCATION_CACHE_TTL', 5))
+
 REST_FRAMEWORK = {
     'DEFAULT_FILTER_BACKENDS': (
         'django_filters.rest_framework.DjangoFilterBackend',
     ),
     'DEFAULT_AUTHENTICATION_CLASSES': (
+        'users.authentication.StatelessJWTAuthentication'
+        if JWT_STATELESS else
         'rest_framework_simplejwt.authentication.JWTAuthentication',
     ),
     'DEFAULT_PERMISSION_CLASSES': [
         'rest_framework.permissions.IsAuthenticated',
     ],
+    # JSON через orjson; без установленного orjson работают стандартные классы DRF
+    'DEFAULT_RENDERER_CLASSES': (
+        'callboard.renderers.ORJSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ),
+    'DEFAULT_PARSER_CLASSES': (
+        'callboard.parsers.ORJSONParser',
+        'rest_framework.parsers.FormParser',
+        'rest_framework.parsers.MultiPartParser',
+    ),
 }
 SIMPLE_JWT = {
     "ACCESS_TOKEN_LIFETIME": timedelta(minutes=60),
     "REFRESH_TOKEN_LIFETIME": timedelta(days=1),
+    "TOKEN_USER_CLASS": "users.authentication.CallboardTokenUser",
+    "TOKEN_REFRESH_SERIALIZER": "users.serializers.UserTokenRefreshSerializer",
 }
 STRIPE_API_KEY = os.getenv('STRIPE_API_KEY')
 
@@ -184,14 +269,75 @@ CELERY_TIMEZONE = TIME_ZONE
 CELERY_TASK_TRACK_STARTED = True
 CELERY_TASK_TIME_LIMIT = 30 * 60
 
-CELERY_BROKER_URL = 'redis://localhost:6379/0'
+CELERY_BROKER_URL = os.getenv('CELERY_BROKER_URL', 'redis://localhost:6379/0')
+
+CELERY_RESULT_BACKEND = os.getenv('CELERY_RESULT_BACKEND', 'redis://localhost:6379/0')
 
-CELERY_RESULT_BACKEND = 'redis://localhost:6379/0'
+# Выполнение задач в процессе запроса, без брокера (локальный запуск, тесты)
+CELERY_TASK_ALWAYS_EAGER = os.getenv('CELERY_TASK_ALWAYS_EAGER', False) == 'True'
+CELERY_TASK_EAGER_PROPAGATES = True
 
 CELERY_BEAT_SCHEDULE = {
-    'block_users': {
-        'task': 'habits.tasks.',
-        'schedule': timedelta(minutes=1),
+    'reconcile_author_stats': {
+        'task': 'callboard.tasks.reconcile_author_stats',
+        'schedule': timedelta(hours=1),
+    },
+    'rebuild_search_index': {
+        'task': 'callboard.tasks.rebuild_search_index',
+        'schedule': timedelta(minutes=5),
+    },
+    'delete_expired_reset_tokens': {
+        'task': 'users.tasks.delete_expired_reset_tokens',
+        'schedule': timedelta(hours=1),
+    },
+    'delete_orphaned_feedback': {
+        'task': 'callboard.tasks.delete_orphaned_feedback',
+        'schedule': timedelta(days=1),
+    },
+    'delete_stale_ads': {
+        'task': 'callboard.tasks.delete_stale_ads',
+        'schedule': timedelta(days=1),
     },
 }
 
+# Очистка данных периодическими задачами: размер пачки удаления в строках,
+# срок хранения отзывов без объявления и объявлений без автора в днях,
+# срок хранения всех объявлений в днях (0 - без ограничения)
+HOUSEKEEPING_BATCH_SIZE = int(os.getenv('HOUSEKEEPING_BATCH_SIZE', 1000))
+ORPHAN_RETENTION_DAYS = int(os.getenv('ORPHAN_RETENTION_DAYS', 30))
+AD_RETENTION_DAYS = int(os.getenv('AD_RETENTION_DAYS', 0))
+
+# Метрики запросов (RequestMetricsMiddleware): порог медленного запроса
+# в миллисекундах и число повторов одного SQL-запроса, после которого
+# он считается N+1 и пишется в лог
+REQUEST_SLOW_MS = int(os.getenv('REQUEST_SLOW_MS', 500))
+REQUEST_DUPLICATE_QUERIES = int(os.getenv('REQUEST_DUPLICATE_QUERIES', 10))
+
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'formatters': {
+        'verbose': {
+            'format': '{asctime} {levelname} {name} {message}',
+            'style': '{',
+        },
+    },
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+            'formatter': 'verbose',
+        },
+    },
+    'loggers': {
+        'config': {
+            'handlers': ['console'],
+            'level': os.getenv('LOG_LEVEL', 'INFO'),
+            'propagate': False,
+        },
+        'callboard': {
+            'handlers': ['console'],
+            'level': os.getenv('LOG_LEVEL', 'INFO'),
+            'propagate': False,
+        },
+    },
+}
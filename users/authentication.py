@@ -0,0 +1,214 @@
+import math
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.utils import timezone
+from django.utils.functional import cached_property
+from rest_framework_simplejwt.authentication import JWTStatelessUserAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, InvalidToken
+from rest_framework_simplejwt.models import TokenUser
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from users.models import User
+
+REVOKED_KEY = 'users:revoked:{}'
+
+
+class RevocationCache:
+    """
+    Время отзыва токенов пользователей.
+
+    Источник истины - поле User.tokens_valid_after. Перед базой стоят общий
+    кеш (только при CACHE_ENABLED: кеш в памяти процесса другие процессы
+    не видят) на shared_timeout секунд и память процесса на ttl секунд,
+    поэтому проверка токена обычно не требует ни запроса к базе, ни обращения
+    к кешу. Вытеснение или очистка кеша отзыв не отменяет, а в другом процессе
+    отзыв начинает действовать не позже чем через ttl секунд.
+    """
+
+    max_entries = 10000
+    # Ограничивает и время, на которое гонка чтения с отзывом может оставить в кеше старое значение
+    shared_timeout = 60
+
+    def __init__(self):
+        self.local = {}
+        self.lock = threading.Lock()
+
+    @property
+    def ttl(self):
+        return settings.JWT_REVOCATION_CACHE_TTL
+
+    @property
+    def shared(self):
+        return settings.CACHE_ENABLED
+
+    @staticmethod
+    def load(user_id):
+        """Время отзыва из базы; токены удаленного пользователя отозваны все"""
+        rows = list(User.objects.filter(pk=user_id).values_list('tokens_valid_after', flat=True)[:1])
+        if not rows:
+            return math.inf
+        return rows[0].timestamp() if rows[0] else 0
+
+    @staticmethod
+    async def aload(user_id):
+        rows = [
+            value async for value in User.objects.filter(pk=user_id).values_list('tokens_valid_after', flat=True)[:1]
+        ]
+        if not rows:
+            return math.inf
+        return rows[0].timestamp() if rows[0] else 0
+
+    def cached(self, user_id, now):
+        entry = self.local.get(user_id)
+        if entry is not None and entry[1] > now:
+            return entry[0]
+        return None
+
+    def revoked_at(self, user_id):
+        """Время отзыва токенов пользователя или 0, если они не отзывались"""
+        now = time.monotonic()
+        value = self.cached(user_id, now)
+        if value is not None:
+            return value
+        value = cache.get(REVOKED_KEY.format(user_id)) if self.shared else None
+        if value is None:
+            value = self.load(user_id)
+            if self.shared:
+                cache.set(REVOKED_KEY.format(user_id), value, self.shared_timeout)
+        self.remember(user_id, value, now)
+        return value
+
+    async def arevoked_at(self, user_id):
+        """Вариант revoked_at для event loop: кеш через aget, база через асинхронный ORM"""
+        now = time.monotonic()
+        value = self.cached(user_id, now)
+        if value is not None:
+            return value
+        value = await cache.aget(REVOKED_KEY.format(user_id)) if self.shared else None
+        if value is None:
+            value = await self.aload(user_id)
+            if self.shared:
+                await cache.aset(REVOKED_KEY.format(user_id), value, self.shared_timeout)
+        self.remember(user_id, value, now)
+        return value
+
+    def revoke(self, user_id):
+        """
+        Отзыв всех токенов пользователя, выданных до текущего момента.
+
+        Возвращает записанное в базу время, чтобы загруженный экземпляр
+        пользователя не вернул прежнее значение при следующем save().
+        """
+        revoked = timezone.now()
+        value = revoked.timestamp() if User.objects.filter(pk=user_id).update(tokens_valid_after=revoked) else math.inf
+        self.remember(user_id, value, time.monotonic())
+        if self.shared:
+            transaction.on_commit(lambda: cache.set(REVOKED_KEY.format(user_id), value, self.shared_timeout))
+        return revoked
+
+    def remember(self, user_id, value, now):
+        with self.lock:
+            if len(self.local) >= self.max_entries:
+                self.local.clear()
+            self.local[user_id] = (value, now + self.ttl)
+
+    def clear(self):
+        with self.lock:
+            self.local.clear()
+
+    def is_revoked(self, token):
+        return self.issued_before(token, self.revoked_at(token[api_settings.USER_ID_CLAIM]))
+
+    async def ais_revoked(self, token):
+        return self.issued_before(token, await self.arevoked_at(token[api_settings.USER_ID_CLAIM]))
+
+    @staticmethod
+    def issued_before(token, revoked_at):
+        if not revoked_at:
+            return False
+        if 'issued_at' in token:
+            return token['issued_at'] < revoked_at
+        # iat хранится с точностью до секунды: токены, выданные в секунду отзыва, тоже отклоняются
+        return token.get('iat', 0) <= revoked_at
+
+
+revocations = RevocationCache()
+
+
+class UserRefreshToken(RefreshToken):
+    """
+    Refresh-токен с данными пользователя, которые копируются и в access-токен.
+
+    issued_at - время выпуска с долями секунды для сравнения с отметкой отзыва.
+    """
+
+    @classmethod
+    def for_user(cls, user):
+        token = super().for_user(user)
+        token['issued_at'] = time.time()
+        token['role'] = user.role
+        token['is_active'] = user.is_active
+        return token
+
+
+class CallboardTokenUser(TokenUser):
+    """Пользователь, собранный из утверждений токена без обращения к базе"""
+
+    @cached_property
+    def role(self):
+        return self.token.get('role', 'user')
+
+    @cached_property
+    def is_active(self):
+        return self.token.get('is_active', True)
+
+
+def check_active(token):
+    if not token.get('is_active', True):
+        raise AuthenticationFailed('Пользователь неактивен', code='user_inactive')
+
+
+def check_token(token):
+    """Проверка, что пользователь токена активен и токен не отозван"""
+    check_active(token)
+    if revocations.is_revoked(token):
+        raise InvalidToken('Токен отозван')
+
+
+async def acheck_token(token):
+    check_active(token)
+    if await revocations.ais_revoked(token):
+        raise InvalidToken('Токен отозван')
+
+
+class StatelessJWTAuthentication(JWTStatelessUserAuthentication):
+    """
+    Аутентификация по JWT без загрузки пользователя из базы.
+
+    request.user - CallboardTokenUser с id, role и is_active из токена.
+    Токены, выданные до смены роли, пароля, деактивации или удаления
+    пользователя, отклоняются по отметке в RevocationCache.
+    aauthenticate - вариант authenticate для асинхронных представлений.
+    """
+
+    def get_user(self, validated_token):
+        user = super().get_user(validated_token)
+        check_token(validated_token)
+        return user
+
+    async def aauthenticate(self, request):
+        header = self.get_header(request)
+        if header is None:
+            return None
+        raw_token = self.get_raw_token(header)
+        if raw_token is None:
+            return None
+        validated_token = self.get_validated_token(raw_token)
+        user = super().get_user(validated_token)
+        await acheck_token(validated_token)
+        return user, validated_token
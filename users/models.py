@@ -1,5 +1,11 @@
+import hashlib
+import secrets
+from datetime import timedelta
+
+from django.conf import settings
 from django.contrib.auth.models import AbstractUser
 from django.db import models
+from django.utils import timezone
 
 
 class User(AbstractUser):
@@ -61,6 +67,13 @@ class User(AbstractUser):
         blank=True,
         null=True,
     )
+    # Токены, выпущенные раньше, недействительны (см. users.authentication.RevocationCache)
+    tokens_valid_after = models.DateTimeField(
+        verbose_name='токены действительны после',
+        blank=True,
+        null=True,
+        editable=False,
+    )
 
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = []
@@ -69,7 +82,65 @@ class User(AbstractUser):
         db_table = 'users'
         verbose_name = 'Пользователь'
         verbose_name_plural = 'Пользователи'
+        # Сортировку обслуживает уникальный индекс email: email не повторяется, и role на порядок не влияет
         ordering = ('email', 'role',)
 
     def __str__(self):
         return f'{self.first_name} {self.last_name}, email - {self.email}, {self.role}'
+
+
+class PasswordResetTokenQuerySet(models.QuerySet):
+    def expired(self):
+        return self.filter(expires_at__lte=timezone.now())
+
+
+class PasswordResetToken(models.Model):
+    """
+    Токен сброса пароля.
+
+    В базе хранится только SHA-256 токена: уникальный индекс по хешу находит
+    токен одним запросом, а утечка таблицы не дает готовых ссылок сброса.
+    """
+
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='password_reset_tokens',
+        verbose_name='пользователь',
+    )
+    token_hash = models.CharField(max_length=64, unique=True, verbose_name='хеш токена')
+    expires_at = models.DateTimeField(db_index=True, verbose_name='действует до')
+
+    objects = PasswordResetTokenQuerySet.as_manager()
+
+    class Meta:
+        db_table = 'users_password_reset_tokens'
+        verbose_name = 'Токен сброса пароля'
+        verbose_name_plural = 'Токены сброса пароля'
+
+    @staticmethod
+    def make_hash(token):
+        return hashlib.sha256(token.encode()).hexdigest()
+
+    @classmethod
+    def issue(cls, user):
+        """Новый токен пользователя; возвращается исходное значение для ссылки"""
+        token = secrets.token_urlsafe(32)
+        cls.objects.create(
+            user=user,
+            token_hash=cls.make_hash(token),
+            expires_at=timezone.now() + timedelta(seconds=settings.PASSWORD_RESET_TIMEOUT),
+        )
+        return token
+
+    @classmethod
+    def resolve(cls, token):
+        """Действующий токен вместе с пользователем одним запросом или None"""
+        return (
+            cls.objects.select_related('user')
+            .filter(token_hash=cls.make_hash(token), expires_at__gt=timezone.now())
+            .first()
+        )
+
+    def __str__(self):
+        return f'{self.user_id}, до {self.expires_at}'
@@ -1,15 +1,64 @@
-from rest_framework.permissions import BasePermission
+from django.db.models import Q
+from rest_framework.permissions import AND, NOT, OR, BasePermission
 
 
 class IsAdmin(BasePermission):
     """Проверка на администратора"""
 
     def has_permission(self, request, view):
-        return request.user.role == "admin"
+        return getattr(request.user, "role", None) == "admin"
+
+    def queryset_condition(self, request, view):
+        return self.has_permission(request, view)
 
 
 class IsAuthor(BasePermission):
     """Проверка на автора объекта"""
 
     def has_object_permission(self, request, view, obj):
-        return obj.author == request.user
+        return obj.author_id == request.user.pk
+
+    def queryset_condition(self, request, view):
+        return Q(author_id=request.user.pk)
+
+
+def _and(left, right):
+    if left is False or right is False:
+        return False
+    if left is True:
+        return right
+    return left if right is True else left & right
+
+
+def _or(left, right):
+    if left is True or right is True:
+        return True
+    if left is False:
+        return right
+    return left if right is False else left | right
+
+
+def queryset_condition(permission, request, view):
+    """
+    Объектное разрешение в виде условия на queryset.
+
+    Возвращает True (доступны все объекты), False (ни одного) или Q.
+    Поддерживает разрешения с методом queryset_condition и их сочетания
+    через &, | и ~.
+    """
+    if isinstance(permission, AND):
+        return _and(queryset_condition(permission.op1, request, view), queryset_condition(permission.op2, request, view))
+    if isinstance(permission, OR):
+        return _or(queryset_condition(permission.op1, request, view), queryset_condition(permission.op2, request, view))
+    if isinstance(permission, NOT):
+        condition = queryset_condition(permission.op1, request, view)
+        return not condition if isinstance(condition, bool) else ~condition
+    return permission.queryset_condition(request, view)
+
+
+def permissions_condition(permissions, request, view):
+    """Условие, при котором объект проходит все разрешения из списка"""
+    condition = True
+    for permission in permissions:
+        condition = _and(condition, queryset_condition(permission, request, view))
+    return condition
@@ -1,6 +1,8 @@
 from django.contrib.auth.password_validation import validate_password
 from rest_framework import serializers
+from rest_framework_simplejwt.serializers import TokenRefreshSerializer
 
+from users.authentication import check_token, UserRefreshToken
 from users.models import User
 
 
@@ -33,8 +35,9 @@ class PasswordResetRequestSerializer(serializers.ModelSerializer):
         fields = ["email"]
 
     def validate(self, data):
-        email = data["email"]
-        if not User.objects.filter(email=email).exists():
+        # Пользователь нужен и представлению, поэтому загружается здесь же вместо exists()
+        data["user"] = User.objects.filter(email=data["email"]).first()
+        if data["user"] is None:
             raise serializers.ValidationError({"email": "Указанный email не найден."})
         return data
 
@@ -47,3 +50,13 @@ class PasswordResetSerializer(serializers.Serializer):
     class Meta:
         model = User
         fields = ["password"]
+
+
+class UserTokenRefreshSerializer(TokenRefreshSerializer):
+    """Обновление access-токена с проверкой отзыва refresh-токена"""
+
+    token_class = UserRefreshToken
+
+    def validate(self, attrs):
+        check_token(self.token_class(attrs["refresh"]))
+        return super().validate(attrs)
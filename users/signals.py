@@ -0,0 +1,36 @@
+from django.db.models.signals import post_delete, post_init, post_save
+from django.dispatch import receiver
+
+from users.authentication import revocations
+from users.models import User
+
+# Поля, от которых зависят права владельца токена
+TOKEN_FIELDS = ('role', 'is_active', 'password')
+
+
+def token_state(user):
+    return tuple(user.__dict__.get(field) for field in TOKEN_FIELDS)
+
+
+@receiver(post_init, sender=User)
+def remember_token_state(sender, instance, **kwargs):
+    instance._token_state = token_state(instance)
+
+
+@receiver(post_save, sender=User)
+def revoke_changed_user_tokens(sender, instance, created, **kwargs):
+    """
+    Отзыв токенов при смене роли, пароля или деактивации.
+
+    Изменения через QuerySet.update() сигналов не отправляют,
+    для них нужно вызывать revocations.revoke() явно.
+    """
+    state = token_state(instance)
+    if not created and state != instance._token_state:
+        instance.tokens_valid_after = revocations.revoke(instance.pk)
+    instance._token_state = state
+
+
+@receiver(post_delete, sender=User)
+def revoke_deleted_user_tokens(sender, instance, **kwargs):
+    revocations.revoke(instance.pk)
@@ -0,0 +1,93 @@
+from contextlib import contextmanager
+from contextvars import ContextVar
+from smtplib import SMTPException
+
+from celery import shared_task
+from celery.utils.time import get_exponential_backoff_interval
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.db.models import Q
+
+from config.housekeeping import run_in_batches
+from users.models import PasswordResetToken, User
+
+# Ошибки, после которых отправку имеет смысл повторить
+RETRY_EXCEPTIONS = (SMTPException, OSError)
+
+_pending_emails = ContextVar('pending_emails', default=None)
+
+
+@shared_task(bind=True, max_retries=5, acks_late=True)
+def send_emails(self, messages):
+    """
+    Отправка писем одним SMTP-соединением.
+
+    messages - список словарей с subject, body и to. При ошибке задача
+    повторяется с экспоненциальной задержкой только для неотправленных писем.
+    """
+    sent = 0
+    try:
+        # Соединение открывается внутри try: недоступный сервер тоже приводит к повтору
+        with get_connection() as connection:
+            for message in messages:
+                EmailMessage(
+                    subject=message['subject'],
+                    body=message['body'],
+                    from_email=message.get('from_email'),
+                    to=message['to'],
+                    connection=connection,
+                ).send()
+                sent += 1
+    except RETRY_EXCEPTIONS as exc:
+        countdown = get_exponential_backoff_interval(
+            factor=settings.EMAIL_RETRY_BACKOFF,
+            retries=self.request.retries,
+            maximum=settings.EMAIL_RETRY_BACKOFF_MAX,
+            full_jitter=True,
+        )
+        raise self.retry(args=(messages[sent:],), exc=exc, countdown=countdown)
+
+
+@contextmanager
+def batched_emails():
+    """
+    Накопление писем send_email_later() внутри блока.
+
+    При выходе без исключения все письма ставятся в очередь одной задачей
+    после коммита и отправляются через одно SMTP-соединение.
+    """
+    pending = []
+    token = _pending_emails.set(pending)
+    try:
+        yield
+    finally:
+        _pending_emails.reset(token)
+    if pending:
+        transaction.on_commit(lambda: send_emails.delay(pending))
+
+
+def send_email_later(subject, body, to):
+    """Постановка письма в очередь после коммита текущей транзакции, в batched_emails() - вместе с остальными"""
+    message = {'subject': subject, 'body': body, 'to': list(to)}
+    pending = _pending_emails.get()
+    if pending is not None:
+        pending.append(message)
+        return
+    transaction.on_commit(lambda: send_emails.delay([message]))
+
+
+@shared_task
+def delete_expired_reset_tokens():
+    """
+    Удаление просроченных токенов сброса пароля пачками по диапазонам pk.
+
+    Заодно очищаются устаревшие поля token и uid пользователя: ссылки сброса
+    проверяются только по PasswordResetToken, и эти значения больше не действуют.
+    """
+    metrics = run_in_batches('delete_expired_reset_tokens', PasswordResetToken.objects.expired())
+    legacy = User.objects.filter(Q(token__isnull=False) | Q(uid__isnull=False))
+    metrics['legacy_tokens'] = run_in_batches(
+        'clear_legacy_reset_tokens', legacy, lambda batch: batch.update(token=None, uid=None),
+    )['rows']
+    return metrics
@@ -1,7 +1,22 @@
+from smtplib import SMTPException
+from unittest import mock
+
+from django.core import mail
+from django.core.cache import cache
+from django.core.mail import EmailMessage
+from django.core.mail.backends import locmem
+from django.test import override_settings
 from django.urls import reverse
+from django.utils import timezone
+from django.utils.encoding import force_bytes
+from django.utils.http import urlsafe_base64_encode
 from rest_framework import status
 from rest_framework.test import APITestCase
 
+from users.authentication import revocations
+from users.models import PasswordResetToken, User
+from users.tasks import batched_emails, delete_expired_reset_tokens, send_email_later, send_emails
+
 
 class TestRegisterUser(APITestCase):
     """Проверка регистрации пользователя"""
@@ -19,3 +34,178 @@ class TestRegisterUser(APITestCase):
         self.assertEqual(data['role'], 'user')
         self.assertEqual(data['uid'], None)
         self.assertEqual(data['token'], None)
+
+
+class StatelessJWTTestCase(APITestCase):
+    """Аутентификация по данным токена без запроса пользователя"""
+
+    password = "test123456"
+
+    def setUp(self):
+        cache.clear()
+        revocations.clear()
+        self.user = User.objects.create(email="admin@example.ru", role="admin")
+        self.user.set_password(self.password)
+        self.user.save()
+        self.url = reverse('callboard:object_cache_stats')
+
+    def login(self):
+        response = self.client.post(
+            reverse('users:login'), {"email": self.user.email, "password": self.password}, format='json'
+        )
+        return response.json()
+
+    def authorize(self, access):
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {access}')
+
+    def test_no_queries_for_authentication(self):
+        self.authorize(self.login()['access'])
+        revocations.clear()
+        # Отметка отзыва читается из базы один раз и ttl секунд берется из памяти процесса
+        with self.assertNumQueries(1):
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        with self.assertNumQueries(0):
+            self.client.get(self.url)
+
+    def test_tokens_revoked_on_role_change(self):
+        tokens = self.login()
+        self.user.role = "user"
+        self.user.save()
+
+        self.authorize(tokens['access'])
+        self.assertEqual(self.client.get(self.url).status_code, status.HTTP_401_UNAUTHORIZED)
+        response = self.client.post(reverse('users:token_refresh'), {"refresh": tokens['refresh']}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_tokens_revoked_on_deactivation(self):
+        self.authorize(self.login()['access'])
+        self.user.is_active = False
+        self.user.save()
+        self.assertEqual(self.client.get(self.url).status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_revocation_stored_in_database(self):
+        """Отзыв виден процессу с пустой памятью и переживает очистку кеша и повторный save()"""
+        tokens = self.login()
+        self.user.role = "user"
+        self.user.save()
+        self.user.phone_num = "79990000000"
+        self.user.save()
+        for cache_enabled in (False, True):
+            with self.settings(CACHE_ENABLED=cache_enabled):
+                revocations.clear()
+                cache.clear()
+                self.authorize(tokens['access'])
+                self.assertEqual(self.client.get(self.url).status_code, status.HTTP_401_UNAUTHORIZED)
+
+        self.authorize(self.login()['access'])
+        self.assertEqual(self.client.get(self.url).status_code, status.HTTP_403_FORBIDDEN)
+
+    def test_deleted_user_tokens_revoked(self):
+        self.authorize(self.login()['access'])
+        self.user.delete()
+        revocations.clear()
+        self.assertEqual(self.client.get(self.url).status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_unrelated_changes_keep_tokens(self):
+        self.authorize(self.login()['access'])
+        self.user.phone_num = "79990000000"
+        self.user.save()
+        self.assertEqual(self.client.get(self.url).status_code, status.HTTP_200_OK)
+
+
+@override_settings(CELERY_TASK_ALWAYS_EAGER=True, EMAIL_RETRY_BACKOFF=0)
+class PasswordResetEmailTestCase(APITestCase):
+    """Отправка письма для сброса пароля через Celery"""
+
+    def setUp(self):
+        self.user = User.objects.create(email="test@example.ru")
+
+    def test_email_sent_after_commit(self):
+        with self.captureOnCommitCallbacks() as callbacks:
+            response = self.client.post(reverse('users:password_reset'), {"email": self.user.email}, format='json')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(mail.outbox), 0)
+
+        for callback in callbacks:
+            callback()
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertEqual(mail.outbox[0].to, [self.user.email])
+
+    def test_retry_sends_only_remaining_messages(self):
+        messages = [{'subject': 'Тема', 'body': str(i), 'to': [self.user.email]} for i in range(3)]
+        send = EmailMessage.send
+        failures = [SMTPException('Сервер недоступен')]
+
+        def flaky_send(email, *args, **kwargs):
+            if email.body == '1' and failures:
+                raise failures.pop()
+            return send(email, *args, **kwargs)
+
+        # Локальное выполнение: повтор запускается сразу, без задержки
+        with mock.patch.object(EmailMessage, 'send', flaky_send):
+            send_emails.apply(args=(messages,), throw=False)
+        self.assertEqual([email.body for email in mail.outbox], ['0', '1', '2'])
+
+    def test_batched_emails_share_task_and_connection(self):
+        with mock.patch.object(send_emails, 'delay', wraps=send_emails.delay) as delay, \
+                mock.patch.object(locmem.EmailBackend, 'open', autospec=True) as open_connection:
+            with self.captureOnCommitCallbacks(execute=True), batched_emails():
+                for i in range(3):
+                    send_email_later('Тема', str(i), [self.user.email])
+                self.assertEqual(len(mail.outbox), 0)
+        delay.assert_called_once()
+        open_connection.assert_called_once()
+        self.assertEqual([email.body for email in mail.outbox], ['0', '1', '2'])
+
+    def test_retry_on_connection_failure(self):
+        messages = [{'subject': 'Тема', 'body': str(i), 'to': [self.user.email]} for i in range(2)]
+        failures = [ConnectionRefusedError('Сервер недоступен')]
+
+        def flaky_open(connection):
+            if failures:
+                raise failures.pop()
+
+        with mock.patch.object(locmem.EmailBackend, 'open', flaky_open):
+            result = send_emails.apply(args=(messages,), throw=False)
+        self.assertTrue(result.successful())
+        self.assertEqual([email.body for email in mail.outbox], ['0', '1'])
+
+
+class PasswordResetTokenTestCase(APITestCase):
+    """Сброс пароля по одноразовому токену"""
+
+    def setUp(self):
+        self.user = User.objects.create(email="test@example.ru")
+        self.token = PasswordResetToken.issue(self.user)
+        self.uid = urlsafe_base64_encode(force_bytes(self.user.pk))
+        self.data = {"new_password": "New-password-123"}
+
+    def confirm(self, token=None):
+        url = reverse('users:reset_password_confirm', args=(self.uid, token or self.token))
+        return self.client.post(url, self.data, format='json')
+
+    def test_request_issues_hashed_token(self):
+        with self.assertNumQueries(2):
+            self.client.post(reverse('users:password_reset'), {"email": self.user.email}, format='json')
+        self.assertEqual(self.user.password_reset_tokens.count(), 2)
+        self.assertFalse(PasswordResetToken.objects.filter(token_hash=self.token).exists())
+
+    def test_reset_password(self):
+        # Поиск токена с пользователем, сохранение пароля, отзыв JWT, удаление токенов
+        with self.assertNumQueries(4):
+            response = self.confirm()
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.user.refresh_from_db()
+        self.assertTrue(self.user.check_password(self.data["new_password"]))
+
+        self.assertEqual(self.confirm().status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_expired_token(self):
+        PasswordResetToken.objects.update(expires_at=timezone.now())
+        self.assertEqual(self.confirm().status_code, status.HTTP_400_BAD_REQUEST)
+        User.objects.filter(pk=self.user.pk).update(token='token', uid='uid')
+        metrics = delete_expired_reset_tokens()
+        self.assertEqual((metrics['rows'], metrics['legacy_tokens']), (1, 1))
+        self.assertFalse(PasswordResetToken.objects.exists())
+        self.assertFalse(User.objects.filter(token__isnull=False).exists())
@@ -1,18 +1,16 @@
-from django.contrib.auth import get_user_model, authenticate
-from django.contrib.auth.tokens import PasswordResetTokenGenerator
+from django.contrib.auth import authenticate
 from django.contrib.sites.shortcuts import get_current_site
-from django.core.mail import send_mail
 from django.utils.encoding import force_bytes
 from django.utils.http import urlsafe_base64_encode
 from rest_framework.generics import GenericAPIView, CreateAPIView
 from rest_framework.permissions import AllowAny
 from rest_framework.response import Response
-from rest_framework_simplejwt.tokens import RefreshToken
 from rest_framework_simplejwt.views import TokenObtainPairView
 
-from config.settings import EMAIL_HOST_USER
-from users.models import User
+from users.authentication import UserRefreshToken
+from users.models import PasswordResetToken, User
 from users.serializers import UserSerializer, PasswordResetRequestSerializer, PasswordResetSerializer
+from users.tasks import send_email_later
 
 
 class UserCreateAPIView(CreateAPIView):
@@ -36,7 +34,7 @@ class CustomTokenObtainPairView(TokenObtainPairView):
 
         user = authenticate(username=username, password=password)
         if user is not None:
-            refresh = RefreshToken.for_user(user)
+            refresh = UserRefreshToken.for_user(user)
 
             return Response(
                 {
@@ -57,25 +55,19 @@ class PasswordResetRequestView(GenericAPIView):
     def post(self, request):
         serializer = self.get_serializer(data=request.data)
         if serializer.is_valid(raise_exception=True):
-            email = serializer.data["email"]
+            user = serializer.validated_data["user"]
 
-            user = get_user_model().objects.get(email=email)
-            token = PasswordResetTokenGenerator().make_token(user)
-            uid = urlsafe_base64_encode(force_bytes(user.token))
-            user.token = token
-            user.uid = uid
-            user.save()
+            token = PasswordResetToken.issue(user)
+            uid = urlsafe_base64_encode(force_bytes(user.pk))
             url = get_current_site(request)
             confirm_url = "users/reset_password_confirm"
-            # Отправляем письмо со ссылкой для сброса пароля
-            send_mail(
+            # Письмо со ссылкой для сброса пароля отправляет Celery после коммита
+            send_email_later(
                 subject="Запрос сброса пароля с сайта {}".format(url),
-                message="Для сброса пароля перейдите по ссылке: http://{}/{}/{}/{}/".format(
+                body="Для сброса пароля перейдите по ссылке: http://{}/{}/{}/{}/".format(
                     url, confirm_url, uid, token
                 ),
-                from_email=EMAIL_HOST_USER,
-                recipient_list=[email],
-                fail_silently=False,
+                to=[user.email],
             )
 
             return Response(
@@ -97,18 +89,16 @@ class PasswordResetView(GenericAPIView):
     def post(self, request, *args, **kwargs):
         serializer = self.get_serializer(data=request.data)
         if serializer.is_valid(raise_exception=True):
-            token = self.kwargs.get("token")
-            object_reset = User.objects.filter(token=token).first()
-            if not object_reset:
+            # Токен и пользователь находятся одним запросом по уникальному хешу
+            reset_token = PasswordResetToken.resolve(self.kwargs.get("token"))
+            if not reset_token:
                 return Response("Неверный токен", status=400)
-            uid = self.kwargs.get("uid")
-            user = User.objects.filter(uid=uid).first()
-            if user:
-                password = request.data["new_password"]
-                user.set_password(password)
-                user.token = None
-                user.uid = None
-                user.save()
-                return Response("Пароль успешно обновлен")
-            else:
+            user = reset_token.user
+            if self.kwargs.get("uid") != urlsafe_base64_encode(force_bytes(user.pk)):
                 return Response("Пользователь не найден")
+            password = request.data["new_password"]
+            user.set_password(password)
+            user.save(update_fields=["password"])
+            # Ссылка одноразовая: остальные токены пользователя тоже перестают действовать
+            user.password_reset_tokens.all().delete()
+            return Response("Пароль успешно обновлен")